@@ -0,0 +1,249 @@
+#!/usr/bin/python
+"""
+Persistent cache of bare git mirrors.
+
+Every repository url has single bare mirror in cache directory. Mirror is cloned once and then
+refreshed by incremental fetch. Runs get cheap worktrees of mirror instead of own clones
+or read needed files straight from git objects of mirror. Runs without cache read files from
+shallow blobless fetch of single reference instead of whole mirror.
+Mirror is locked by flock while it is changed, so many jobs may share cache. Lock files are
+never removed, so all jobs always lock the same file of mirror. Least recently used mirrors
+which are neither locked nor checked out in existing worktrees are evicted when cache holds
+too many of them.
+"""
+import contextlib
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from git import Repo
+from git.exc import GitCommandError, InvalidGitRepositoryError, NoSuchPathError
+
+
+class GitMirrorException(Exception):
+    """Git mirror exception class"""
+    pass
+
+
+class GitMirrorCache(object):
+    """
+    GitMirrorCache class keeps bare mirrors of git repositories and creates worktrees of them
+    """
+    MIRROR_SUFFIX = '.git'
+    LOCK_SUFFIX = '.lock'
+    CLONE_SUFFIX = '.clone'
+
+    def __init__(self, cache_dir, max_mirrors=10):
+        """
+        :param cache_dir -- directory of mirrors, it is created when it does not exist
+        :param max_mirrors -- maximal amount of kept mirrors
+        """
+        self.cache_dir = cache_dir
+        self.max_mirrors = max_mirrors
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_mirror_path(self, git_repo):
+        """
+        Method for getting path of mirror of given repository
+
+        :param git_repo -- git repository url
+
+        :returns Path to bare mirror
+        """
+        git_repo = git_repo.rstrip('/')
+        repo_name = os.path.basename(git_repo)
+        if repo_name.endswith(self.MIRROR_SUFFIX):
+            repo_name = repo_name[:-len(self.MIRROR_SUFFIX)]
+        url_hash = hashlib.sha1(git_repo.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, "{0}-{1}{2}".format(repo_name, url_hash,
+                                                                self.MIRROR_SUFFIX))
+
+    @contextlib.contextmanager
+    def lock(self, mirror_path, blocking=True):
+        """
+        Context manager which holds exclusive lock of mirror
+        Modification time of lock file marks last use of mirror.
+
+        :param mirror_path -- path to bare mirror
+        :param blocking -- wait for lock, otherwise BlockingIOError is raised when it is held
+
+        :yield Nothing
+        """
+        with open(mirror_path + self.LOCK_SUFFIX, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def update(self, git_repo):
+        """
+        Method for creating or refreshing mirror of given repository
+
+        :param git_repo -- git repository url
+
+        :returns Path to bare mirror
+        """
+        mirror_path = self.get_mirror_path(git_repo)
+        with self.lock(mirror_path):
+            self.update_locked(git_repo, mirror_path)
+        self.evict()
+        return mirror_path
+
+    def update_locked(self, git_repo, mirror_path):
+        """
+        Method for creating or refreshing mirror, mirror lock has to be held
+        Mirror is cloned aside and moved into place once complete, so interrupted clone
+        never leaves partial mirror. Broken mirror is cloned again.
+
+        :param git_repo -- git repository url
+        :param mirror_path -- path to bare mirror
+        """
+        os.utime(mirror_path + self.LOCK_SUFFIX)
+        try:
+            if os.path.isdir(mirror_path):
+                try:
+                    mirror = Repo(mirror_path)
+                except (InvalidGitRepositoryError, NoSuchPathError):
+                    logging.warning("Removing broken git mirror '{}'".format(mirror_path))
+                    shutil.rmtree(mirror_path)
+                else:
+                    logging.debug("Fetching changes of git mirror '{}'".format(mirror_path))
+                    mirror.git.fetch('--prune', 'origin')
+                    return
+            logging.debug("Creating git mirror '{}'".format(mirror_path))
+            clone_path = mirror_path + self.CLONE_SUFFIX
+            shutil.rmtree(clone_path, ignore_errors=True)  # Left by interrupted clone
+            Repo.clone_from(git_repo, clone_path, mirror=True)
+            os.rename(clone_path, mirror_path)
+        except GitCommandError as detail:
+            raise GitMirrorException("Unable to update mirror of git repository '{0}': "
+                                     "{1}".format(git_repo, detail))
+
+    def checkout(self, git_repo, destination, ref='HEAD'):
+        """
+        Method for creating worktree of refreshed mirror
+        Existing checkout in destination (e.g. of previous run) is replaced. Mirror is not
+        evicted while the worktree directory exists.
+
+        :param git_repo -- git repository url
+        :param destination -- worktree directory
+        :param ref -- checked out reference
+
+        :returns Path to bare mirror
+        """
+        mirror_path = self.get_mirror_path(git_repo)
+        with self.lock(mirror_path):
+            self.update_locked(git_repo, mirror_path)
+            mirror = Repo(mirror_path)
+            if os.path.exists(destination):
+                if not os.path.exists(os.path.join(destination, '.git')):
+                    raise GitMirrorException("Directory '{}' exists and it is not git "
+                                             "checkout".format(destination))
+                shutil.rmtree(destination)
+            try:
+                mirror.git.worktree('prune')
+                mirror.git.worktree('add', '--detach', os.path.abspath(destination), ref)
+            except GitCommandError as detail:
+                raise GitMirrorException("Unable to create worktree of git repository '{0}': "
+                                         "{1}".format(git_repo, detail))
+        self.evict()
+        return mirror_path
+
+    def read_files(self, git_repo, paths, ref='HEAD'):
+        """
+        Method for reading files of refreshed mirror straight from git objects
+        Nothing is checked out, only tree entries on file paths and file blobs are read,
+        so lookup cost does not depend on repository size.
+
+        :param git_repo -- git repository url
+        :param paths -- list of file paths relative to repository
+        :param ref -- reference of read files
+
+        :returns Dictionary where keys are paths and values are file contents
+        """
+        mirror_path = self.get_mirror_path(git_repo)
+        contents = dict()
+        with self.lock(mirror_path):
+            self.update_locked(git_repo, mirror_path)
+            mirror = Repo(mirror_path)
+            for path in paths:
+                try:
+                    contents[path] = mirror.git.cat_file('blob', '{0}:{1}'.format(ref, path),
+                                                         strip_newline_in_stdout=False)
+                except GitCommandError as detail:
+                    raise GitMirrorException("Unable to read file '{0}' of git repository '{1}' "
+                                             "at '{2}': {3}".format(path, git_repo, ref, detail))
+        self.evict()
+        return contents
+
+    def evict(self):
+        """
+        Method for removing least recently used mirrors which are not used
+        Lock file of evicted mirror is kept, jobs waiting for it would lock other file otherwise.
+        """
+        lock_paths = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                      if name.endswith(self.MIRROR_SUFFIX + self.LOCK_SUFFIX) and
+                      os.path.isdir(os.path.join(self.cache_dir, name[:-len(self.LOCK_SUFFIX)]))]
+        lock_paths.sort(key=os.path.getmtime, reverse=True)
+        for lock_path in lock_paths[self.max_mirrors:]:
+            mirror_path = lock_path[:-len(self.LOCK_SUFFIX)]
+            try:
+                with self.lock(mirror_path, blocking=False):
+                    if not os.path.isdir(mirror_path) or self.has_worktrees(mirror_path):
+                        continue  # Evicted by other job or checked out by running job
+                    logging.debug("Evicting git mirror '{}'".format(mirror_path))
+                    shutil.rmtree(mirror_path, ignore_errors=True)
+            except BlockingIOError:
+                continue  # Mirror is used right now
+
+    @staticmethod
+    def has_worktrees(mirror_path):
+        """
+        Method for checking whether mirror has worktrees, mirror lock has to be held
+        Worktrees whose directories were removed are pruned first.
+
+        :param mirror_path -- path to bare mirror
+
+        :returns Boolean
+        """
+        try:
+            Repo(mirror_path).git.worktree('prune')
+        except (GitCommandError, InvalidGitRepositoryError, NoSuchPathError):
+            return False  # Broken mirror has no usable worktrees
+        worktrees_path = os.path.join(mirror_path, 'worktrees')
+        return os.path.isdir(worktrees_path) and bool(os.listdir(worktrees_path))
+
+
+def read_remote_files(git_repo, paths, ref='HEAD'):
+    """
+    Function for reading files of repository at reference without mirror
+    Only single commit of reference is fetched without history and blobs, blobs of read files
+    are fetched lazily by cat-file.
+
+    :param git_repo -- git repository url
+    :param paths -- list of file paths relative to repository
+    :param ref -- fetched reference (e.g. HEAD, branch, tag or commit)
+
+    :returns Dictionary where keys are paths and values are file contents
+    """
+    contents = dict()
+    with tempfile.TemporaryDirectory() as repo_path:
+        repo = Repo.init(repo_path, bare=True)
+        try:
+            repo.git.remote('add', 'origin', git_repo)
+            repo.git.fetch('--depth', '1', '--filter=blob:none', 'origin', ref)
+        except GitCommandError as detail:
+            raise GitMirrorException("Unable to fetch '{0}' of git repository '{1}': "
+                                     "{2}".format(ref, git_repo, detail))
+        for path in paths:
+            try:
+                contents[path] = repo.git.cat_file('blob', 'FETCH_HEAD:{}'.format(path),
+                                                   strip_newline_in_stdout=False)
+            except GitCommandError as detail:
+                raise GitMirrorException("Unable to read file '{0}' of git repository '{1}' "
+                                         "at '{2}': {3}".format(path, git_repo, ref, detail))
+    return contents
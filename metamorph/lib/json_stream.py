@@ -0,0 +1,246 @@
+#!/usr/bin/python
+"""
+Incremental json decoding of (possibly very large) CI messages.
+
+Input is consumed in chunks, so neither the raw text nor its cleaned copy needs to be kept in
+memory as a whole. Every value which is complete in the read buffer is decoded by the C json
+decoder, containers spanning chunk boundaries are walked member by member.
+"""
+import json
+import os
+import re
+import sys
+
+try:
+    from json import JSONDecodeError
+except ImportError:  # Python 3.4 raises plain ValueError
+    JSONDecodeError = ValueError
+
+CHUNK_SIZE = 65536
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_START = '-0123456789'
+NUMBER_CHARS = re.compile(r'[-+.eE0-9]*')
+
+
+class StreamingJSONDecoder(object):
+    """
+    StreamingJSONDecoder class decodes single json document from iterable of text chunks
+    """
+
+    def __init__(self, chunks, erase_newlines=False):
+        if erase_newlines:
+            chunks = iter_stripped_chunks(chunks)
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def decode(self):
+        """
+        Method for decoding whole json document
+
+        :returns Decoded json document
+        """
+        value = self.parse_value()
+        self.skip_whitespace()
+        if self.pos < len(self.buffer):
+            raise JSONDecodeError("Extra data", self.buffer, self.pos)
+        return value
+
+    def fill(self):
+        """
+        Method for reading next chunks into buffer. Consumed part of buffer is dropped.
+        Buffer is grown at least by its current size so long tokens are read in linear time.
+
+        :returns Boolean -- False when there is nothing more to read
+        """
+        new_chunks = []
+        new_size = 0
+        wanted_size = len(self.buffer) - self.pos
+        for chunk in self.chunks:
+            new_chunks.append(chunk)
+            new_size += len(chunk)
+            if new_size >= wanted_size:
+                break
+        else:
+            self.eof = True
+        if not new_chunks:
+            return False
+        self.buffer = self.buffer[self.pos:] + ''.join(new_chunks)
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        """Method for skipping whitespace, more data are read when needed"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return
+
+    def next_char(self):
+        """
+        Method for getting next non-whitespace character without consuming it
+
+        :returns Single character
+        """
+        self.skip_whitespace()
+        if self.pos >= len(self.buffer):
+            raise JSONDecodeError("Expecting value", self.buffer, self.pos)
+        return self.buffer[self.pos]
+
+    def parse_value(self):
+        """
+        Method for decoding value at current position
+
+        :returns Decoded value
+        """
+        char = self.next_char()
+        while True:
+            # Numbers have no closing delimiter, so number at buffer end may continue
+            if self.eof or char not in NUMBER_START or \
+                    NUMBER_CHARS.match(self.buffer, self.pos).end() < len(self.buffer):
+                try:
+                    value, self.pos = self.decoder.raw_decode(self.buffer, self.pos)
+                    return value
+                except ValueError as detail:
+                    if self.eof:
+                        raise detail
+            # Value is not complete in buffer. Containers are decoded member by member,
+            # scalars just need more data.
+            if char == '{':
+                return self.parse_object()
+            elif char == '[':
+                return self.parse_array()
+            self.fill()
+
+    def parse_object(self):
+        """
+        Method for decoding json object member by member
+
+        :returns Dictionary
+        """
+        self.pos += 1
+        result = {}
+        if self.next_char() == '}':
+            self.pos += 1
+            return result
+        while True:
+            if self.next_char() != '"':
+                raise JSONDecodeError("Expecting property name enclosed in double quotes",
+                                      self.buffer, self.pos)
+            key = self.parse_value()
+            if self.next_char() != ':':
+                raise JSONDecodeError("Expecting ':' delimiter", self.buffer, self.pos)
+            self.pos += 1
+            result[key] = self.parse_value()
+            char = self.next_char()
+            self.pos += 1
+            if char == '}':
+                return result
+            elif char != ',':
+                raise JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos - 1)
+
+    def parse_array(self):
+        """
+        Method for decoding json array item by item
+
+        :returns List
+        """
+        self.pos += 1
+        result = []
+        if self.next_char() == ']':
+            self.pos += 1
+            return result
+        while True:
+            result.append(self.parse_value())
+            char = self.next_char()
+            self.pos += 1
+            if char == ']':
+                return result
+            elif char != ',':
+                raise JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos - 1)
+
+
+def iter_text_chunks(text, chunk_size=CHUNK_SIZE):
+    """
+    Generator of chunks of given string
+
+    :param text -- input string
+    :param chunk_size -- size of single chunk
+    """
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+def iter_stripped_chunks(chunks):
+    """
+    Generator of chunks without escaped newlines (backslash followed by 'n')
+    Escaped newline split by chunk boundary is erased too, so result is the same as erasing
+    them from whole text at once.
+
+    :param chunks -- iterable of strings
+    """
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        carry = ''
+        if text.endswith('\\'):
+            text, carry = text[:-1], '\\'
+        yield text.replace('\\n', '')
+    if carry:
+        yield carry
+
+
+def iter_file_chunks(file_object, chunk_size=CHUNK_SIZE):
+    """
+    Generator of chunks read from given file object
+
+    :param file_object -- opened text file
+    :param chunk_size -- size of single chunk
+    """
+    chunk = file_object.read(chunk_size)
+    while chunk:
+        yield chunk
+        chunk = file_object.read(chunk_size)
+
+
+def load_chunks(chunks, erase_newlines=False):
+    """
+    Function for decoding json document from iterable of text chunks
+
+    :param chunks -- iterable of strings
+    :param erase_newlines -- erase escaped newlines from text before decoding. CI messages may
+                             contain them between tokens, which will cause parsing errors
+                             otherwise.
+
+    :returns Decoded json document
+    """
+    return StreamingJSONDecoder(chunks, erase_newlines).decode()
+
+
+def load_env_variable(env_variable, erase_newlines=True):
+    """
+    Function for decoding json document stored in environmental variable
+
+    :param env_variable -- name of environmental variable
+    :param erase_newlines -- erase escaped newlines from text before decoding
+
+    :returns Decoded json document
+    """
+    return load_chunks(iter_text_chunks(os.environ[env_variable]), erase_newlines)
+
+
+def load_file(path, erase_newlines=True):
+    """
+    Function for decoding json document stored in file
+
+    :param path -- path to json file, '-' reads standard input
+    :param erase_newlines -- erase escaped newlines from text before decoding
+
+    :returns Decoded json document
+    """
+    if path == '-':
+        return load_chunks(iter_file_chunks(sys.stdin), erase_newlines)
+    with open(path, 'r') as json_file:
+        return load_chunks(iter_file_chunks(json_file), erase_newlines)
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+"""
+Append-only archive of CI messages captured by messagehub.
+
+Archive directory contains two files:
+  messages.data  -- one json encoded message per line, records are only appended
+  messages.index -- one line per record: offset, length, nvr and message-id separated by tab
+
+Data file is read through mmap, so lookup by nvr or message-id parses only matching records.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+
+from metamorph.lib.nvr import NVR
+
+DATA_FILE = 'messages.data'
+INDEX_FILE = 'messages.index'
+
+
+class MessageArchiveException(Exception):
+    """Message archive exception class"""
+    pass
+
+
+class MessageArchive(object):
+    """
+    MessageArchive class stores CI messages and finds them by nvr or message-id
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.data_path = os.path.join(archive_dir, DATA_FILE)
+        self.index_path = os.path.join(archive_dir, INDEX_FILE)
+        self.nvr_index = {}
+        self.message_id_index = {}
+        self.index_offset = 0
+        self.data_file = None
+        self.data_map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        """Method for releasing memory map and data file"""
+        if self.data_map is not None:
+            self.data_map.close()
+            self.data_map = None
+        if self.data_file is not None:
+            self.data_file.close()
+            self.data_file = None
+
+    def append(self, ci_message):
+        """
+        Method for appending CI message into archive
+
+        :param ci_message -- CI message dictionary with 'header' and 'message' keys
+
+        :returns Tuple of offset and length of stored record
+        """
+        os.makedirs(self.archive_dir, exist_ok=True)
+        record = json.dumps(ci_message, separators=(',', ':')).encode('utf-8') + b'\n'
+        header = ci_message.get('header', {})
+        nvr = self.get_message_nvr(header)
+        message_id = header.get('message-id', '')
+        # Index file lock serializes appends of concurrent writers
+        with open(self.index_path, 'a') as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                with open(self.data_path, 'ab') as data_file:
+                    offset = data_file.seek(0, os.SEEK_END)
+                    data_file.write(record)
+                    data_file.flush()
+                    os.fsync(data_file.fileno())
+                # Index line is written after data, so it never points to missing record
+                index_file.write("{0}\t{1}\t{2}\t{3}\n".format(offset, len(record),
+                                                               nvr, message_id))
+                index_file.flush()
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+        return offset, len(record)
+
+    def find_by_nvr(self, nvr):
+        """
+        Method for finding all archived CI messages of given nvr
+
+        :param nvr -- component in name-version-release format
+
+        :returns List of CI messages ordered by arrival
+        """
+        self.load_index()
+        return [self.read_record(offset, length) for offset, length in self.nvr_index.get(nvr, [])]
+
+    def find_by_message_id(self, message_id):
+        """
+        Method for finding archived CI message by its message-id
+
+        :param message_id -- message bus message-id
+
+        :returns CI message or None when message is not archived
+        """
+        self.load_index()
+        location = self.message_id_index.get(message_id)
+        if location is None:
+            return None
+        return self.read_record(*location)
+
+    def load_index(self):
+        """Method for loading index lines appended since last load"""
+        if not os.path.isfile(self.index_path):
+            return
+        with open(self.index_path, 'rb') as index_file:
+            index_file.seek(self.index_offset)
+            for line in iter(index_file.readline, b''):
+                if not line.endswith(b'\n'):
+                    break  # Line is being written right now
+                self.index_offset += len(line)
+                offset, length, nvr, message_id = line.decode('utf-8').rstrip('\n').split('\t')
+                location = (int(offset), int(length))
+                if nvr:
+                    self.nvr_index.setdefault(nvr, []).append(location)
+                if message_id:
+                    self.message_id_index[message_id] = location
+
+    def read_record(self, offset, length):
+        """
+        Method for reading single record from memory mapped data file
+
+        :param offset -- record offset in data file
+        :param length -- record length
+
+        :returns CI message
+        """
+        if self.data_map is None or offset + length > len(self.data_map):
+            self.map_data_file()
+        if self.data_map is None or offset + length > len(self.data_map):
+            raise MessageArchiveException("Archive index points behind end of data file "
+                                          "'{}'".format(self.data_path))
+        return json.loads(self.data_map[offset:offset + length].decode('utf-8'))
+
+    def map_data_file(self):
+        """Method for (re)mapping data file, it is needed after data file grows"""
+        self.close()
+        self.data_file = open(self.data_path, 'rb')
+        if os.fstat(self.data_file.fileno()).st_size:
+            self.data_map = mmap.mmap(self.data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            logging.debug("Archive data file '{}' is empty".format(self.data_path))
+
+    @staticmethod
+    def get_message_nvr(header):
+        """
+        Method for getting nvr of CI message from its header
+
+        :param header -- CI message header
+
+        :returns String in name-version-release format or empty string when header
+                 does not contain build information
+        """
+        if not all(header.get(key) for key in ('package', 'version', 'release')):
+            return ''
+        return str(NVR(header['package'], header['version'], header['release']))
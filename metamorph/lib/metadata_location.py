@@ -0,0 +1,154 @@
+#!/usr/bin/python
+"""
+Metadata locations compiled into trie of accessors.
+
+Locations sharing path prefix share trie nodes, so every part of metadata document is visited
+at most once for all locations. Lists on path are indexed once by keys of their dictionaries
+instead of being scanned for every location. Lookup semantics are the same as semantics
+of Provision.get_metadata_from_location:
+ * metadata name (last item of location) found on any level of path is returned,
+ * list is replaced by its first dictionary containing next key of path,
+ * dictionary value of metadata and empty tree on path are errors,
+ * missing key of path raises KeyError,
+ * error of list item (e.g. list without keys) is error only of keys which were not found
+   in preceding items.
+"""
+
+
+class MetadataLocationException(Exception):
+    """Metadata location exception class"""
+    pass
+
+
+class LocationNode(object):
+    """
+    LocationNode class is single trie node, i.e. single prefix of metadata locations
+    """
+    __slots__ = ('children', 'locations')
+
+    def __init__(self):
+        self.children = dict()   # Next key of path -> child node
+        self.locations = dict()  # Next key of path -> list of locations passing this node
+
+    def add(self, metadata_name, location, depth=0):
+        """
+        Method for adding location into sub-trie of this node
+
+        :param metadata_name -- name of topology metadata
+        :param location -- list of keys, last key is searched metadata name
+        :param depth -- depth of this node
+        """
+        key = location[depth]
+        self.locations.setdefault(key, []).append((metadata_name, location))
+        if depth + 1 < len(location):
+            self.children.setdefault(key, LocationNode()).add(metadata_name, location, depth + 1)
+
+
+class MetadataLocations(object):
+    """
+    MetadataLocations class holds compiled metadata locations
+    """
+
+    def __init__(self, metadata_location):
+        """
+        :param metadata_location -- dictionary where keys are metadata names and values are
+                                    lists of keys to metadata
+        """
+        self.metadata_location = metadata_location
+        self.root = LocationNode()
+        for metadata_name, location in metadata_location.items():
+            self.root.add(metadata_name, location)
+
+    def extract(self, metadata):
+        """
+        Method for extracting all metadata locations in single traversal of metadata
+
+        :param metadata -- parsed metadata document
+
+        :returns List of (metadata name, value, exception) tuples in order of given locations,
+                 exception is None when value was found
+        """
+        found = dict()
+        self.extract_node(self.root, metadata, found)
+        return [(metadata_name,) + found[metadata_name] for metadata_name in self.metadata_location]
+
+    def extract_node(self, node, metadata_source, found):
+        """
+        Method for extracting locations of trie node from metadata subtree
+
+        :param node -- trie node
+        :param metadata_source -- metadata subtree on path of node
+        :param found -- dictionary of metadata names and (value, exception) tuples to fill
+        """
+        trees, errors = self.get_key_index(metadata_source, node.locations.keys())
+        for key, locations in node.locations.items():
+            try:
+                if key in errors:
+                    raise errors[key]
+                if key not in trees:
+                    raise MetadataLocationException('Unable to find key "{}" in given '
+                                                    'metadata file'.format(key))
+                metadata_tree = trees[key]
+                pending = False
+                for metadata_name, location in locations:
+                    if metadata_name in found:
+                        continue  # Found on higher level of path
+                    if location[-1] in metadata_tree.keys():
+                        value = metadata_tree[location[-1]]
+                        if isinstance(value, dict):
+                            found[metadata_name] = (None, MetadataLocationException(
+                                "Metadata value can not be dictionary type. "
+                                "For more information see documentation."))
+                        else:
+                            found[metadata_name] = (value, None)
+                    elif not metadata_tree:
+                        found[metadata_name] = (None, MetadataLocationException(
+                            'Unable to find metadata "{}" in given metadata '
+                            'location'.format(location[-1])))
+                    else:
+                        pending = True
+                if pending:
+                    self.extract_node(node.children[key], metadata_tree[key], found)
+            except (KeyError, AttributeError, TypeError, MetadataLocationException) as detail:
+                self.set_error(locations, detail, found)
+
+    @staticmethod
+    def get_key_index(metadata_source, keys):
+        """
+        Method for getting trees in which keys of path are searched
+        List is indexed in single pass, first dictionary containing key is used for it.
+        Item which can not be searched is error of keys which are still missing.
+
+        :param metadata_source -- metadata subtree
+        :param keys -- next keys of paths
+
+        :returns Tuple of dictionaries of keys and their metadata trees and of keys and their
+                 errors, keys missing in list are omitted
+        """
+        if not isinstance(metadata_source, list):
+            return dict.fromkeys(keys, metadata_source), dict()
+        index = dict()
+        missing = set(keys)
+        for metadata_tree in metadata_source:
+            if not missing:
+                break
+            try:
+                tree_keys = metadata_tree.keys()
+            except AttributeError as detail:
+                return index, dict.fromkeys(missing, detail)
+            for key in missing.intersection(tree_keys):
+                index[key] = metadata_tree
+            missing.difference_update(index)
+        return index, dict()
+
+    @staticmethod
+    def set_error(locations, detail, found):
+        """
+        Method for storing error of locations which were not found yet
+
+        :param locations -- list of (metadata name, location) tuples
+        :param detail -- raised exception
+        :param found -- dictionary of metadata names and (value, exception) tuples
+        """
+        for metadata_name, _ in locations:
+            found.setdefault(metadata_name, (None, detail))
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+"""
+Parsing of package NVR (name-version-release), NEVRA (name-epoch:version-release.arch)
+and compose ids.
+
+Single string parsers are cached, so repeated strings of batch and backfill workloads are split
+only once. Package names and arches are interned, so records of one package share their strings.
+Bulk functions parse whole iterables at once. Run this module to benchmark them.
+"""
+import sys
+
+from collections import namedtuple
+from functools import lru_cache
+
+CACHE_SIZE = 65536
+
+
+class NVRException(ValueError):
+    """NVR parsing exception class"""
+    pass
+
+
+class NVR(namedtuple('NVR', ['name', 'version', 'release'])):
+    """Package name, version and release"""
+    __slots__ = ()
+
+    def __str__(self):
+        return "{0}-{1}-{2}".format(self.name, self.version, self.release)
+
+
+class NEVRA(namedtuple('NEVRA', ['name', 'epoch', 'version', 'release', 'arch'])):
+    """Package name, epoch, version, release and architecture"""
+    __slots__ = ()
+
+    @property
+    def nvr(self):
+        """NVR of package, epoch and architecture are dropped"""
+        return NVR(self.name, self.version, self.release)
+
+    def __str__(self):
+        epoch = "{}:".format(self.epoch) if self.epoch else ""
+        return "{0}-{1}{2}-{3}.{4}".format(self.name, epoch, self.version, self.release,
+                                           self.arch)
+
+
+class ComposeID(namedtuple('ComposeID', ['short', 'version', 'suffix'])):
+    """Compose id split into product short name, product version and rest of compose id"""
+    __slots__ = ()
+
+    @property
+    def release_id(self):
+        """PDC release id of compose, e.g. 'rhel-7.1' for 'RHEL-7.1-20150219.1'"""
+        return "{0}-{1}".format(self.short.lower(), self.version)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_nvr(nvr):
+    """
+    Function for parsing nvr string. Epoch in version (name-epoch:version-release) is dropped.
+
+    :param nvr -- package in name-version-release format
+
+    :returns NVR tuple
+    """
+    try:
+        name, version, release = nvr.rsplit('-', 2)
+    except ValueError:
+        raise NVRException("Invalid nvr '{}'".format(nvr))
+    if ':' in version:
+        version = version.split(':', 1)[1]
+    return NVR(sys.intern(name), version, release)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_nevra(nevra):
+    """
+    Function for parsing nevra string. Both name-epoch:version-release.arch and
+    epoch:name-version-release.arch forms are accepted, '.rpm' suffix is ignored.
+
+    :param nevra -- package in nevra format
+
+    :returns NEVRA tuple, epoch is empty string when it is not given
+    """
+    if nevra.endswith('.rpm'):
+        nevra = nevra[:-4]
+    nevr, _, arch = nevra.rpartition('.')
+    try:
+        name, version, release = nevr.rsplit('-', 2)
+    except ValueError:
+        raise NVRException("Invalid nevra '{}'".format(nevra))
+    epoch = ''
+    if ':' in version:
+        epoch, version = version.split(':', 1)
+    elif ':' in name:
+        epoch, name = name.split(':', 1)
+    if not arch or not name:
+        raise NVRException("Invalid nevra '{}'".format(nevra))
+    return NEVRA(sys.intern(name), epoch, version, release, sys.intern(arch))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_compose_id(compose):
+    """
+    Function for parsing compose id
+
+    :param compose -- compose id, e.g. 'RHEL-7.1-20150219.1'
+
+    :returns ComposeID tuple
+    """
+    parts = compose.split('-', 2)
+    if len(parts) < 2:
+        raise NVRException("Invalid compose id '{}'".format(compose))
+    return ComposeID(sys.intern(parts[0]), parts[1], parts[2] if len(parts) > 2 else '')
+
+
+def parse_nvrs(nvrs):
+    """
+    Function for parsing many nvr strings
+
+    :param nvrs -- iterable of nvr strings
+
+    :returns List of NVR tuples in input order
+    """
+    return list(map(parse_nvr, nvrs))
+
+
+def parse_nevras(nevras):
+    """
+    Function for parsing many nevra strings
+
+    :param nevras -- iterable of nevra strings
+
+    :returns List of NEVRA tuples in input order
+    """
+    return list(map(parse_nevra, nevras))
+
+
+def parse_compose_ids(composes):
+    """
+    Function for parsing many compose ids
+
+    :param composes -- iterable of compose ids
+
+    :returns List of ComposeID tuples in input order
+    """
+    return list(map(parse_compose_id, composes))
+
+
+def benchmark(count=1000000, distinct=50000):
+    """
+    Function for measuring throughput of bulk parsers
+
+    :param count -- number of parsed strings
+    :param distinct -- number of distinct strings among parsed ones
+
+    :returns Dictionary where keys are parser names and values are parsed strings per second
+    """
+    import timeit
+    inputs = {
+        'parse_nvrs': ["package{0}-{1}.{2}-{3}.el7".format(index % 997, index % 13, index % 7,
+                                                           index) for index in range(distinct)],
+        'parse_nevras': ["package{0}-1:{1}.{2}-{3}.el7.x86_64".format(index % 997, index % 13,
+                                                                      index % 7, index)
+                         for index in range(distinct)],
+        'parse_compose_ids': ["RHEL-7.{0}-2015{1:04d}.{2}".format(index % 10, index % 9999,
+                                                                  index % 5)
+                              for index in range(distinct)]
+    }
+    parsers = {'parse_nvrs': parse_nvrs, 'parse_nevras': parse_nevras,
+               'parse_compose_ids': parse_compose_ids}
+    throughput = {}
+    for name, strings in inputs.items():
+        strings = (strings * (count // distinct + 1))[:count]
+        seconds = timeit.timeit(lambda: parsers[name](strings), number=1)
+        throughput[name] = count / seconds
+    return throughput
+
+
+if __name__ == '__main__':
+    for parser_name, strings_per_second in sorted(benchmark().items()):
+        print("{0}: {1:,.0f} strings/s".format(parser_name, strings_per_second))
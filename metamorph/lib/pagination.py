@@ -0,0 +1,145 @@
+#!/usr/bin/python
+"""
+Helpers for paginated api queries.
+"""
+import collections
+import itertools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AdaptivePageSize(object):
+    """
+    AdaptivePageSize class tunes size of requested pages by observed response latency.
+    Page size grows while full pages are returned fast and shrinks when they get slow.
+    It never grows over page size to which server silently caps requested pages.
+    Learned size is shared by all queries of one api client, so it may be used from many threads.
+    """
+
+    def __init__(self, initial=100, minimum=20, maximum=1000, target_latency=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.size = min(max(initial, minimum), maximum)
+        self.lock = threading.Lock()
+
+    def observe(self, latency, records, requested_size, has_next=False):
+        """
+        Method for updating preferred page size by single response
+
+        :param latency -- response latency in seconds
+        :param records -- number of records in response
+        :param requested_size -- requested page size
+        :param has_next -- True when next page exists, i.e. response is not last page
+        """
+        with self.lock:
+            if has_next and 0 < records < requested_size:
+                # Page which is not last one is short only when server caps page size
+                self.maximum = records
+                self.minimum = min(self.minimum, records)
+                self.size = min(self.size, records)
+            elif latency > self.target_latency * 2:
+                self.size = max(self.minimum, requested_size // 2)
+            elif latency < self.target_latency / 2 and records >= requested_size:
+                self.size = min(self.maximum, max(self.size, requested_size * 2))
+
+    def next_size(self, offset, current_size):
+        """
+        Method for getting size of page which starts at given offset.
+        Page numbers are computed as offset divided by page size, so preferred size is used
+        only when offset is its multiple. Otherwise current size is kept.
+
+        :param offset -- number of already queried records
+        :param current_size -- size of previous page
+
+        :returns Page size
+        """
+        with self.lock:
+            size = self.size
+        if offset % size == 0:
+            return size
+        return current_size
+
+
+def get_page_number(offset, page_size, first_page=0):
+    """
+    Function for getting number of page which starts at given offset
+
+    :param offset -- number of already queried records
+    :param page_size -- size of page
+    :param first_page -- number of first page used by api
+
+    :returns Page number
+    """
+    return offset // page_size + first_page
+
+
+def iter_pages(query_page, page_size, limit, max_workers=1, first_page=0, executor=None):
+    """
+    Generator of pages of paginated api endpoint.
+    When first page reports total count of records, all remaining page numbers are known
+    and they are queried concurrently. Otherwise pages are queried one by one.
+    Remaining pages are computed from real size of first page, so pages stay aligned when
+    server caps page size. At most max_workers pages are submitted ahead of yielded one,
+    so executor queue does not grow with number of pages.
+
+    :param query_page -- function(page_number, page_size) which returns tuple of page results,
+                         total count of records (None when unknown) and whether next page exists
+    :param page_size -- size of requested pages
+    :param limit -- Limit for amount of queried records
+    :param max_workers -- maximal number of concurrently queried pages
+    :param first_page -- number of first page used by api
+    :param executor -- concurrent.futures executor which runs every page query. It may be shared
+                       by many queries to bound their requests together. Own executor with
+                       max_workers threads is used when it is not given.
+
+    :yield List of records of single page, pages are yielded in their order
+    """
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            yield from iter_pages(query_page, page_size, limit, max_workers, first_page, executor)
+        return
+    results, count, has_next = executor.submit(query_page, first_page, page_size).result()
+    if has_next and 0 < len(results) < page_size:
+        page_size = len(results)  # Server caps page size
+    yield results[:limit]
+    remaining = limit - len(results)
+    if count is None:
+        page = first_page
+        while has_next and remaining > 0:
+            page += 1
+            results, _, has_next = executor.submit(query_page, page, page_size).result()
+            if not results:
+                return
+            yield results[:remaining]
+            remaining -= len(results)
+        return
+    last_page = first_page + max(min(count, limit) - 1, 0) // page_size
+    if not has_next:
+        return
+    remaining_pages = iter(range(first_page + 1, last_page + 1))
+    futures = collections.deque(executor.submit(query_page, page, page_size)
+                                for page in itertools.islice(remaining_pages, max_workers))
+    try:
+        while futures and remaining > 0:
+            results, _, _ = futures.popleft().result()
+            for page in itertools.islice(remaining_pages, 1):
+                futures.append(executor.submit(query_page, page, page_size))
+            yield results[:remaining]
+            remaining -= len(results)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def query_pages(query_page, page_size, limit, max_workers=1, first_page=0):
+    """
+    Function for querying all pages of paginated api endpoint. See iter_pages for details.
+
+    :returns List of queried records in page order
+    """
+    results = []
+    for page_results in iter_pages(query_page, page_size, limit, max_workers, first_page):
+        results += page_results
+    return results
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+"""
+Local SQLite mirror of PDC release-components, rpms and rpm-mappings.
+
+Mirror is created by exporter and opened read-only for lookups, so mistyped path of mirror
+is an error instead of new empty mirror.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+
+from urllib.request import pathname2url
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS release_components (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    release_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS release_components_name ON release_components (name);
+CREATE TABLE IF NOT EXISTS rpms (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT,
+    release TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rpms_nvr ON rpms (name, version, release);
+CREATE TABLE IF NOT EXISTS rpm_mappings (
+    release_id TEXT NOT NULL,
+    component TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (release_id, component)
+);
+CREATE TABLE IF NOT EXISTS mirror_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+class PDCMirrorException(Exception):
+    """PDC mirror exception class"""
+    pass
+
+
+class PDCMirror(object):
+    """
+    PDCMirror class stores pdc metadata in indexed SQLite database and answers lookups from it
+    Single instance may be shared by many threads.
+    """
+
+    TABLES = {
+        'release-components': 'release_components',
+        'rpms': 'rpms'
+    }
+
+    REPLACE_QUERIES = {
+        'release-components': "INSERT OR REPLACE INTO release_components VALUES (?, ?, ?, ?)",
+        'rpms': "INSERT OR REPLACE INTO rpms VALUES (?, ?, ?, ?, ?)",
+        'rpm-mappings': "INSERT OR REPLACE INTO rpm_mappings VALUES (?, ?, ?)"
+    }
+
+    def __init__(self, database_path, read_only=False):
+        """
+        :param database_path -- path to mirror database
+        :param read_only -- open existing mirror for lookups only, otherwise it is created
+                            when it does not exist
+        """
+        self.database_path = database_path
+        self.lock = threading.RLock()
+        self.in_transaction = False
+        try:
+            if read_only:
+                self.connection = sqlite3.connect(
+                    'file:{}?mode=ro'.format(pathname2url(os.path.abspath(database_path))),
+                    uri=True, check_same_thread=False)
+                self.connection.execute("SELECT 1 FROM mirror_state LIMIT 1")
+            else:
+                self.connection = sqlite3.connect(database_path, check_same_thread=False)
+                self.connection.executescript(SCHEMA)
+        except sqlite3.Error as detail:
+            raise PDCMirrorException("Unable to open pdc mirror '{0}': {1}".format(database_path,
+                                                                                detail))
+
+    def close(self):
+        """Method for closing mirror database"""
+        with self.lock:
+            self.connection.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager in which all changes of mirror are committed together
+        Mirror stays untouched when exception is raised inside.
+
+        :yield Nothing
+        """
+        with self.lock, self.connection:
+            self.in_transaction = True
+            try:
+                yield
+            finally:
+                self.in_transaction = False
+
+    @contextlib.contextmanager
+    def write(self):
+        """
+        Context manager for single change, it is committed right away outside of transaction
+
+        :yield Nothing
+        """
+        with self.lock:
+            if self.in_transaction:
+                yield
+            else:
+                with self.connection:
+                    yield
+
+    def delete_components(self, components=None):
+        """
+        Method for deleting mirrored records of given components before they are exported again
+
+        :param components -- list of component names, all records are deleted when not given
+        """
+        with self.write():
+            if not components:
+                for table in list(self.TABLES.values()) + ['rpm_mappings']:
+                    self.connection.execute("DELETE FROM {}".format(table))
+                return
+            rows = [(component,) for component in components]
+            for table in self.TABLES.values():
+                self.connection.executemany("DELETE FROM {} WHERE name = ?".format(table), rows)
+            self.connection.executemany("DELETE FROM rpm_mappings WHERE component = ?", rows)
+
+    def store_release_components(self, release_components):
+        """
+        Method for storing (or replacing) release-components records
+
+        :param release_components -- list of release-components records from pdc
+        """
+        with self.write():
+            self.connection.executemany(self.REPLACE_QUERIES['release-components'],
+                                        self.get_release_component_rows(release_components))
+
+    def store_rpms(self, rpms):
+        """
+        Method for storing (or replacing) rpms records
+
+        :param rpms -- list of rpms records from pdc
+        """
+        with self.write():
+            self.connection.executemany(self.REPLACE_QUERIES['rpms'], self.get_rpm_rows(rpms))
+
+    def store_rpm_mapping(self, release_id, component, rpm_mapping):
+        """
+        Method for storing (or replacing) rpm-mapping of component in given release
+
+        :param release_id -- pdc release id
+        :param component -- component name
+        :param rpm_mapping -- rpm-mapping data from pdc
+        """
+        with self.write():
+            self.connection.execute(self.REPLACE_QUERIES['rpm-mappings'],
+                                    (release_id, component, json.dumps(rpm_mapping)))
+
+    def apply_changes(self, changed_records, deleted_ids, rpm_mappings, state):
+        """
+        Method for applying synchronized changes in single transaction.
+        Either all changes are applied or mirror stays untouched.
+
+        :param changed_records -- dictionary where keys are 'release-components' and 'rpms'
+                                  and values are lists of new or changed records
+        :param deleted_ids -- dictionary where keys are 'release-components' and 'rpms'
+                              and values are lists of ids of deleted records
+        :param rpm_mappings -- dictionary where keys are (release_id, component) tuples
+                               and values are rpm-mapping data
+        :param state -- dictionary of mirror state values, e.g. time of this synchronization
+        """
+        with self.transaction():
+            for pdc_metadata_type, table in self.TABLES.items():
+                self.connection.executemany(
+                    "DELETE FROM {} WHERE id = ?".format(table),
+                    [(record_id,) for record_id in deleted_ids.get(pdc_metadata_type, [])])
+            self.connection.executemany(
+                self.REPLACE_QUERIES['release-components'],
+                self.get_release_component_rows(changed_records.get('release-components', [])))
+            self.connection.executemany(
+                self.REPLACE_QUERIES['rpms'],
+                self.get_rpm_rows(changed_records.get('rpms', [])))
+            self.connection.executemany(
+                self.REPLACE_QUERIES['rpm-mappings'],
+                [(release_id, component, json.dumps(rpm_mapping))
+                 for (release_id, component), rpm_mapping in rpm_mappings.items()])
+            self.connection.executemany("INSERT OR REPLACE INTO mirror_state VALUES (?, ?)",
+                                        list(state.items()))
+
+    @staticmethod
+    def get_release_component_rows(release_components):
+        """
+        Method for converting release-components records into table rows
+
+        :param release_components -- list of release-components records from pdc
+
+        :returns List of tuples
+        """
+        return [(record['id'], record['name'], (record.get('release') or {}).get('release_id'),
+                 json.dumps(record)) for record in release_components]
+
+    @staticmethod
+    def get_rpm_rows(rpms):
+        """
+        Method for converting rpms records into table rows
+
+        :param rpms -- list of rpms records from pdc
+
+        :returns List of tuples
+        """
+        return [(record['id'], record['name'], record.get('version'), record.get('release'),
+                 json.dumps(record)) for record in rpms]
+
+    def get_release_components(self, name, limit=-1):
+        """
+        Method for getting release-components of given component
+
+        :param name -- component name
+        :param limit -- Limit for amount of returned records, -1 means no limit
+
+        :returns List of release-components records
+        """
+        return self.select_records("SELECT data FROM release_components WHERE name = ? "
+                                   "ORDER BY id LIMIT ?", (name, limit))
+
+    def get_rpms(self, name, version, release, limit=-1):
+        """
+        Method for getting rpms of given component build
+
+        :param name -- component name
+        :param version -- component version
+        :param release -- component release
+        :param limit -- Limit for amount of returned records, -1 means no limit
+
+        :returns List of rpms records
+        """
+        return self.select_records("SELECT data FROM rpms WHERE name = ? AND version = ? "
+                                   "AND release = ? ORDER BY id LIMIT ?",
+                                   (name, version, release, limit))
+
+    def get_rpm_mapping(self, release_id, component):
+        """
+        Method for getting rpm-mapping of component in given release
+
+        :param release_id -- pdc release id
+        :param component -- component name
+
+        :returns rpm-mapping data or None when it is not mirrored
+        """
+        records = self.select_records("SELECT data FROM rpm_mappings WHERE release_id = ? "
+                                      "AND component = ?", (release_id, component))
+        return records[0] if records else None
+
+    def get_release_component_pairs(self):
+        """
+        Method for getting all mirrored (release_id, component name) pairs
+
+        :returns List of tuples
+        """
+        with self.lock:
+            return self.connection.execute("SELECT DISTINCT release_id, name "
+                                           "FROM release_components "
+                                           "WHERE release_id IS NOT NULL").fetchall()
+
+    def get_state(self, key, default=None):
+        """
+        Method for getting mirror state value, e.g. time of last synchronization
+
+        :param key -- state name
+        :param default -- value returned when state is not set
+
+        :returns State value
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM mirror_state WHERE key = ?",
+                                          (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        """
+        Method for setting mirror state value
+
+        :param key -- state name
+        :param value -- state value
+        """
+        with self.write():
+            self.connection.execute("INSERT OR REPLACE INTO mirror_state VALUES (?, ?)",
+                                    (key, value))
+
+    def select_records(self, query, params):
+        """
+        Method for selecting json encoded records
+
+        :param query -- SQL query which selects single data column
+        :param params -- query parameters
+
+        :returns List of decoded records
+        """
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
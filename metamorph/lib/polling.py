@@ -0,0 +1,40 @@
+#!/usr/bin/python
+"""
+Adaptive intervals for polling of not yet published results.
+"""
+
+
+class PollSchedule(object):
+    """
+    PollSchedule class gives intervals between polls
+    Nothing is expected before expected publish time, so it is polled rarely then. Right after
+    expected publish time it is polled often and intervals grow while nothing is published.
+    """
+
+    def __init__(self, expected_wait=0, short_interval=15, long_interval=300, growth=1.5):
+        """
+        :param expected_wait -- seconds after which results are expected to be published
+        :param short_interval -- interval right after expected publish time in seconds
+        :param long_interval -- maximal interval in seconds
+        :param growth -- factor by which interval grows after every unsuccessful poll
+        """
+        self.expected_wait = expected_wait
+        self.short_interval = short_interval
+        self.long_interval = long_interval
+        self.growth = growth
+        self.elapsed = 0
+        self.interval = short_interval
+
+    def next_interval(self):
+        """
+        Method for getting interval before next poll
+
+        :returns Interval in seconds
+        """
+        if self.elapsed < self.expected_wait:
+            interval = min(self.expected_wait - self.elapsed, self.long_interval)
+        else:
+            interval = self.interval
+            self.interval = min(self.interval * self.growth, self.long_interval)
+        self.elapsed += interval
+        return interval
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+"""
+Progress of long running queries stored in json status file.
+
+Status file is rewritten atomically after every change, so it can be read at any time
+by other process, e.g. by Ansible task polling background job. It holds only query parameters,
+counters and remaining wait time. Queried results are appended page by page to results file
+next to it, so a page is written only once however long the query is. Counters of status file
+decide how many appended results are valid. Interrupted query with the same parameters continues
+from stored progress instead of querying everything again.
+"""
+import json
+import os
+import tempfile
+
+
+class QueryProgressException(Exception):
+    """Query progress exception class"""
+    pass
+
+
+class QueryProgress(object):
+    """
+    QueryProgress class keeps queried results of every job and remaining wait time
+    """
+    RESULTS_SUFFIX = '.results'
+
+    def __init__(self, status_file, query):
+        """
+        :param status_file -- path to json status file
+        :param query -- json serializable query parameters, stored progress is resumed only
+                        when they are equal. Unfinished progress of other query is rejected.
+        """
+        self.status_file = status_file
+        self.results_file = status_file + self.RESULTS_SUFFIX
+        self.query = json.loads(json.dumps(query))
+        state = self.read_state(status_file)
+        if state is not None and not state.get('finished'):
+            self.check_query(status_file, state, self.query)
+            self.results = self.read_results(self.results_file, state['jobs'])
+        else:
+            state = {'query': self.query, 'finished': False, 'timeout_left': None, 'jobs': {}}
+            self.results = {}
+        self.state = state
+        # Results appended after last counter update (e.g. by interrupted save) are dropped
+        self.rewrite_results()
+
+    @property
+    def resumed(self):
+        """Boolean -- True when stored progress of interrupted query is continued"""
+        return bool(self.state['jobs'])
+
+    def get_job(self, job_name):
+        """
+        Method for getting stored progress of single job
+
+        :param job_name -- job name, empty string stands for query of all jobs
+
+        :returns Dictionary with 'results', 'page_size' and 'done' keys
+        """
+        job = self.state['jobs'].get(job_name, {'page_size': None, 'done': False})
+        return {'results': self.results.get(job_name, []), 'page_size': job['page_size'],
+                'done': job['done']}
+
+    def add_results(self, job_name, results, page_size, done=False):
+        """
+        Method for storing progress of single job, only newly queried results are written
+
+        :param job_name -- job name, empty string stands for query of all jobs
+        :param results -- list of results queried since previous call
+        :param page_size -- size of pages used for queried results
+        :param done -- True when no more results of job will be queried
+        """
+        if results:
+            with open(self.results_file, 'a') as results_file:
+                results_file.write(json.dumps({'job_name': job_name, 'results': results}) + '\n')
+        job = self.state['jobs'].setdefault(job_name, {'count': 0, 'page_size': None,
+                                                       'done': False})
+        job.update(count=job['count'] + len(results), page_size=page_size, done=done)
+        self.save()
+
+    def set_timeout_left(self, timeout_left):
+        """
+        Method for storing remaining wait time
+
+        :param timeout_left -- remaining wait time in seconds
+        """
+        self.state['timeout_left'] = timeout_left
+        self.save()
+
+    def finish(self):
+        """Method for marking query finished, next query with the same parameters starts over"""
+        self.state['finished'] = True
+        self.save()
+
+    def save(self):
+        """Method for atomic rewrite of status file"""
+        status_dir = os.path.dirname(os.path.abspath(self.status_file))
+        with tempfile.NamedTemporaryFile('w', dir=status_dir, delete=False) as status:
+            json.dump(self.state, status)
+        os.replace(status.name, self.status_file)
+
+    def rewrite_results(self):
+        """Method for atomic rewrite of results file by valid stored results"""
+        status_dir = os.path.dirname(os.path.abspath(self.status_file))
+        with tempfile.NamedTemporaryFile('w', dir=status_dir, delete=False) as results_file:
+            for job_name, results in self.results.items():
+                if results:
+                    results_file.write(json.dumps({'job_name': job_name,
+                                                   'results': results}) + '\n')
+        os.replace(results_file.name, self.results_file)
+
+    @staticmethod
+    def check_query(status_file, state, query):
+        """
+        Method for checking that stored progress belongs to given query
+
+        :param status_file -- path to json status file
+        :param state -- stored state
+        :param query -- normalized query parameters
+        """
+        if state.get('query') != query:
+            raise QueryProgressException("Status file '{0}' belongs to query {1}, not to "
+                                         "query {2}".format(status_file, state.get('query'), query))
+
+    @staticmethod
+    def read_state(status_file):
+        """
+        Method for reading status file without results
+
+        :param status_file -- path to json status file
+
+        :returns Dictionary of stored state or None when status file does not exist
+        """
+        if not os.path.isfile(status_file):
+            return None
+        with open(status_file) as status:
+            return json.load(status)
+
+    @staticmethod
+    def read_results(results_file, jobs):
+        """
+        Method for reading valid results of every job from results file
+
+        :param results_file -- path to results file
+        :param jobs -- stored progress of jobs, their counters limit valid results
+
+        :returns Dictionary where keys are job names and values are lists of results
+        """
+        results = {job_name: [] for job_name in jobs}
+        if os.path.isfile(results_file):
+            with open(results_file) as stored_results:
+                for line in stored_results:
+                    try:
+                        page = json.loads(line)
+                    except ValueError:
+                        break  # Page was interrupted while it was written
+                    if page['job_name'] in results:
+                        results[page['job_name']].extend(page['results'])
+        for job_name, job in jobs.items():
+            del results[job_name][job['count']:]
+        return results
+
+    @classmethod
+    def read(cls, status_file, query=None):
+        """
+        Method for reading status file together with stored results
+
+        :param status_file -- path to json status file
+        :param query -- query parameters, QueryProgressException is raised when stored progress
+                        belongs to other query. Not checked when it is not given.
+
+        :returns Dictionary of stored state or None when status file does not exist
+        """
+        state = cls.read_state(status_file)
+        if state is None:
+            return None
+        if query is not None:
+            cls.check_query(status_file, state, json.loads(json.dumps(query)))
+        results = cls.read_results(status_file + cls.RESULTS_SUFFIX, state['jobs'])
+        for job_name, job in state['jobs'].items():
+            job['results'] = results[job_name]
+        return state
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+"""
+Compact records of ResultsDB results.
+
+Raw results carry every nested data field of ResultsDB. Only fields needed for tier status
+output are kept in slotted records and build url and number are parsed once on ingestion.
+"""
+
+
+class ResultRecord(object):
+    """
+    ResultRecord class holds fields of single ResultsDB result needed for tier status
+    """
+    __slots__ = ('ref_url', 'outcome', 'submit_time', 'build_url', 'build_number')
+
+    def __init__(self, ref_url, outcome, submit_time=None):
+        self.ref_url = ref_url
+        self.outcome = outcome
+        self.submit_time = submit_time
+        self.build_url = ref_url.split('/console')[0]
+        self.build_number = get_build_number_from_url(ref_url)
+
+    def __eq__(self, other):
+        if not isinstance(other, ResultRecord):
+            return NotImplemented
+        return ((self.ref_url, self.outcome, self.submit_time) ==
+                (other.ref_url, other.outcome, other.submit_time))
+
+    def __repr__(self):
+        return "ResultRecord({0!r}, {1!r}, {2!r})".format(self.ref_url, self.outcome,
+                                                          self.submit_time)
+
+    @classmethod
+    def from_result(cls, result):
+        """
+        Method for creating record from raw ResultsDB result
+
+        :param result -- ResultsDB result dictionary
+
+        :returns ResultRecord
+        """
+        return cls(result['ref_url'], result['outcome'], result.get('submit_time'))
+
+
+def get_build_number_from_url(job_build_url):
+    """
+    Function for parsing job build id from job build url
+
+    :param job_build_url -- job build url containing job build id
+
+    :returns -- job build id
+    """
+    splitted = job_build_url.split('/')
+    if splitted[-1].isnumeric():
+        return splitted[-1]
+    elif splitted[-2].isnumeric():
+        return splitted[-2]
+    return "unknown"
+
+
+def ingest_results(results, records=None):
+    """
+    Function for ingesting raw results into records. Only first result of every ref_url
+    is kept, duplicities are dropped before they are parsed.
+
+    :param results -- iterable of ResultsDB result dictionaries
+    :param records -- dictionary of already ingested records which will be extended
+
+    :returns -- dictionary where keys are ref_urls and values are ResultRecord objects
+    """
+    if records is None:
+        records = {}
+    for result in results:
+        if result['ref_url'] not in records:
+            records[result['ref_url']] = ResultRecord.from_result(result)
+    return records
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+"""
+Local SQLite store of ResultsDB results.
+
+Results are keyed by item, tier, job name and ref_url, so every build of a job is stored once.
+Store remembers newest submit time seen by every query, so next query asks ResultsDB only
+for results submitted since then.
+"""
+import json
+import sqlite3
+import threading
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    item TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    job_name TEXT NOT NULL,
+    ref_url TEXT NOT NULL,
+    submit_time TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (item, tier, job_name, ref_url)
+);
+CREATE INDEX IF NOT EXISTS results_submit_time ON results (item, tier, submit_time);
+CREATE TABLE IF NOT EXISTS refresh_state (
+    item TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    job_name TEXT NOT NULL,
+    submit_time TEXT NOT NULL,
+    PRIMARY KEY (item, tier, job_name)
+);
+'''
+
+
+class ResultStoreException(Exception):
+    """Result store exception class"""
+    pass
+
+
+class ResultStore(object):
+    """
+    ResultStore class stores ResultsDB results in indexed SQLite database
+    Single instance may be shared by many threads.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+        self.lock = threading.Lock()
+        try:
+            self.connection = sqlite3.connect(database_path, check_same_thread=False)
+            self.connection.executescript(SCHEMA)
+        except sqlite3.Error as detail:
+            raise ResultStoreException("Unable to open result store '{0}': {1}".format(
+                database_path, detail))
+
+    def close(self):
+        """Method for closing store database"""
+        with self.lock:
+            self.connection.close()
+
+    def store_results(self, item, tier, job_name, results):
+        """
+        Method for storing results of single job. Result of the same ref_url is replaced
+        by newer one.
+
+        :param item -- tested item, e.g. nvr
+        :param tier -- CI tier
+        :param job_name -- job name
+        :param results -- list of ResultsDB results
+        """
+        rows = [(item, str(tier), job_name, result['ref_url'], result.get('submit_time'),
+                 json.dumps(result))
+                for result in sorted(results, key=lambda result: result.get('submit_time') or '')]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                                        rows)
+
+    def get_results(self, item, tier, job_name=None, limit=-1):
+        """
+        Method for getting stored results ordered from the newest one
+
+        :param item -- tested item, e.g. nvr
+        :param tier -- CI tier
+        :param job_name -- job name, results of all jobs are returned when it is not given
+        :param limit -- Limit for amount of returned results, -1 means no limit
+
+        :returns List of ResultsDB results
+        """
+        query = "SELECT data FROM results WHERE item = ? AND tier = ?"
+        params = [item, str(tier)]
+        if job_name is not None:
+            query += " AND job_name = ?"
+            params.append(job_name)
+        query += " ORDER BY submit_time DESC LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_refresh_time(self, item, tier, job_name=""):
+        """
+        Method for getting newest submit time seen by query of given job name
+
+        :param item -- tested item, e.g. nvr
+        :param tier -- CI tier
+        :param job_name -- job name, empty string stands for query of all jobs
+
+        :returns Submit time in ISO format or None when query was not stored yet
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT submit_time FROM refresh_state WHERE item = ? "
+                                          "AND tier = ? AND job_name = ?",
+                                          (item, str(tier), job_name)).fetchone()
+        return row[0] if row else None
+
+    def set_refresh_time(self, item, tier, job_name, submit_time):
+        """
+        Method for remembering newest submit time seen by query of given job name
+
+        :param item -- tested item, e.g. nvr
+        :param tier -- CI tier
+        :param job_name -- job name, empty string stands for query of all jobs
+        :param submit_time -- submit time in ISO format
+        """
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO refresh_state VALUES (?, ?, ?, ?)",
+                                    (item, str(tier), job_name, submit_time))
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+"""
+Incremental resolution of PDC rpm-mapping release ids.
+
+Release id is confirmed when it is both a release of some release-component and a release
+parsed from some compose linked by component rpms. Pages of both metadata types are fed to the
+scheduler as they arrive and rpm-mapping of every confirmed release id is queried right away,
+so rpm-mapping requests overlap with remaining pagination.
+"""
+import threading
+
+
+class RpmMappingScheduler(object):
+    """
+    RpmMappingScheduler class submits rpm-mapping queries as soon as release ids are confirmed
+    Pages may be fed from many threads at once.
+    """
+
+    def __init__(self, executor, query_rpm_mapping, get_release_id_from_compose):
+        """
+        :param executor -- concurrent.futures executor which runs rpm-mapping queries
+        :param query_rpm_mapping -- function(release_id) which returns rpm-mapping
+        :param get_release_id_from_compose -- function(compose) which returns release id
+        """
+        self.executor = executor
+        self.query_rpm_mapping = query_rpm_mapping
+        self.get_release_id_from_compose = get_release_id_from_compose
+        self.release_component_ids = set()
+        self.compose_release_ids = set()
+        self.rpm_mappings = {}
+        self.lock = threading.Lock()
+
+    def add_release_components(self, release_components):
+        """
+        Method for feeding single page of release-components
+
+        :param release_components -- list of release-components records
+        """
+        with self.lock:
+            for release_component in release_components:
+                release_id = release_component['release']['release_id']
+                self.release_component_ids.add(release_id)
+                if release_id in self.compose_release_ids:
+                    self.schedule(release_id)
+
+    def add_rpms(self, rpms):
+        """
+        Method for feeding single page of rpms
+
+        :param rpms -- list of rpms records
+        """
+        with self.lock:
+            for component_rpm in rpms:
+                for linked_compose in component_rpm['linked_composes']:
+                    release_id = self.get_release_id_from_compose(linked_compose)
+                    self.compose_release_ids.add(release_id)
+                    if release_id in self.release_component_ids:
+                        self.schedule(release_id)
+
+    def schedule(self, release_id):
+        """
+        Method for submitting rpm-mapping query of release id, every release id is queried once
+
+        :param release_id -- confirmed release id
+        """
+        if release_id not in self.rpm_mappings:
+            self.rpm_mappings[release_id] = self.executor.submit(self.query_rpm_mapping,
+                                                                 release_id)
+
+    def get_rpm_mappings(self):
+        """
+        Method for collecting results of all submitted rpm-mapping queries.
+        It should be called after all pages were fed.
+
+        :returns Dictionary where keys are release ids and values are rpm-mappings
+        """
+        with self.lock:
+            futures = dict(self.rpm_mappings)
+        return {release_id: future.result() for release_id, future in futures.items()}
@@ -44,3 +44,28 @@ def write_json_file(input_data, output="metamorph.json"):
 def read_json_file(input_file):
     with open(input_file, "r") as message:
         return json.load(message)
+
+
+def project_fields(record, field_paths):
+    """
+    Function for keeping only wanted fields of given record
+    :param record -- dictionary to project
+    :param field_paths -- list of wanted fields. Nested fields are separated by dot,
+                          e.g. 'release.release_id'
+
+    :returns New dictionary which contains only wanted fields present in record
+    """
+    projected = {}
+    for field_path in field_paths:
+        keys = field_path.split('.')
+        source = record
+        for key in keys:
+            if not isinstance(source, dict) or key not in source:
+                break
+            source = source[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = source
+    return projected
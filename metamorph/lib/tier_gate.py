@@ -0,0 +1,69 @@
+#!/usr/bin/python
+"""
+Early verdict of CI tier gating.
+
+Outcomes are evaluated page by page while results are queried. Tier can not pass once
+a FAILED outcome is observed, so fail-fast gating stops querying right then. Pass-fast gating
+stops querying a job once it has passed and stops whole query once all required jobs passed.
+"""
+
+FAILED_OUTCOME = 'FAILED'
+PASSED_OUTCOME = 'PASSED'
+
+
+class TierGate(object):
+    """
+    TierGate class decides whether more results are needed for tier verdict
+    """
+
+    def __init__(self, required_jobs=(), fail_fast=False, pass_fast=False):
+        """
+        :param required_jobs -- job names which have to pass, pass-fast needs them
+        :param fail_fast -- verdict is final when any FAILED outcome is observed
+        :param pass_fast -- verdict is final when every required job has passed
+        """
+        self.required_jobs = set(required_jobs or ())
+        self.fail_fast = fail_fast
+        self.pass_fast = pass_fast
+        self.passed_jobs = set()
+        self.failed = False
+
+    def observe(self, job_name, results):
+        """
+        Method for evaluating outcomes of single page of job results
+
+        :param job_name -- job name of results
+        :param results -- list of ResultsDB results
+
+        :returns Boolean -- True when no more results of this job are needed
+        """
+        for result in results:
+            if result['outcome'] == FAILED_OUTCOME:
+                self.failed = True
+            elif result['outcome'] == PASSED_OUTCOME:
+                self.passed_jobs.add(job_name)
+        return self.is_job_decided(job_name)
+
+    def is_job_decided(self, job_name):
+        """
+        Method for checking whether more results of given job are needed
+
+        :param job_name -- job name
+
+        :returns Boolean
+        """
+        if self.is_decided():
+            return True
+        return (self.pass_fast and not self.failed and job_name in self.required_jobs and
+                job_name in self.passed_jobs)
+
+    def is_decided(self):
+        """
+        Method for checking whether tier verdict is final
+
+        :returns Boolean
+        """
+        if self.fail_fast and self.failed:
+            return True
+        return bool(self.pass_fast and not self.failed and self.required_jobs and
+                    self.required_jobs <= self.passed_jobs)
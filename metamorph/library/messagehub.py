@@ -31,6 +31,7 @@ options:
   host:
     description:
       - Message bus host.
+      - Comma separated list of failover hosts in host[:port] format is accepted too.
       - Mutually exclusive with env-variable
     required: true
 
@@ -55,10 +56,48 @@ options:
     required: false
     default: 1
 
+  heartbeat:
+    description:
+      - STOMP heartbeat interval in milliseconds. Zero disables heartbeats.
+      - Mutually exclusive with env-variable
+    required: false
+    default: 10000
+
+  reconnect-attempts:
+    description:
+      - Number of reconnect attempts after lost connection.
+      - Mutually exclusive with env-variable
+    required: false
+    default: 5
+
+  timeout:
+    description:
+      - Maximal time in seconds to wait for CI messages. Zero waits without limit.
+      - Mutually exclusive with env-variable
+    required: false
+    default: 3600
+
+  archive-dir:
+    description:
+      - Message archive directory where received CI messages will be stored too.
+      - Mutually exclusive with env-variable
+    required: false
+    default: None
+
   env-variable:
     description:
       - Name of environmental variable which contains CI message in .json format.
-      - Mutually exclusive with user, password, selector, host, port, destination and count
+      - Mutually exclusive with user, password, selector, host, port, destination, count
+        and ci-message-file
+    required: true
+    default: None
+
+  ci-message-file:
+    description:
+      - Path to file which contains CI message in .json format. Large messages are parsed
+        incrementally.
+      - Mutually exclusive with user, password, selector, host, port, destination, count
+        and env-variable
     required: true
     default: None
 
@@ -77,11 +116,23 @@ EXAMPLES = '''
     host: "..."
   register: result
 
+- name: Get single message from one of failover message bus hosts
+  messagehub:
+    user: "..."
+    password: "..."
+    host: "first-host,second-host:61614"
+  register: result
+
 - name: Get single message from environmental variable
   messagehub:
     env-variable: "..."
   register: result
 
+- name: Get single message from file
+  messagehub:
+    ci-message-file: "..."
+  register: result
+
 - name: Get single message from environmental variable and store it into hello.json
   messagehub:
     env-variable: "..."
@@ -105,34 +156,15 @@ CI message:
 
 import logging
 import logging.config
-import time
-import os
-import json
-
-import stomp
 
+from metamorph.lib.json_stream import load_env_variable, load_file
 from metamorph.lib.support_functions import setup_logging
 from metamorph.metamorph_plugin import MetamorphPlugin
+from metamorph.plugins.morph_messagehub import MessageBusMultiplexer, archive_messages, \
+    get_host_and_ports
 from ansible.module_utils.basic import AnsibleModule
 
 
-class CIListener(stomp.ConnectionListener):
-    """CIListener class manages connection and extraction of CI messages"""
-    def __init__(self, count):
-        self.count = count
-        self.metamorph_data = []
-        self.error_message = {}
-
-    def on_error(self, headers, message):
-        self.error_message['headers'] = headers
-        self.error_message['message'] = message
-
-    def on_message(self, headers, message):
-        if self.count > len(self.metamorph_data):
-            self.metamorph_data.append({"header": headers, "message": message})
-            self.count += 1
-
-
 def messagebus_run(module):
     """
     Method manages CI message extraction from message bus
@@ -141,31 +173,23 @@ def messagebus_run(module):
 
     :return Dictionary which contain CI message/s
     """
-    conn = stomp.Connection([(module.params['host'], module.params['port'])])
-    listener = CIListener(module.params['count'])
-    conn.set_listener('CI Listener', listener)
-    conn.start()
-    conn.connect(login=module.params['user'], passcode=module.params['password'], wait=True)
-    if module.params['selector']:
-        conn.subscribe(
-            destination=module.params['destination'],
-            id='1',
-            ack='auto',
-            headers={'selector': module.params['selector']}
-        )
-    else:
-        conn.subscribe(
-            destination=module.params['destination'],
-            id='1',
-            ack='auto'
-        )
+    multiplexer = MessageBusMultiplexer(get_host_and_ports(module.params['host'],
+                                                           module.params['port']),
+                                        module.params['user'], module.params['password'],
+                                        heartbeats=(module.params['heartbeat'],
+                                                    module.params['heartbeat']),
+                                        reconnect_attempts=module.params['reconnect-attempts'])
+    multiplexer.connect()
+    subscription = multiplexer.subscribe(module.params['destination'],
+                                         module.params['selector'],
+                                         module.params['count'])
     logging.info("Connection to message bus established.")
     logging.info("Waiting for CI message to arrive ...")
-    while (not listener.error_message) and len(listener.metamorph_data) < module.params['count']:
-        logging.debug("Waiting 1s for CI message to arrive")
-        time.sleep(1)
-    conn.disconnect()
-    return listener.error_message, listener.metamorph_data[:module.params['count']]
+    error_message, metamorph_data = subscription.wait(module.params['timeout'] or None)
+    multiplexer.disconnect()
+    if not error_message and module.params['archive-dir']:
+        archive_messages(metamorph_data, module.params['archive-dir'])
+    return error_message, metamorph_data
 
 
 def main():
@@ -178,7 +202,12 @@ def main():
         "port": {"default": 61613, "type": "int"},
         "destination": {"default": '/topic/CI', "type": "str"},
         "count": {"default": 1, "type": "int"},
+        "heartbeat": {"default": 10000, "type": "int"},
+        "reconnect-attempts": {"default": 5, "type": "int"},
+        "timeout": {"default": 3600, "type": "int"},
+        "archive-dir": {"type": "str"},
         "env-variable": {"type": "str"},
+        "ci-message-file": {"type": "str"},
         "output": {"type": "str", "default": "metamorph.json"}
     }
     mutually_exclusive = [
@@ -188,23 +217,44 @@ def main():
         ['env-variable', 'host'],
         ['env-variable', 'port'],
         ['env-variable', 'destination'],
-        ['env-variable', 'count']
+        ['env-variable', 'count'],
+        ['env-variable', 'heartbeat'],
+        ['env-variable', 'reconnect-attempts'],
+        ['env-variable', 'timeout'],
+        ['env-variable', 'archive-dir'],
+        ['env-variable', 'ci-message-file'],
+        ['ci-message-file', 'user'],
+        ['ci-message-file', 'password'],
+        ['ci-message-file', 'selector'],
+        ['ci-message-file', 'host'],
+        ['ci-message-file', 'port'],
+        ['ci-message-file', 'destination'],
+        ['ci-message-file', 'count'],
+        ['ci-message-file', 'heartbeat'],
+        ['ci-message-file', 'reconnect-attempts'],
+        ['ci-message-file', 'timeout'],
+        ['ci-message-file', 'archive-dir']
     ]
     setup_logging(default_path="metamorph/etc/logging.json")
     module = AnsibleModule(argument_spec=messagebus, mutually_exclusive=mutually_exclusive)
     error_message = ""
     ci_message = ""
-    if module.params['env-variable']:
-        ci_message = os.environ.get(module.params['env-variable'], "UNKNOWN")
-        if ci_message == "UNKNOWN":
-            logging.error("Environmental variable not found")
-            error_message = "Environmental variable not found"
+    if module.params['env-variable'] or module.params['ci-message-file']:
         # Need to erase \n in given message. They will cause parsing errors otherwise.
         try:
-            ci_message = json.loads(ci_message.replace('\\n', ''))
+            if module.params['env-variable']:
+                ci_message = load_env_variable(module.params['env-variable'], erase_newlines=True)
+            else:
+                ci_message = load_file(module.params['ci-message-file'], erase_newlines=True)
+        except KeyError:
+            logging.error("Environmental variable not found")
+            error_message = "Environmental variable not found"
+        except IOError as detail:
+            module.fail_json(msg="Unable to read given CI message file. "
+                                 "See detail: '{}'".format(detail))
         except ValueError as detail:
             module.fail_json(msg="Error occurred during json parsing from given environmental "
-                                 "variable. See detail: '{}'".format(detail))
+                                 "variable or file. See detail: '{}'".format(detail))
     elif not (module.params['user'] and module.params['password'] and module.params['host']):
         module.fail_json(msg="Error in argument parsing. Arguments: user, "
                              "password and host are required")
@@ -18,6 +18,14 @@ options:
   pdc-api-url:
     description: 
       - PDC api url
+      - Mutually exclusive with pdc-mirror
+    required: true
+
+  pdc-mirror:
+    description:
+      - Local pdc mirror database created by morph_pdc_mirror.py.
+        Release-components, rpms and rpm-mappings are read from it instead of pdc api.
+      - Mutually exclusive with pdc-api-url
     required: true
 
   ca-cert:
@@ -26,6 +34,19 @@ options:
     required: false
     default: /etc/ssl/certs/ca-bundle.crt
 
+  fields:
+    description:
+      - Dictionary where keys are pdc metadata types and values are lists of fields
+        which will be kept in queried data. Nested fields are separated by dot.
+    required: false
+    default: None
+
+  max-concurrency:
+    description:
+      - Maximal number of concurrent requests to pdc of single component query.
+    required: false
+    default: 10
+
   output:
     description:
       - Output metadata file name where CI Message data will be stored.
@@ -41,6 +62,21 @@ EXAMPLES = '''
   register: result
 
 
+- name: Get only release ids of release-components and linked composes of rpms
+  pdc:
+    component-nvr: "..."
+    pdc-api-url: "..."
+    fields:
+      release-components: ["release.release_id"]
+      rpms: ["linked_composes"]
+  register: result
+
+- name: Get release-components, rpms and rpm-mappings from local pdc mirror
+  pdc:
+    component-nvr: "..."
+    pdc-mirror: "/var/lib/metamorph/pdc.sqlite"
+  register: result
+
 - name: Get pdc metadata verified by given certificate and store it into hello.json
   pdc:
     component-nvr: "..."
@@ -68,8 +104,16 @@ PDC metadata:
 
 import logging
 import logging.config
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 
-from metamorph.lib.support_functions import setup_logging
+from metamorph.lib.nvr import parse_compose_id, parse_nvr
+from metamorph.lib.pagination import AdaptivePageSize, iter_pages
+from metamorph.lib.pdc_mirror import PDCMirror
+from metamorph.lib.rpm_mapping import RpmMappingScheduler
+from metamorph.lib.support_functions import project_fields, setup_logging
 from metamorph.metamorph_plugin import MetamorphPlugin
 from ansible.module_utils.basic import AnsibleModule
 
@@ -83,15 +127,16 @@ class PDCApi(MetamorphPlugin):
     """
     PDCApi class for extracting metadata from pdc
     """
-    pdc_name_mapping = {
-        "bugzilla-components": {"name": '{}'},
-        "global-components": {"name": '{}'},
-        "release-component-contacts": {"component": '^{}$'},
-        "release-component-relationships": {"from_component_name": '{}'},
-        "release-components": {"name": '{}'},
-        "rpms": {"name": '^{}$', "version": '{}', "release": '{}'},
-        "global-component-contacts": {"component": '^{}$'}
-    }
+    # Read-only templates. Query parameters are formatted into new dictionaries for every nvr
+    pdc_name_mapping = MappingProxyType({
+        "bugzilla-components": MappingProxyType({"name": '{}'}),
+        "global-components": MappingProxyType({"name": '{}'}),
+        "release-component-contacts": MappingProxyType({"component": '^{}$'}),
+        "release-component-relationships": MappingProxyType({"from_component_name": '{}'}),
+        "release-components": MappingProxyType({"name": '{}'}),
+        "rpms": MappingProxyType({"name": '^{}$', "version": '{}', "release": '{}'}),
+        "global-component-contacts": MappingProxyType({"component": '^{}$'})
+    })
 
     pdc_param_mapping = {
         "build-image-rtt-tests": "build_nvr",
@@ -103,40 +148,157 @@ class PDCApi(MetamorphPlugin):
         "release": ""
     }
 
-    MAX_QUERIED_DATA_SIZE = 20
+    # Endpoints which are able to project fields by 'fields' query parameter,
+    # fields of other endpoints are projected locally
+    pdc_fields_param_endpoints = frozenset(("global-components", "release-components", "rpms"))
 
-    def __init__(self, pdc_api_url, ca_cert, component_nvr):
+    # Fields needed for rpm-mapping resolution. They are kept in every projection.
+    pdc_required_fields = MappingProxyType({
+        "release-components": ("release.release_id",),
+        "rpms": ("linked_composes",)
+    })
+
+    RECORD_LIMIT = 200
+    MAX_CONCURRENT_PAGES = 10
+
+    def __init__(self, pdc_api_url, ca_cert, component_nvr, fields=None,
+                 max_workers=MAX_CONCURRENT_PAGES, mirror_path=None):
         super().__init__()
         self.pdc_api_url = pdc_api_url
         self.ca_cert = ca_cert
         self.component_nvr = component_nvr
         self.pdc_proxy = None
+        self.fields = self.setup_fields_projection(fields or {})
+        self.page_size = AdaptivePageSize()
+        self.max_workers = max_workers
+        self.mirror = PDCMirror(mirror_path, read_only=True) if mirror_path else None
 
-    def get_pdc_metadata_by_component_name(self, limit=10):
+    def get_pdc_metadata_by_component_name(self, limit=RECORD_LIMIT, component_nvr=None):
         """
         Method for extracting metadata from pdc
-        :param limit -- Limit for amount of queried pages from pdc
+        Method keeps no state between calls, so single instance can serve many nvrs
+        from many threads at once.
+        :param limit -- Limit for amount of queried records of every pdc metadata type
+        :param component_nvr -- Component in nvr format, defaults to nvr given to constructor
 
         :returns -- Dictionary of extracted metadata from pdc
         """
-        component_name, version, release = self.get_component_nvr(self.component_nvr)
-        self.setup_pdc_metadata_params(component_name, version, release)
-        logging.debug("PDC options by component name are {0} ".format(self.pdc_name_mapping))
+        component_name, version, release = self.get_component_nvr(
+            component_nvr or self.component_nvr)
+        if self.mirror is not None:
+            return self.get_pdc_metadata_from_mirror(component_name, version, release, limit)
+        pdc_params = self.setup_pdc_metadata_params(component_name, version, release)
+        logging.debug("PDC options by component name are {0} ".format(pdc_params))
         logging.debug("Connecting to PDC api.")
-        pdc_metadata = {}
-        for pdc_metadata_type in self.pdc_name_mapping:
-            url = "{0}/{1}/?".format(self.pdc_api_url, pdc_metadata_type)
-            metadata = []
-            while url and len(metadata) / self.MAX_QUERIED_DATA_SIZE < limit:
-                queried_data = self.query_api(url, self.pdc_name_mapping[pdc_metadata_type])
-                url = queried_data['next']
-                metadata += queried_data['results']
-            pdc_metadata[pdc_metadata_type] = metadata
+        # All pdc metadata types are paged concurrently. Rpm-mapping of every release id
+        # is queried as soon as it is confirmed by already received pages.
+        # Metadata type threads only wait for their pages. Every request runs in single
+        # request executor, so at most max_workers requests are made at once.
+        with ThreadPoolExecutor(max_workers=len(pdc_params)) as metadata_executor, \
+                ThreadPoolExecutor(max_workers=self.max_workers) as request_executor:
+            scheduler = RpmMappingScheduler(
+                request_executor,
+                lambda release_id: self.query_rpm_mapping(release_id, component_name),
+                self.get_release_id_from_compose)
+            page_handlers = {
+                "release-components": scheduler.add_release_components,
+                "rpms": scheduler.add_rpms
+            }
+            futures = {
+                pdc_metadata_type: metadata_executor.submit(
+                    self.query_metadata_type, pdc_metadata_type, url_options, limit,
+                    page_handlers.get(pdc_metadata_type), request_executor)
+                for pdc_metadata_type, url_options in pdc_params.items()}
+            pdc_metadata = {pdc_metadata_type: future.result()
+                            for pdc_metadata_type, future in futures.items()}
+            pdc_metadata['rpm-mapping'] = scheduler.get_rpm_mappings()
+        return pdc_metadata
+
+    def query_metadata_type(self, pdc_metadata_type, url_options, limit, page_handler=None,
+                            executor=None):
+        """
+        Method for querying all records of single pdc metadata type
+        :param pdc_metadata_type -- Name of pdc metadata type
+        :param url_options -- Query options of given pdc metadata type
+        :param limit -- Limit for amount of queried records
+        :param page_handler -- function called with every (projected) page of records
+        :param executor -- executor which runs page queries, see iter_all_pages
+
+        :returns -- List of queried records
+        """
+        url = "{0}/{1}/?".format(self.pdc_api_url, pdc_metadata_type)
+        url_options, local_fields = self.get_fields_options(pdc_metadata_type, url_options)
+        metadata = []
+        for page_results in self.iter_all_pages(url, url_options, limit, executor):
+            if local_fields:
+                page_results = [project_fields(result, local_fields) for result in page_results]
+            if page_handler is not None:
+                page_handler(page_results)
+            metadata += page_results
+        return metadata
+
+    def get_pdc_metadata_from_mirror(self, component_name, version, release, limit):
+        """
+        Method for extracting metadata from local pdc mirror
+        Mirror contains only release-components, rpms and rpm-mappings.
+        :param component_name -- Component name
+        :param version -- Component version
+        :param release -- Component release
+        :param limit -- Limit for amount of returned records of every pdc metadata type
+
+        :returns -- Dictionary of extracted metadata from pdc mirror
+        """
+        logging.debug("Reading PDC metadata from mirror '{}'.".format(self.mirror.database_path))
+        pdc_metadata = {
+            'release-components': self.mirror.get_release_components(component_name, limit),
+            'rpms': self.mirror.get_rpms(component_name, version, release, limit)
+        }
+        for pdc_metadata_type, field_paths in self.fields.items():
+            if pdc_metadata_type in pdc_metadata:
+                pdc_metadata[pdc_metadata_type] = [project_fields(result, field_paths)
+                                                   for result in pdc_metadata[pdc_metadata_type]]
         pdc_metadata['rpm-mapping'] = self.get_rpm_mappings(component_name,
                                                             pdc_metadata['release-components'],
                                                             pdc_metadata['rpms'])
         return pdc_metadata
 
+    def iter_all_pages(self, url, url_options, limit, executor=None):
+        """
+        Method for iterating pages of paginated pdc list endpoint
+        Total count from first page is used to query all remaining pages concurrently.
+        Size of requested pages is tuned by response latency.
+        :param url -- pdc list endpoint url
+        :param url_options -- query options
+        :param limit -- Limit for amount of queried records
+        :param executor -- executor which runs page queries, it may be shared by many
+                           queries. Own executor with max_workers threads is used by default.
+
+        :returns -- Iterator of lists of records of single page
+        """
+        def query_page(page, page_size):
+            start = time.monotonic()
+            queried_data = self.query_api(url, dict(url_options, page=page, page_size=page_size))
+            self.page_size.observe(time.monotonic() - start, len(queried_data['results']),
+                                   page_size, bool(queried_data['next']))
+            return queried_data['results'], queried_data.get('count'), bool(queried_data['next'])
+
+        return iter_pages(query_page, self.page_size.size, limit, self.max_workers, first_page=1,
+                          executor=executor)
+
+    def query_all_pages(self, url, url_options, limit):
+        """
+        Method for querying paginated pdc list endpoint. See iter_all_pages for details.
+        :param url -- pdc list endpoint url
+        :param url_options -- query options
+        :param limit -- Limit for amount of queried records
+
+        :returns -- List of queried records
+        """
+        results = []
+        for page_results in self.iter_all_pages(url, url_options, limit):
+            results += page_results
+        return results
+
     def get_rpm_mappings(self, component_name, release_components, rpms):
         """
         Method for getting rpm-mappings metadata from pdc
@@ -149,12 +311,25 @@ class PDCApi(MetamorphPlugin):
         release_ids = self.get_release_ids(release_components, rpms)
         rpm_mappings = dict()
         for release_id in release_ids:
-            rpm_mapping_url = "{0}/releases/{1}/rpm-mapping/{2}/?".format(self.pdc_api_url,
-                                                                          release_id,
-                                                                          component_name)
-            rpm_mappings[release_id] = self.query_api(rpm_mapping_url)
+            if self.mirror is not None:
+                rpm_mappings[release_id] = self.mirror.get_rpm_mapping(release_id, component_name)
+                continue
+            rpm_mappings[release_id] = self.query_rpm_mapping(release_id, component_name)
         return rpm_mappings
 
+    def query_rpm_mapping(self, release_id, component_name):
+        """
+        Method for querying rpm-mapping of component in given release from pdc
+        :param release_id -- pdc release id
+        :param component_name -- Name of given component
+
+        :returns rpm-mapping data
+        """
+        rpm_mapping_url = "{0}/releases/{1}/rpm-mapping/{2}/?".format(self.pdc_api_url,
+                                                                      release_id,
+                                                                      component_name)
+        return self.query_api(rpm_mapping_url)
+
     def get_release_ids(self, release_components, rpms):
         """
         Method for release_ids extraction
@@ -188,20 +363,66 @@ class PDCApi(MetamorphPlugin):
 
         :returns String which contains release_id parsed from compose name
         """
-        splitted_compose = compose.split('-')
-        return splitted_compose[0].lower() + '-' + splitted_compose[1]
+        return parse_compose_id(compose).release_id
+
+    def setup_fields_projection(self, fields):
+        """
+        Method for fields projection setup. Fields needed by rpm-mapping resolution are added.
+        :param fields -- Dictionary where keys are pdc metadata types and values are lists
+                         of wanted fields. Nested fields are separated by dot.
+
+        :returns Dictionary of tuples of wanted fields for every projected pdc metadata type
+        """
+        projection = {}
+        for pdc_metadata_type, field_paths in fields.items():
+            if pdc_metadata_type not in self.pdc_name_mapping:
+                raise PDCApiException("Unknown pdc metadata type {}".format(pdc_metadata_type))
+            if isinstance(field_paths, str):
+                field_paths = field_paths.split(',')
+            field_paths = list(field_paths)
+            for required_field in self.pdc_required_fields.get(pdc_metadata_type, ()):
+                if required_field not in field_paths:
+                    field_paths.append(required_field)
+            projection[pdc_metadata_type] = tuple(field_paths)
+        return projection
+
+    def get_fields_options(self, pdc_metadata_type, url_options):
+        """
+        Method for adding fields projection into query options of given pdc metadata type
+        Top level fields are projected by pdc api when it is supported.
+        Nested fields are projected locally while results are streamed.
+        :param pdc_metadata_type -- Name of pdc metadata type
+        :param url_options -- Query options of given pdc metadata type
+
+        :returns tuple which contain query options and tuple of locally projected fields
+        """
+        field_paths = self.fields.get(pdc_metadata_type)
+        if not field_paths:
+            return url_options, ()
+        if pdc_metadata_type not in self.pdc_fields_param_endpoints:
+            return url_options, field_paths
+        url_options = dict(url_options)
+        url_options['fields'] = sorted({field_path.split('.')[0] for field_path in field_paths})
+        if any('.' in field_path for field_path in field_paths):
+            return url_options, field_paths
+        return url_options, ()
 
     def setup_pdc_metadata_params(self, name, version, release):
         """
         Method for pdc metadata parameters setup with given data
+        Parameters are formatted from pdc_name_mapping templates which stay untouched.
         :param name -- Component name
         :param version -- Component version
         :param release -- Component release
+
+        :returns Dictionary of query parameters for every pdc metadata type
         """
-        for pdc_metadata_type in self.pdc_name_mapping:
-            for param, param_value in self.pdc_name_mapping[pdc_metadata_type].items():
-                self.pdc_name_mapping[pdc_metadata_type][param] = param_value.format(
-                    self.get_param_value(param, name, version, release))
+        pdc_params = {}
+        for pdc_metadata_type, params in self.pdc_name_mapping.items():
+            pdc_params[pdc_metadata_type] = {
+                param: param_value.format(self.get_param_value(param, name, version, release))
+                for param, param_value in params.items()}
+        return pdc_params
 
     def get_param_value(self, param, name, version, release):
         """
@@ -261,26 +482,28 @@ class PDCApi(MetamorphPlugin):
 
         :returns tuple which contain component_name, version and release
         """
-        splitted_name = component_nvr.split("-")
-        component_name = ''
-        for name in splitted_name[:-2]:
-            component_name += name + '-'
-        return component_name[:-1], splitted_name[-2], splitted_name[-1]
+        return parse_nvr(component_nvr)
 
 
 def main():
     """Main function which manages plugin behavior"""
     pdc_arguments = {
         "component-nvr": {"type": "str", 'required': True},
-        "pdc-api-url": {"type": "str", 'required': True},
+        "pdc-api-url": {"type": "str"},
+        "pdc-mirror": {"type": "str"},
         "ca-cert": {"type": "str", 'default': '/etc/ssl/certs/ca-bundle.crt'},
+        "fields": {"type": "dict"},
+        "max-concurrency": {"type": "int", "default": PDCApi.MAX_CONCURRENT_PAGES},
         "output": {"type": "str", "default": "metamorph.json"}
     }
 
     setup_logging(default_path="metamorph/etc/logging.json")
-    module = AnsibleModule(argument_spec=pdc_arguments)
+    module = AnsibleModule(argument_spec=pdc_arguments,
+                           mutually_exclusive=[['pdc-api-url', 'pdc-mirror']],
+                           required_one_of=[['pdc-api-url', 'pdc-mirror']])
     client = PDCApi(module.params['pdc-api-url'], module.params['ca-cert'],
-                    module.params['component-nvr'])
+                    module.params['component-nvr'], module.params['fields'],
+                    module.params['max-concurrency'], module.params['pdc-mirror'])
     pdc_metadata = client.get_pdc_metadata_by_component_name()
     client.write_json_file(dict(pdc=dict(results=pdc_metadata)), module.params['output'])
     module.exit_json(changed=True, meta=dict(pdc=pdc_metadata))
@@ -44,10 +44,19 @@ class MetamorphPlugin(object):
             raise LookupError('Destination path "{}" was not found. '
                               'Please check destination output path'.format(destination))
 
+    @staticmethod
+    def write_yaml_documents(output_documents, destination):
+        try:
+            with open(destination, 'w') as destination_fp:
+                yaml.dump_all(output_documents, destination_fp)
+        except IOError:
+            raise LookupError('Destination path "{}" was not found. '
+                              'Please check destination output path'.format(destination))
+
     @staticmethod
     def read_yaml_file(input_file):
         with open(input_file, "r") as message:
-            return yaml.load(message)
+            return yaml.safe_load(message)
 
     def query_api(self, url, url_options=dict, attempt=0, ca_cert='/etc/ssl/certs/ca-bundle.crt'):
         """
@@ -70,7 +79,38 @@ class MetamorphPlugin(object):
                              "Trying again after one minute.".format(url))
                 attempt += 1
                 time.sleep(60)  # Sleeping for one minute
-                self.query_api(url, url_options, attempt, ca_cert)
+                return self.query_api(url, url_options, attempt, ca_cert)
             else:
                 logging.error("ERROR: Unable to access url '{0}' with given options '{1}'.".format(url, url_options))
                 logging.error("ERROR: {0}".format(detail.args))
+
+    def query_api_conditional(self, url, url_options, etag=None, last_modified=None,
+                              ca_cert='/etc/ssl/certs/ca-bundle.crt'):
+        """
+        This method queries given url only when its content changed since previous query.
+        Unchanged content is not downloaded at all (HTTP 304 Not Modified).
+
+        :param url -- api url
+        :param url_options -- dictionary of wanted options
+        :param etag -- ETag header of previous response
+        :param last_modified -- Last-Modified header of previous response
+        :param ca_cert -- path to certificates to verify url
+
+        :returns -- tuple of queried data (None when content is not modified or query failed),
+                    ETag and Last-Modified headers for next query
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            response = requests.get(url, params=url_options, headers=headers, verify=ca_cert)
+            if response.status_code == requests.codes.not_modified:
+                return None, etag, last_modified
+            response.raise_for_status()
+            return (response.json(), response.headers.get('ETag'),
+                    response.headers.get('Last-Modified'))
+        except requests.RequestException as detail:
+            logging.warning("Unable to access url '{0}': {1}".format(url, detail))
+            return None, etag, last_modified
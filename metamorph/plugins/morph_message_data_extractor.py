@@ -1,6 +1,9 @@
 #!/usr/bin/python
 import argparse
+import json
 import logging
+import multiprocessing
+import os
 import traceback
 
 from metamorph.lib.support_functions import setup_logging
@@ -95,6 +98,84 @@ class MessageDataExtractor(MetamorphPlugin):
             message['header'].get('package') is not None
 
 
+def extract_message_data(source_item):
+    """
+    Function for validating and extracting data from single CI message in bulk mode.
+    It runs in worker process, so CI message is parsed there too.
+
+    :param source_item -- tuple of CI message source and its json text. Text is None when
+                          source is standalone CI message file.
+
+    :return Tuple of CI message source, boolean whether message is valid and extracted metadata
+            or reason of rejection
+    """
+    source, ci_message_text = source_item
+    extractor = MessageDataExtractor(source)
+    try:
+        if ci_message_text is None:
+            extractor.ci_message = extractor.read_json_file(source)
+        else:
+            extractor.ci_message = json.loads(ci_message_text)
+        if not extractor.check_valid_ci_message():
+            return source, False, "Given CI_message does not contain important data."
+        return source, True, extractor.get_build_data()
+    except (IOError, ValueError) as detail:
+        return source, False, "Failed to parse CI message: {}".format(detail)
+    except KeyError as key_detail:
+        return source, False, "Given CI_message does not contain important key values. " \
+                              "Missing key value: {}".format(key_detail)
+    except (TypeError, AttributeError) as detail:
+        return source, False, "Given CI_message has unexpected format: {}".format(detail)
+
+
+def iter_ci_messages(ci_messages_path):
+    """
+    Generator of CI messages for bulk extraction
+
+    :param ci_messages_path -- directory of CI message .json files or file with one
+                               CI message per line (JSONL)
+
+    :yield Tuple of CI message source and its json text (None for standalone files)
+    """
+    if os.path.isdir(ci_messages_path):
+        for file_name in sorted(os.listdir(ci_messages_path)):
+            if file_name.endswith('.json'):
+                yield os.path.join(ci_messages_path, file_name), None
+    else:
+        with open(ci_messages_path) as ci_messages:
+            for line_number, line in enumerate(ci_messages, 1):
+                if line.strip():
+                    yield "{0}:{1}".format(ci_messages_path, line_number), line
+
+
+def bulk_extract(ci_messages_path, output, rejected_output, processes=None, chunksize=256):
+    """
+    Function for extracting data from many CI messages across process pool
+
+    :param ci_messages_path -- directory of CI message .json files or JSONL file
+    :param output -- JSONL file where extracted metadata will be stored
+    :param rejected_output -- JSONL file where rejected CI messages report will be stored
+    :param processes -- number of worker processes, defaults to number of cpus
+    :param chunksize -- number of CI messages sent to worker at once
+
+    :return Tuple of extracted and rejected CI messages counts
+    """
+    extracted = rejected = 0
+    with multiprocessing.Pool(processes) as pool, \
+            open(output, 'w') as output_file, open(rejected_output, 'w') as rejected_file:
+        for source, is_valid, data in pool.imap(extract_message_data,
+                                                iter_ci_messages(ci_messages_path), chunksize):
+            if is_valid:
+                extracted += 1
+                output_file.write(json.dumps(dict(source=source, ci_message_data=data)) + '\n')
+            else:
+                rejected += 1
+                rejected_file.write(json.dumps(dict(source=source, reason=data)) + '\n')
+    logging.info("Extracted {0} CI message(s), rejected {1}. See '{2}' for rejected CI "
+                 "messages.".format(extracted, rejected, rejected_output))
+    return extracted, rejected
+
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(
@@ -103,7 +184,26 @@ def parse_args():
     parser.add_argument(
         'ci_message',
         metavar='<ci-message>',
-        help='Input CI message in json format.'
+        help='Input CI message in json format. In bulk mode directory of CI messages '
+             'or file with one CI message per line.'
+    )
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help='Extract data from many CI messages in parallel. Extracted metadata are written '
+             'into output file one per line.'
+    )
+    parser.add_argument(
+        '--rejected-output',
+        metavar='<rejected-messages-file>',
+        default='rejected_messages.jsonl',
+        help='File name where report of rejected CI messages will be stored in bulk mode'
+    )
+    parser.add_argument(
+        '--processes',
+        metavar='<processes>',
+        type=int,
+        help='Number of worker processes in bulk mode. Defaults to number of cpus.'
     )
     parser.add_argument(
         '--output',
@@ -118,6 +218,9 @@ def main():
     """Main function which manages plugin behavior"""
     setup_logging(default_path="etc/logging.json")
     args = parse_args()
+    if args.bulk:
+        bulk_extract(args.ci_message, args.output, args.rejected_output, args.processes)
+        return
     data_extractor = MessageDataExtractor(args.ci_message)
     ci_message_data = data_extractor.get_ci_message_data()
     data_extractor.write_json_file(dict(ci_message_data=ci_message_data), args.output)
@@ -1,13 +1,17 @@
 #!/usr/bin/python
 import argparse
+import itertools
 import logging
 import logging.config
+import socket
+import threading
 import time
-import os
-import json
 
 import stomp
+import stomp.exception
 
+from metamorph.lib.json_stream import load_env_variable, load_file
+from metamorph.lib.message_archive import MessageArchive
 from metamorph.lib.support_functions import setup_logging
 from metamorph.metamorph_plugin import MetamorphPlugin
 
@@ -20,33 +24,71 @@ def messagebus_run(args):
 
     :return Dictionary which contain CI message/s
     """
-    conn = stomp.Connection([(args.host, args.port)])
-    listener = CIListener(args.count)
-    conn.set_listener('CI Listener', listener)
-    conn.start()
-    conn.connect(login=args.user, passcode=args.password)
-    if args.selector:
-        conn.subscribe(
-            destination=args.destination,
-            id='1',
-            ack='auto',
-            headers={'selector': args.selector}
-        )
-    else:
-        conn.subscribe(
-            destination=args.destination,
-            id='1',
-            ack='auto'
-        )
+    multiplexer = MessageBusMultiplexer(get_host_and_ports(args.host, args.port),
+                                        args.user, args.password,
+                                        heartbeats=(args.heartbeat, args.heartbeat),
+                                        reconnect_attempts=args.reconnect_attempts)
+    multiplexer.connect()
+    subscription = multiplexer.subscribe(args.destination, args.selector, args.count)
     logging.info("Connection to message bus established.")
     logging.info("Waiting for CI message to arrive ...")
-    while (not listener.error_message) and len(listener.metamorph_data) < args.count:
-        logging.debug("Waiting 1s for CI message to arrive")
-        time.sleep(1)
-    conn.disconnect()
-    if listener.error_message:
-        exit("Got error message through message bus {0}".format(listener.error_message))
-    return listener.metamorph_data[:args.count]
+    error_message, metamorph_data = subscription.wait(args.timeout or None)
+    multiplexer.disconnect()
+    if error_message:
+        exit("Got error message through message bus {0}".format(error_message))
+    if args.archive_dir:
+        archive_messages(metamorph_data, args.archive_dir)
+    return metamorph_data
+
+
+def archive_messages(ci_messages, archive_dir):
+    """
+    Method for storing received CI messages into message archive
+
+    :param ci_messages -- list of received CI messages
+    :param archive_dir -- message archive directory
+    """
+    archive = MessageArchive(archive_dir)
+    for ci_message in ci_messages:
+        archive.append(ci_message)
+    logging.info("{0} CI message(s) stored into archive '{1}'".format(len(ci_messages),
+                                                                      archive_dir))
+
+
+def archive_run(args):
+    """
+    Method for extracting CI message/s from message archive
+
+    :param args -- command line arguments
+
+    :return List which contain CI message/s
+    """
+    with MessageArchive(args.archive_dir) as archive:
+        if args.message_id:
+            ci_message = archive.find_by_message_id(args.message_id)
+            ci_messages = [ci_message] if ci_message is not None else []
+        else:
+            ci_messages = archive.find_by_nvr(args.nvr)
+    if not ci_messages:
+        logging.error("No CI message was found in archive '{}'".format(args.archive_dir))
+        exit(1)
+    return ci_messages
+
+
+def get_host_and_ports(hosts, default_port):
+    """
+    Method for parsing comma separated list of message bus hosts
+
+    :param hosts -- hosts in 'host[:port],host[:port]' format
+    :param default_port -- port used for hosts without given port
+
+    :return List of (host, port) tuples
+    """
+    host_and_ports = []
+    for host in hosts.split(','):
+        host, _, port = host.strip().partition(':')
+        host_and_ports.append((host, int(port) if port else default_port))
+    return host_and_ports
 
 
 def env_run(args):
@@ -57,13 +99,24 @@ def env_run(args):
 
     :return Dictionary which contain CI message/s
     """
-    env_data = os.environ.get(args.env_variable, "UNKNOWN")
-    if env_data == "UNKNOWN":
+    # Need to erase \n in given message. They will cause parsing errors otherwise.
+    try:
+        return load_env_variable(args.env_variable, erase_newlines=True)
+    except KeyError:
         logging.error("Environmental variable not found")
         exit(1)
+
+
+def file_run(args):
+    """
+    Method for extracting CI message/s from file or standard input
+
+    :param args -- command line arguments
+
+    :return Dictionary which contain CI message/s
+    """
     # Need to erase \n in given message. They will cause parsing errors otherwise.
-    env_data = env_data.replace('\\n', '')
-    return json.loads(env_data)
+    return load_file(args.ci_message_file, erase_newlines=True)
 
 
 def parse_args():
@@ -73,6 +126,8 @@ def parse_args():
     )
     subparser = parser.add_subparsers()
     env = subparser.add_parser('env')
+    ci_message_file = subparser.add_parser('file')
+    archive = subparser.add_parser('archive')
     messagebus = subparser.add_parser('message')
     messagebus.add_argument(
         '--user',
@@ -99,7 +154,8 @@ def parse_args():
         dest='host',
         metavar='<host>',
         required=True,
-        help='Message bus host.'
+        help='Message bus host. Comma separated list of failover hosts '
+             'in host[:port] format is accepted too.'
     )
     messagebus.add_argument(
         '--port',
@@ -124,6 +180,36 @@ def parse_args():
         default=1,
         help='Limit number of messages to catch.'
     )
+    messagebus.add_argument(
+        '--heartbeat',
+        dest='heartbeat',
+        metavar='<milliseconds>',
+        type=int,
+        default=10000,
+        help='STOMP heartbeat interval. Zero disables heartbeats.'
+    )
+    messagebus.add_argument(
+        '--reconnect-attempts',
+        dest='reconnect_attempts',
+        metavar='<attempts>',
+        type=int,
+        default=5,
+        help='Number of reconnect attempts after lost connection.'
+    )
+    messagebus.add_argument(
+        '--timeout',
+        dest='timeout',
+        metavar='<seconds>',
+        type=int,
+        default=3600,
+        help='Maximal time to wait for CI messages. Zero waits without limit.'
+    )
+    messagebus.add_argument(
+        '--archive-dir',
+        dest='archive_dir',
+        metavar='<archive-dir>',
+        help='Message archive directory where received CI messages will be stored too.'
+    )
     messagebus.add_argument(
         '--output',
         metavar='<output-metadata-file>',
@@ -145,25 +231,333 @@ def parse_args():
         help='Output metadata file name where CI Message data will be stored',
         nargs='?')
     env.set_defaults(func=env_run)
+    ci_message_file.add_argument(
+        '--ci-message-file',
+        metavar='<path>',
+        type=str,
+        required=True,
+        help="Path to file which contains CI message in .json format. '-' reads standard input."
+    )
+    ci_message_file.add_argument(
+        '--output',
+        metavar='<output-metadata-file>',
+        default='metamorph.json',
+        help='Output metadata file name where CI Message data will be stored',
+        nargs='?')
+    ci_message_file.set_defaults(func=file_run)
+    archive.add_argument(
+        '--archive-dir',
+        metavar='<archive-dir>',
+        required=True,
+        help='Message archive directory.'
+    )
+    archive_key = archive.add_mutually_exclusive_group(required=True)
+    archive_key.add_argument(
+        '--nvr',
+        metavar='<nvr>',
+        help='Find CI messages of component in nvr format.'
+    )
+    archive_key.add_argument(
+        '--message-id',
+        metavar='<message-id>',
+        help='Find CI message by its message bus message-id.'
+    )
+    archive.add_argument(
+        '--output',
+        metavar='<output-metadata-file>',
+        default='metamorph.json',
+        help='Output metadata file name where CI Message data will be stored',
+        nargs='?')
+    archive.set_defaults(func=archive_run)
     return parser.parse_args()
 
 
-class CIListener(stomp.ConnectionListener):
-    """CIListener class manages connection and extraction of CI messages"""
+class Subscription(object):
+    """Subscription class holds state of single logical subscription on shared connection"""
 
-    def __init__(self, count):
+    def __init__(self, subscription_id, destination, selector=None, count=1):
+        self.subscription_id = subscription_id
+        self.destination = destination
+        self.selector = selector
         self.count = count
         self.metamorph_data = []
         self.error_message = {}
+        self.finished = threading.Event()
 
-    def on_error(self, headers, message):
+    def get_headers(self):
+        """
+        Method for getting subscribe frame headers of this subscription
+
+        :return Dictionary of subscribe headers
+        """
+        if self.selector:
+            return {'selector': self.selector}
+        return {}
+
+    def deliver(self, headers, message):
+        """
+        Method for storing received CI message
+
+        :param headers -- message headers
+        :param message -- message body
+        """
+        if len(self.metamorph_data) < self.count:
+            self.metamorph_data.append({"header": headers, "message": message})
+        if len(self.metamorph_data) >= self.count:
+            self.finished.set()
+
+    def fail(self, headers, message):
+        """
+        Method for storing received error message. Waiting for messages is finished.
+
+        :param headers -- error message headers
+        :param message -- error message body
+        """
         self.error_message['headers'] = headers
         self.error_message['message'] = message
+        self.finished.set()
+
+    def wait(self, timeout=None):
+        """
+        Method for waiting until wanted count of CI messages or an error message arrives
+
+        :param timeout -- maximal time in seconds to wait, None means wait without limit
+
+        :return Tuple of error message and list of received CI messages. Error message
+                is set when wanted count of CI messages did not arrive in time.
+        """
+        if not self.finished.wait(timeout):
+            return {'headers': {}, 'message': "Only {0} of {1} CI messages arrived in {2} "
+                                              "seconds".format(len(self.metamorph_data),
+                                                               self.count, timeout)}, \
+                self.metamorph_data[:self.count]
+        return self.error_message, self.metamorph_data[:self.count]
+
+
+class MessageBusMultiplexer(stomp.ConnectionListener):
+    """
+    MessageBusMultiplexer class shares single message bus connection between many subscriptions.
+    Every subscription has its own selector, message count and result delivery, so any number
+    of waiting jobs (e.g. threads of daemon or pipeline) costs just one broker connection.
+    Broker liveness is checked by STOMP heartbeats. Lost connection is re-established to the
+    fastest reachable broker and all active subscriptions are subscribed again.
+    """
+    HOST_PROBE_TIMEOUT = 2  # Seconds for measuring broker connect latency
+
+    def __init__(self, host_and_ports, user, password, heartbeats=(10000, 10000),
+                 reconnect_attempts=5, reconnect_delay=1):
+        self.host_and_ports = host_and_ports
+        self.user = user
+        self.password = password
+        self.heartbeats = heartbeats
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.subscriptions = {}
+        self.subscription_ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.closing = False
+        self.reconnecting = False
+        self.conn = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.disconnect()
+
+    def connect(self):
+        """
+        Method for establishing connection to the fastest reachable message bus host
+        Connection is attempted reconnect_attempts times at most, last error is raised.
+        """
+        with self.lock:
+            self.closing = False
+        detail = self.open_connection_with_retries()
+        if detail is not None:
+            raise detail
+
+    def disconnect(self):
+        """Method for closing connection to message bus"""
+        with self.lock:
+            self.closing = True
+            conn, self.conn = self.conn, None
+        if conn is not None:
+            self.close_connection(conn)
+
+    def open_connection(self):
+        """
+        Method for single attempt to open new connection, previous connection is closed first.
+        Stomp makes single connect attempt only, so retries of this class are not multiplied
+        by its own reconnect attempts.
+
+        :return False when multiplexer was closed meanwhile, True otherwise
+        """
+        with self.lock:
+            if self.closing:
+                return False
+            old_conn, self.conn = self.conn, None
+        if old_conn is not None:
+            self.close_connection(old_conn)
+        conn = stomp.Connection(self.order_hosts_by_latency(self.host_and_ports),
+                                heartbeats=self.heartbeats,
+                                reconnect_attempts_max=1)
+        conn.set_listener('CI Multiplexer', self)
+        try:
+            conn.start()
+            conn.connect(login=self.user, passcode=self.password, wait=True)
+        except (stomp.exception.StompException, OSError):
+            # Started connection would keep its receiver thread on every failed attempt
+            self.close_connection(conn)
+            raise
+        with self.lock:
+            closing = self.closing
+            if not closing:
+                self.conn = conn
+        if closing:
+            self.close_connection(conn)
+            return False
+        return True
+
+    def open_connection_with_retries(self):
+        """
+        Method for opening new connection with at most reconnect_attempts attempts
+
+        :return None when connection was opened (or multiplexer was closed), otherwise
+                exception of last attempt
+        """
+        detail = None
+        attempts = max(self.reconnect_attempts, 1)
+        for attempt in range(1, attempts + 1):
+            try:
+                self.open_connection()
+                return None
+            except (stomp.exception.StompException, OSError) as error:
+                detail = error
+                logging.warning("Connect attempt {0}/{1} failed: {2}".format(
+                    attempt, attempts, detail))
+                time.sleep(self.reconnect_delay)
+        return detail
+
+    @staticmethod
+    def close_connection(conn):
+        """
+        Method for closing connection which may be already broken
+
+        :param conn -- stomp connection
+        """
+        try:
+            conn.disconnect()
+        except (stomp.exception.StompException, OSError) as detail:
+            logging.debug("Closing of message bus connection failed: {}".format(detail))
+
+    def reconnect(self):
+        """
+        Method for re-establishing lost connection and subscribing all active subscriptions again.
+        When no broker is reachable, all active subscriptions are failed so no job waits forever.
+        """
+        try:
+            if self.open_connection_with_retries() is not None:
+                self.on_error({}, "Connection to message bus was lost and could not be "
+                                  "re-established.")
+                return
+            with self.lock:
+                if self.closing or self.conn is None:
+                    return
+                conn = self.conn
+                subscriptions = list(self.subscriptions.values())
+            for subscription in subscriptions:
+                conn.subscribe(destination=subscription.destination,
+                               id=subscription.subscription_id,
+                               ack='auto', headers=subscription.get_headers())
+            logging.info("Connection to message bus re-established, {} subscription(s) "
+                         "renewed.".format(len(subscriptions)))
+        finally:
+            with self.lock:
+                self.reconnecting = False
+
+    @classmethod
+    def order_hosts_by_latency(cls, host_and_ports):
+        """
+        Method for ordering message bus hosts by their connect latency.
+        Unreachable hosts are kept at the end in their original order.
+
+        :param host_and_ports -- list of (host, port) tuples
+
+        :return List of (host, port) tuples
+        """
+        if len(host_and_ports) < 2:
+            return list(host_and_ports)
+        latencies = []
+        for index, host_and_port in enumerate(host_and_ports):
+            start = time.monotonic()
+            try:
+                socket.create_connection(host_and_port, timeout=cls.HOST_PROBE_TIMEOUT).close()
+                latencies.append((time.monotonic() - start, index, host_and_port))
+            except OSError:
+                latencies.append((float('inf'), index, host_and_port))
+        return [host_and_port for _, _, host_and_port in sorted(latencies)]
+
+    def subscribe(self, destination, selector=None, count=1):
+        """
+        Method for adding new subscription to shared connection
+
+        :param destination -- message bus topic/subscription
+        :param selector -- JMS selector for filtering messages
+        :param count -- limit number of messages to catch
+
+        :return Subscription object which delivers received CI messages
+        """
+        with self.lock:
+            subscription = Subscription(str(next(self.subscription_ids)), destination,
+                                        selector, count)
+            self.subscriptions[subscription.subscription_id] = subscription
+        self.conn.subscribe(destination=destination, id=subscription.subscription_id,
+                            ack='auto', headers=subscription.get_headers())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Method for removing subscription from shared connection
+
+        :param subscription -- Subscription object
+        """
+        with self.lock:
+            if self.subscriptions.pop(subscription.subscription_id, None) is None:
+                return
+        if self.conn is not None:
+            self.conn.unsubscribe(id=subscription.subscription_id)
+
+    def on_error(self, headers, message):
+        # Error frames are related to whole connection, so every waiting subscription is failed
+        with self.lock:
+            subscriptions = list(self.subscriptions.values())
+        for subscription in subscriptions:
+            subscription.fail(headers, message)
+
+    def on_disconnected(self):
+        with self.lock:
+            # Disconnection of replaced connection during reconnect is expected
+            if self.closing or self.reconnecting:
+                return
+            self.reconnecting = True
+        logging.warning("Connection to message bus was lost. Reconnecting ...")
+        # Listener callbacks run in receiver thread which must not wait for new connection
+        threading.Thread(target=self.reconnect, name='CI Multiplexer reconnect',
+                         daemon=True).start()
+
+    def on_heartbeat_timeout(self):
+        logging.warning("Message bus heartbeat timed out.")
 
     def on_message(self, headers, message):
-        if self.count > len(self.metamorph_data):
-            self.count += 1
-            self.metamorph_data.append({"header": headers, "message": message})
+        with self.lock:
+            subscription = self.subscriptions.get(headers.get('subscription'))
+        if subscription is None:
+            logging.debug("Received message for unknown subscription: {}".format(headers))
+            return
+        subscription.deliver(headers, message)
+        if subscription.finished.is_set():
+            self.unsubscribe(subscription)
 
 
 def main():
@@ -177,11 +571,13 @@ def main():
         if "\'Namespace\' object has no attribute \'func\'".startswith(exc.__str__()):
             logging.warning("You need to specify input. Please run: \"morph_messagehub.py --help\" "
                             "for more information")
-        try:
-            if args.env_variable:
-                logging.error("ERROR during parsing json data from environmental variable. "
-                              "Please check provided data or given environmental variable itself.")
-        except AttributeError:
+        if getattr(args, 'env_variable', None):
+            logging.error("ERROR during parsing json data from environmental variable. "
+                          "Please check provided data or given environmental variable itself.")
+        elif getattr(args, 'ci_message_file', None):
+            logging.error("ERROR during parsing json data from given CI message file. "
+                          "Please check provided data or given file itself.")
+        else:
             logging.error("Error with function parsing. If this is a bug make an issue in "
                           "github repo.\n Message: {0}".format(exc))
         exit(1)
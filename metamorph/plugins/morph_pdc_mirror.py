@@ -0,0 +1,277 @@
+#!/usr/bin/python
+import argparse
+import json
+import logging
+import logging.config
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from metamorph.lib.pdc_mirror import PDCMirror
+from metamorph.lib.support_functions import setup_logging
+from metamorph.plugins.morph_pdc import PDCApi
+
+
+class PDCMirrorExporter(object):
+    """
+    PDCMirrorExporter class bulk-exports pdc release-components, rpms and rpm-mappings
+    into local pdc mirror
+    """
+
+    # Changeset resource names of mirrored pdc metadata types
+    changeset_resources = {
+        "releasecomponent": "release-components",
+        "rpm": "rpms"
+    }
+
+    def __init__(self, client, mirror):
+        self.client = client
+        self.mirror = mirror
+
+    def export(self, components=None):
+        """
+        Method for exporting pdc metadata into mirror
+        Mirrored records of exported components are replaced by exported ones.
+        :param components -- List of exported component names, all components when not given
+        """
+        # Newest change is taken before export, so changes made during export are synchronized
+        # later. Server time is used, local clock skew would hide changes.
+        last_change = self.get_last_change()
+        # Export is single transaction, failed export leaves previous mirror and its last_sync
+        with self.mirror.transaction():
+            self.mirror.delete_components(components)  # Records deleted in pdc are not kept
+            for component in components or [None]:
+                release_components = self.export_endpoint(
+                    "release-components", {"name": component} if component else {},
+                    self.mirror.store_release_components)
+                rpms = self.export_endpoint(
+                    "rpms", {"name": '^{}$'.format(component)} if component else {},
+                    self.mirror.store_rpms)
+                logging.info("Exported {0} release-components and {1} rpms{2}.".format(
+                    release_components, rpms, " of '{}'".format(component) if component else ""))
+            rpm_mappings = self.export_rpm_mappings(components)
+            logging.info("Exported {} rpm-mappings.".format(rpm_mappings))
+            self.mirror.set_state('components', json.dumps(components or []))
+            self.mirror.set_state('last_sync', last_change)
+
+    def sync(self):
+        """
+        Method for incremental synchronization of mirror
+        Only records changed since last synchronization are queried. They are found by pdc
+        changesets. All changes are applied in single transaction.
+        """
+        last_sync = self.mirror.get_state('last_sync')
+        components = json.loads(self.mirror.get_state('components', '[]'))
+        if last_sync is None:
+            logging.info("Mirror was not exported yet, running full export.")
+            return self.export(components)
+        changed_ids, deleted_ids, last_change = self.get_changed_resources(last_sync)
+        changed_records = {}
+        for pdc_metadata_type, record_ids in changed_ids.items():
+            records = self.query_records(pdc_metadata_type, record_ids)
+            changed_records[pdc_metadata_type] = [record for record in records
+                                                  if not components or
+                                                  record['name'] in components]
+        # rpm-mappings of all releases of changed components are refreshed
+        changed_components = {record['name'] for records in changed_records.values()
+                              for record in records}
+        release_component_pairs = {(record['release']['release_id'], record['name'])
+                                   for record in changed_records.get('release-components', [])
+                                   if record.get('release')}
+        release_component_pairs.update(
+            (release_id, component)
+            for release_id, component in self.mirror.get_release_component_pairs()
+            if component in changed_components)
+        rpm_mappings = self.query_rpm_mappings(sorted(release_component_pairs))
+        self.mirror.apply_changes(changed_records, deleted_ids, rpm_mappings,
+                                  {'last_sync': last_change})
+        logging.info("Synchronized {0} changed and {1} deleted records and {2} "
+                     "rpm-mappings.".format(sum(map(len, changed_records.values())),
+                                            sum(map(len, deleted_ids.values())),
+                                            len(rpm_mappings)))
+
+    def get_changed_resources(self, changed_since):
+        """
+        Method for getting ids of mirrored records changed since given time
+        :param changed_since -- commit time of last synchronized change in ISO format,
+                                all changes are queried when it is empty
+
+        :returns tuple of dictionaries of changed and deleted record ids by pdc metadata type
+                 and commit time of newest change (changed_since when nothing changed)
+        """
+        url = "{0}/changesets/?".format(self.client.pdc_api_url)
+        record_states = {pdc_metadata_type: {}
+                         for pdc_metadata_type in self.changeset_resources.values()}
+        url_options = {'changed_since': changed_since} if changed_since else {}
+        changesets = []
+        for page_results in self.client.iter_all_pages(url, url_options, sys.maxsize):
+            changesets += page_results
+        # PDC lists changesets from the newest one, they are applied from the oldest one
+        changesets.sort(key=lambda changeset: changeset['id'])
+        for changeset in changesets:
+            for change in changeset['changes']:
+                resource = change['resource'].lower().replace('-', '').replace('_', '')
+                pdc_metadata_type = self.changeset_resources.get(resource)
+                if pdc_metadata_type is not None:
+                    # Latest change of record decides whether it still exists
+                    record_states[pdc_metadata_type][int(change['resource_id'])] = \
+                        change.get('new_value') not in (None, 'null')
+        changed_ids = {pdc_metadata_type: sorted(record_id for record_id, exists in states.items()
+                                                 if exists)
+                       for pdc_metadata_type, states in record_states.items()}
+        deleted_ids = {pdc_metadata_type: sorted(record_id for record_id, exists in states.items()
+                                                 if not exists)
+                       for pdc_metadata_type, states in record_states.items()}
+        last_change = max((changeset['committed_on'] for changeset in changesets),
+                          default=changed_since)
+        return changed_ids, deleted_ids, last_change
+
+    def get_last_change(self):
+        """
+        Method for getting commit time of newest pdc changeset
+
+        :returns Commit time in ISO format, empty string when pdc has no changesets
+        """
+        url = "{0}/changesets/?".format(self.client.pdc_api_url)
+        changesets = self.client.query_api(url, {'page': 1, 'page_size': 1})
+        if not changesets or not changesets['results']:
+            return ''
+        return max(changeset['committed_on'] for changeset in changesets['results'])
+
+    def query_records(self, pdc_metadata_type, record_ids):
+        """
+        Method for querying single records of pdc metadata type by their ids
+        :param pdc_metadata_type -- Name of pdc metadata type
+        :param record_ids -- List of record ids
+
+        :returns List of queried records
+        """
+        def query_record(record_id):
+            return self.client.query_api("{0}/{1}/{2}/".format(self.client.pdc_api_url,
+                                                              pdc_metadata_type, record_id))
+
+        with ThreadPoolExecutor(max_workers=self.client.max_workers) as executor:
+            return [record for record in executor.map(query_record, record_ids)
+                    if record is not None]
+
+    def export_endpoint(self, pdc_metadata_type, url_options, store):
+        """
+        Method for exporting all records of pdc list endpoint page by page
+        :param pdc_metadata_type -- Name of pdc metadata type
+        :param url_options -- Query options
+        :param store -- Mirror method which stores single page of records
+
+        :returns Number of exported records
+        """
+        url = "{0}/{1}/?".format(self.client.pdc_api_url, pdc_metadata_type)
+        exported = 0
+        for page_results in self.client.iter_all_pages(url, url_options, sys.maxsize):
+            store(page_results)
+            exported += len(page_results)
+        return exported
+
+    def export_rpm_mappings(self, components=None, release_component_pairs=None):
+        """
+        Method for exporting rpm-mappings of mirrored release-components
+        :param components -- List of component names, all components when not given
+        :param release_component_pairs -- List of (release_id, component name) tuples,
+                                          all mirrored pairs when not given
+
+        :returns Number of exported rpm-mappings
+        """
+        if release_component_pairs is None:
+            release_component_pairs = self.mirror.get_release_component_pairs()
+        if components:
+            release_component_pairs = [(release_id, component)
+                                       for release_id, component in release_component_pairs
+                                       if component in components]
+
+        rpm_mappings = self.query_rpm_mappings(release_component_pairs)
+        for (release_id, component), rpm_mapping in rpm_mappings.items():
+            self.mirror.store_rpm_mapping(release_id, component, rpm_mapping)
+        return len(rpm_mappings)
+
+    def query_rpm_mappings(self, release_component_pairs):
+        """
+        Method for querying rpm-mappings concurrently
+        :param release_component_pairs -- List of (release_id, component name) tuples
+
+        :returns Dictionary where keys are (release_id, component name) tuples and values
+                 are rpm-mappings
+        """
+        def query_rpm_mapping(release_component_pair):
+            rpm_mapping_url = "{0}/releases/{1}/rpm-mapping/{2}/?".format(
+                self.client.pdc_api_url, *release_component_pair)
+            return self.client.query_api(rpm_mapping_url)
+
+        rpm_mappings = {}
+        with ThreadPoolExecutor(max_workers=self.client.max_workers) as executor:
+            for release_component_pair, rpm_mapping in zip(
+                    release_component_pairs,
+                    executor.map(query_rpm_mapping, release_component_pairs)):
+                if rpm_mapping is not None:
+                    rpm_mappings[release_component_pair] = rpm_mapping
+        return rpm_mappings
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Export PDC release-components, rpms and rpm-mappings into local mirror.'
+    )
+    parser.add_argument(
+        '--pdc-api-url',
+        metavar='<api-url>',
+        required=True,
+        help='PDC api url.'
+    )
+    parser.add_argument(
+        '--mirror',
+        metavar='<mirror-database>',
+        required=True,
+        help='Path to SQLite database of pdc mirror. It is created when it does not exist.'
+    )
+    parser.add_argument(
+        '--component',
+        action='append',
+        metavar='<component-name>',
+        help='Export only given component. May be used many times. '
+             'All components are exported when not given.'
+    )
+    parser.add_argument(
+        '--sync',
+        action='store_true',
+        help='Synchronize only records changed since last export or synchronization. '
+             'Components of previous export are kept.'
+    )
+    parser.add_argument(
+        '--ca-cert',
+        default='/etc/ssl/certs/ca-bundle.crt',
+        help='Path to CA certificate file or directory'
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        metavar='<requests>',
+        type=int,
+        default=PDCApi.MAX_CONCURRENT_PAGES,
+        help='Maximal number of concurrent pdc requests'
+    )
+    return parser.parse_args()
+
+
+def main():
+    """Main function which manages plugin behavior"""
+    setup_logging(default_path="metamorph/etc/logging.json")
+    args = parse_args()
+    client = PDCApi(args.pdc_api_url, args.ca_cert, "", max_workers=args.max_concurrency)
+    mirror = PDCMirror(args.mirror)
+    try:
+        if args.sync:
+            PDCMirrorExporter(client, mirror).sync()
+        else:
+            PDCMirrorExporter(client, mirror).export(args.component)
+    finally:
+        mirror.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,19 @@
 #!/usr/bin/python
+import copy
+import itertools
+import json
 import logging
 import logging.config
+import os
+import shutil
+
+import yaml
 
 from argparse import ArgumentParser, ArgumentError
+from concurrent.futures import ThreadPoolExecutor
 
+from metamorph.lib.git_mirror import GitMirrorCache, GitMirrorException, read_remote_files
+from metamorph.lib.metadata_location import MetadataLocationException, MetadataLocations
 from metamorph.lib.support_functions import setup_logging
 from metamorph.metamorph_plugin import MetamorphPlugin
 
@@ -20,6 +30,7 @@ class Provision(MetamorphPlugin):
     """
     Class for openstack topology creation.
     Provide method for topology credentials creation.
+    Class level topology dictionaries are templates, every object works with own copies of them.
     """
     provision_topology = {
         'topology_name': "unknown_topo",
@@ -44,8 +55,12 @@ class Provision(MetamorphPlugin):
         'networks': []
     }
 
-    def __init__(self, git_repo, metadata, metadata_loc, osp_config, credentials_name):
+    def __init__(self, git_repo, metadata, metadata_loc, osp_config, credentials_name,
+                 sparse_clone=False, mirror_cache=None, git_ref=None):
         super().__init__()
+        self.provision_topology = copy.deepcopy(Provision.provision_topology)
+        self.resource_groups = copy.deepcopy(Provision.resource_groups)
+        self.res_defs = copy.deepcopy(Provision.res_defs)
         self.git_repo = git_repo
         self.metadata_file = metadata
         self.metadata_loc = metadata_loc
@@ -53,73 +68,285 @@ class Provision(MetamorphPlugin):
         self.osp_data = dict
         self.credentials_name = credentials_name
         self.openstack_topology_credentials = dict()
+        self.sparse_clone = sparse_clone
+        self.mirror_cache = mirror_cache
+        self.git_ref = git_ref
 
     def get_provision_metadata(self):
         """
         Method for getting provision topology
         Credentials values are stored in openstack_topology_credentials parameter
 
+        When git reference is given, files are read straight from git objects of mirror
+        without checkout.
+
         :returns tuple -- first elements is dictionary of provision topology and second dictionary
                           of topology credentials
         """
-        self.clone_git_repository(self.git_repo)
-        self.setup_topology_by_osp_config(self.osp_config)
+        osp_data, metadata = self.read_provision_inputs()
+        self.setup_topology_by_osp_data(osp_data)
         self.openstack_topology_credentials = self.get_openstack_credentials(self.osp_data)
         if self.metadata_file:
-            self.setup_topology_by_metadata(self.metadata_file, self.metadata_loc)
+            self.setup_topology_by_metadata_data(metadata, self.metadata_loc)
+        return self.get_topology(), self.openstack_topology_credentials
+
+    def get_provision_matrix_metadata(self, images=None, flavors=None, sites=None, max_workers=8):
+        """
+        Method for getting provision topologies of every combination of images, flavors and sites
+        Osp config and metadata are read and metadata are extracted only once. Topologies are
+        built concurrently by independent Provision objects, so nothing is shared between them.
+
+        :param images -- list of images, image of osp config is used when not given
+        :param flavors -- list of flavors, flavor of osp config is used when not given
+        :param sites -- list of osp config site names, first site is used when not given
+        :param max_workers -- maximal number of concurrently built topologies
+
+        :returns tuple -- first element is list of provision topologies in order of sites, images
+                          and flavors and second dictionary where keys are credentials file names
+                          and values are topology credentials
+        """
+        osp_data, metadata = self.read_provision_inputs()
+        extracted_metadata = []
+        if self.metadata_file:
+            extracted_metadata = self.extract_metadata(metadata, self.metadata_loc)
+        site_indexes = {site['site']: index for index, site in enumerate(osp_data['sites'])}
+        if sites:
+            unknown_sites = [site for site in sites if site not in site_indexes]
+            if unknown_sites:
+                raise ProvisionException('Sites "{}" were not found in osp '
+                                         'config'.format(', '.join(unknown_sites)))
+        else:
+            sites = [osp_data['sites'][0]['site']]
+        matrix = itertools.product(sites, images or [None], flavors or [None])
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            built = list(executor.map(
+                lambda combination: self.build_matrix_topology(
+                    osp_data, extracted_metadata, site_indexes[combination[0]], *combination[1:]),
+                matrix))
+        topologies = []
+        topology_credentials = dict()
+        for topology, credentials_name, credentials in built:
+            topologies.append(topology)
+            if topology_credentials.setdefault(credentials_name, credentials) != credentials:
+                raise ProvisionException('Different sites can not share credentials file "{}". '
+                                         'Please use default credentials '
+                                         'name'.format(credentials_name))
+        return topologies, topology_credentials
+
+    def build_matrix_topology(self, osp_data, extracted_metadata, site_index, image=None,
+                              flavor=None):
+        """
+        Method for building single topology of matrix by new Provision object
+
+        :param osp_data -- Parsed osp config
+        :param extracted_metadata -- list of metadata names and values, see extract_metadata
+        :param site_index -- index of site in osp config
+        :param image -- image overriding image of osp config and metadata
+        :param flavor -- flavor overriding flavor of osp config and metadata
+
+        :returns tuple -- provision topology, credentials file name and topology credentials
+        """
+        provision = Provision(self.git_repo, self.metadata_file, self.metadata_loc,
+                              self.osp_config, self.credentials_name)
+        provision.setup_topology_by_osp_data(osp_data, site_index)
+        credentials = provision.get_openstack_credentials(osp_data, site_index)
+        for metadata_name, metadata_value in extracted_metadata:
+            provision.update_topology_by_metadata(metadata_name, copy.deepcopy(metadata_value))
+        if image is not None:
+            provision.update_topology_by_metadata('image', image)
+        if flavor is not None:
+            provision.update_topology_by_metadata('flavor', flavor)
+        return provision.get_topology(), provision.credentials_name, credentials
+
+    def get_topology(self):
+        """
+        Method for assembling provision topology from resource group and resource definitions
+
+        :returns Dictionary of provision topology
+        """
         self.resource_groups['res_defs'] = self.res_defs
         self.provision_topology['resource_groups'] = self.resource_groups
-        return self.provision_topology, self.openstack_topology_credentials
+        return self.provision_topology
+
+    def read_provision_inputs(self):
+        """
+        Method for reading osp config and metadata file
+        Files are read from git objects when git reference is given, otherwise from cloned
+        repository.
+
+        :returns tuple -- osp config data and metadata data (None when no metadata file is given)
+        """
+        if self.git_ref:
+            return self.read_git_objects()
+        sparse_paths = None
+        if self.sparse_clone:
+            sparse_paths = [path for path in (self.osp_config, self.metadata_file) if path]
+        self.clone_git_repository(self.git_repo, sparse_paths)
+        osp_data = self.read_osp_config(self.osp_config)
+        metadata = None
+        if self.metadata_file:
+            metadata = self.read_metadata_file(self.metadata_file)
+        return osp_data, metadata
 
-    def get_openstack_credentials(self, osp_data):
+    def get_openstack_credentials(self, osp_data, site_index=0):
         """
         Static method for getting openstack credentials
         :param osp_data -- osp_config data
+        :param site_index -- index of site in osp config
 
         :returns Credentials topology. Single key contains recommended credentials file name.
                  Key values are openstack credentials values
         """
-        openstack_credentials = {'endpoint': osp_data['sites'][0]['endpoint'],
-                                 'project': osp_data['sites'][0]['project'],
-                                 'username': osp_data['sites'][0]['username'],
-                                 'password': osp_data['sites'][0]['password']}
+        site = osp_data['sites'][site_index]
+        openstack_credentials = {'endpoint': site['endpoint'],
+                                 'project': site['project'],
+                                 'username': site['username'],
+                                 'password': site['password']}
         if self.credentials_name == 'unknown_credentials.yaml':
-            self.credentials_name = '{}_openstack.yaml'.format(
-                osp_data['sites'][0]['project'].replace('-', '_'))
+            self.credentials_name = '{}_openstack.yaml'.format(site['project'].replace('-', '_'))
         self.resource_groups['credentials']['auth_type'] = 'file:{}'.format(self.credentials_name)
         return openstack_credentials
 
-    def clone_git_repository(self, git_repo):
+    def clone_git_repository(self, git_repo, sparse_paths=None):
         """
         Method for cloning given repository
+        When sparse paths are given, only they are checked out from shallow blobless clone.
+        Full clone is used when server or git does not support it.
+        When mirror cache is given, worktree of cached mirror is checked out instead of clone
+        and sparse paths are ignored.
 
         :param git_repo -- git repository path
+        :param sparse_paths -- paths of needed files, relative to working directory
+                               (i.e. starting with repository name) or to repository
         """
+        repo_name = self.get_git_repo_name(git_repo)
+        if self.mirror_cache:
+            try:
+                GitMirrorCache(self.mirror_cache).checkout(git_repo, repo_name)
+                return
+            except GitMirrorException as detail:
+                logging.error('Error during checkout of git repository "{0}"'.format(git_repo))
+                raise ProvisionException("Error during checkout of git repository {0} from "
+                                         "mirror cache with detail: {1}".format(git_repo, detail))
+        if sparse_paths:
+            destination_existed = os.path.exists(repo_name)
+            try:
+                self.sparse_clone_git_repository(git_repo, repo_name, sparse_paths)
+                return
+            except GitCommandError as detail:
+                if destination_existed:
+                    # Directory was not created by this clone, it must not be removed
+                    logging.error('Error during cloning git repository "{0}"'.format(git_repo))
+                    raise ProvisionException("Error during sparse cloning of git repository {0} "
+                                             "into existing directory {1} with detail: "
+                                             "{2}".format(git_repo, repo_name, detail))
+                logging.warning('Sparse clone of git repository "{0}" failed, falling back to '
+                                'full clone: {1}'.format(git_repo, detail))
+                shutil.rmtree(repo_name, ignore_errors=True)
         try:
-            repo_name = self.get_git_repo_name(git_repo)
             Repo.clone_from(git_repo, repo_name)
         except GitCommandError as detail:
             logging.error('Error during cloning git repository "{0}"'.format(git_repo))
             raise ProvisionException("Error during cloning git "
                                      "repository {0} with detail: {1}".format(git_repo, detail))
 
+    def sparse_clone_git_repository(self, git_repo, repo_name, sparse_paths):
+        """
+        Method for cloning only given files of last commit of default branch
+        History is not fetched (depth 1) and blobs of files which are not checked out
+        are not downloaded at all (blob:none filter).
+
+        :param git_repo -- git repository path
+        :param repo_name -- directory of cloned repository
+        :param sparse_paths -- paths of needed files, see clone_git_repository
+        """
+        repo = Repo.clone_from(git_repo, repo_name, depth=1, single_branch=True,
+                               filter='blob:none', no_checkout=True, sparse=True)
+        patterns = ['/' + path for path in self.get_repository_paths(repo_name, sparse_paths)]
+        repo.git.sparse_checkout('set', '--no-cone', *patterns)
+        repo.git.checkout()
+
+    def read_git_objects(self):
+        """
+        Method for reading osp config and metadata file straight from git objects at git reference
+        Mirror from mirror cache is used, only single commit of reference is fetched without
+        history and blobs when no cache is given.
+
+        :returns tuple -- osp config data and metadata data (None when no metadata file is given)
+        """
+        repo_name = self.get_git_repo_name(self.git_repo)
+        paths = [path for path in (self.osp_config, self.metadata_file) if path]
+        repository_paths = self.get_repository_paths(repo_name, paths)
+        try:
+            if self.mirror_cache:
+                contents = GitMirrorCache(self.mirror_cache).read_files(
+                    self.git_repo, repository_paths, self.git_ref)
+            else:
+                contents = read_remote_files(self.git_repo, repository_paths, self.git_ref)
+        except GitMirrorException as detail:
+            raise ProvisionException("Error during reading files of git repository {0} with "
+                                     "detail: {1}".format(self.git_repo, detail))
+        osp_data = json.loads(contents[repository_paths[0]])
+        metadata = None
+        if self.metadata_file:
+            metadata = yaml.safe_load(contents[repository_paths[1]])
+        return osp_data, metadata
+
+    @staticmethod
+    def get_repository_paths(repo_name, paths):
+        """
+        Method for getting paths relative to cloned repository
+
+        :param repo_name -- directory of cloned repository
+        :param paths -- paths relative to working directory or to repository
+
+        :returns List of paths relative to repository
+        """
+        repository_paths = []
+        for path in paths:
+            path = os.path.normpath(path)
+            if path.split(os.sep)[0] == repo_name:
+                path = os.path.relpath(path, repo_name)
+            repository_paths.append(path)
+        return repository_paths
+
     def setup_topology_by_osp_config(self, osp_config_path):
         """
         Method for actualizing topology values from osp config
 
         :param osp_config_path -- Path to osp config in cloned repository
         """
+        self.setup_topology_by_osp_data(self.read_osp_config(osp_config_path))
+
+    def read_osp_config(self, osp_config_path):
+        """
+        Method for reading osp config file
+
+        :param osp_config_path -- Path to osp config in cloned repository
+
+        :returns Parsed osp config
+        """
         try:
-            self.osp_data = self.read_json_file(osp_config_path)
+            return self.read_json_file(osp_config_path)
         except IOError:
             raise LookupError('OSP config file "{}" was not found. '
                               'Please check file path'.format(osp_config_path))
-        self.res_defs['networks'] = self.osp_data['sites'][0]['networks']
-        self.res_defs['keypair'] = self.osp_data['sites'][0]['keypair']
+
+    def setup_topology_by_osp_data(self, osp_data, site_index=0):
+        """
+        Method for actualizing topology values from osp config data
+
+        :param osp_data -- Parsed osp config
+        :param site_index -- index of site in osp config
+        """
+        self.osp_data = osp_data
+        site = self.osp_data['sites'][site_index]
+        self.res_defs['networks'] = list(site['networks'])
+        self.res_defs['keypair'] = site['keypair']
         self.res_defs['flavor'] = self.osp_data['resources'][0].get('flavor', 'm1.small')
         self.res_defs['count'] = self.osp_data['resources'][0].get('count', '1')
         self.res_defs['image'] = self.osp_data['resources'][0]['image']
-        self.provision_topology['site'] = self.osp_data['sites'][0]['site']
+        self.provision_topology['site'] = site['site']
 
     def setup_topology_by_metadata(self, metadata_path, metadata_location):
         """
@@ -128,19 +355,56 @@ class Provision(MetamorphPlugin):
         :param metadata_path -- Path to metadata file in cloned repository
         :param metadata_location -- Dictionary of searched metadata in given metadata file
         """
+        self.setup_topology_by_metadata_data(self.read_metadata_file(metadata_path),
+                                             metadata_location)
+
+    def read_metadata_file(self, metadata_path):
+        """
+        Method for reading yaml metadata file
+
+        :param metadata_path -- Path to metadata file in cloned repository
+
+        :returns Parsed metadata
+        """
         try:
-            metadata = self.read_yaml_file(metadata_path)
+            return self.read_yaml_file(metadata_path)
         except IOError:
             raise LookupError('Metadata file "{}" was not found. '
                               'Please check file path'.format(metadata_path))
-        for metadata_name, location_value in metadata_location.items():
-            try:
-                extracted_data = self.get_metadata_from_location(metadata, location_value,
-                                                                 location_value[-1])
-            except KeyError as detail:
+
+    def setup_topology_by_metadata_data(self, metadata, metadata_location):
+        """
+        Method for actualizing topology values by parsed metadata
+
+        :param metadata -- Parsed yaml metadata
+        :param metadata_location -- Dictionary of searched metadata in given metadata
+        """
+        for metadata_name, extracted_data in self.extract_metadata(metadata, metadata_location):
+            self.update_topology_by_metadata(metadata_name, extracted_data)
+
+    @staticmethod
+    def extract_metadata(metadata, metadata_location):
+        """
+        Method for extracting metadata values of all metadata locations
+        Locations are compiled into trie of accessors and extracted in single traversal.
+
+        :param metadata -- Parsed yaml metadata
+        :param metadata_location -- Dictionary of searched metadata in given metadata
+
+        :returns List of metadata names and their values in order of metadata locations
+        """
+        extracted_metadata = []
+        extracted = MetadataLocations(metadata_location).extract(metadata)
+        for metadata_name, extracted_data, detail in extracted:
+            if isinstance(detail, KeyError):
                 raise ProvisionException('Unable to find key "{0}" in given path '
                                          '"{1}"'.format(detail, metadata_location[metadata_name]))
-            self.update_topology_by_metadata(metadata_name, extracted_data)
+            elif isinstance(detail, MetadataLocationException):
+                raise ProvisionException(str(detail))
+            elif detail is not None:
+                raise detail
+            extracted_metadata.append((metadata_name, extracted_data))
+        return extracted_metadata
 
     @staticmethod
     def get_correct_metadata_tree(metadata_source, metadata_location):
@@ -236,6 +500,34 @@ def parse_args():
                           type=lambda kv: kv.split("=", 1),
                           help='Metadata name with location. Usage --metadata-loc '
                                'metadata=path,to,metadata')
+    parser.add_argument('--sparse-clone',
+                        action='store_true',
+                        help='Clone only last commit and check out only osp config and metadata '
+                             'file. Full clone is used when git server does not support it.')
+    parser.add_argument('--mirror-cache',
+                        metavar='<mirror-cache-dir>',
+                        help='Directory of persistent git mirrors shared by runs. Mirror is '
+                             'fetched incrementally and its worktree is checked out instead '
+                             'of cloning repository.')
+    parser.add_argument('--git-ref',
+                        metavar='<git-reference>',
+                        help='Read osp config and metadata file at given reference (e.g. HEAD, '
+                             'branch or commit) straight from git objects of mirror without '
+                             'checkout. Only single commit of reference is fetched without '
+                             'history and blobs when --mirror-cache is not given.')
+    matrix = parser.add_argument_group('topology matrix', 'Topology of every combination of '
+                                                          'given images, flavors and sites is '
+                                                          'written into output topology file '
+                                                          'as separate yaml document')
+    matrix.add_argument('--images',
+                        type=lambda images: images.split(','),
+                        help='Comma separated images of topology matrix')
+    matrix.add_argument('--flavors',
+                        type=lambda flavors: flavors.split(','),
+                        help='Comma separated flavors of topology matrix')
+    matrix.add_argument('--sites',
+                        type=lambda sites: sites.split(','),
+                        help='Comma separated osp config sites of topology matrix')
     parser.add_argument('--output-topology',
                         metavar='<output-topology-file>',
                         default='topology.yaml',
@@ -276,7 +568,15 @@ def main():
     if args.metadata_file:  # Metadata location data must be
         setup_metadata_location_param(args)
     provisioning = Provision(args.git_repo, args.metadata_file, args.metadata_loc, args.osp_config,
-                             args.topology_credentials_name)
+                             args.topology_credentials_name, args.sparse_clone,
+                             args.mirror_cache, args.git_ref)
+    if args.images or args.flavors or args.sites:
+        topologies, topology_credentials = provisioning.get_provision_matrix_metadata(
+            args.images, args.flavors, args.sites)
+        provisioning.write_yaml_documents(topologies, args.output_topology)
+        for credentials_name, credentials in topology_credentials.items():
+            provisioning.write_yaml_file(credentials, credentials_name)
+        return
     topology, topology_credentials = provisioning.get_provision_metadata()
     provisioning.write_yaml_file(topology, args.output_topology)
     provisioning.write_yaml_file(topology_credentials, provisioning.credentials_name)
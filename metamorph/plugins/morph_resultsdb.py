@@ -6,7 +6,14 @@ import json
 import time
 import os
 
+from metamorph.lib.nvr import NVR
+from metamorph.lib.pagination import AdaptivePageSize, get_page_number
+from metamorph.lib.polling import PollSchedule
+from metamorph.lib.progress import QueryProgress
+from metamorph.lib.result_record import ResultRecord, ingest_results
+from metamorph.lib.result_store import ResultStore
 from metamorph.lib.support_functions import setup_logging
+from metamorph.lib.tier_gate import TierGate
 from metamorph.metamorph_plugin import MetamorphPlugin
 
 
@@ -20,9 +27,12 @@ class ResultsDBApi(MetamorphPlugin):
     Class to communicate and process data with resultsDB
     """
     TIMEOUT_LIMIT = 7200  # Wait 2 hours maximally
-    RESULTSDB_LIMITER = 10
+    RESULTSDB_RECORD_LIMIT = 200
+    NVR_BATCH_SIZE = 20  # Amount of nvrs queried by single request, it keeps urls short
 
-    def __init__(self, job_names, component_nvr, test_tier, resultsdb_api_url, ca_bundle):
+    def __init__(self, job_names, component_nvr, test_tier, resultsdb_api_url, ca_bundle,
+                 result_store=None, fail_fast=False, pass_fast=False, latest_only=False,
+                 expected_wait=0, status_file=None):
         super().__init__()
         self.resultsdb_api_url = resultsdb_api_url
         self.job_names = job_names
@@ -30,6 +40,18 @@ class ResultsDBApi(MetamorphPlugin):
         self.ca_bundle_path = ca_bundle
         self.tier_tag = True
         self.url_options = {'CI_tier': test_tier, 'item': component_nvr}
+        self.page_size = AdaptivePageSize()
+        self.result_store = ResultStore(result_store) if result_store else None
+        self.gate = TierGate(job_names, fail_fast, pass_fast)
+        self.latest_only = latest_only
+        self.latest_supported = None  # Unknown until latest results are queried first time
+        self.job_testcases = {}  # Job name -> testcase name, latest results are filtered by it
+        self.poll_schedule = PollSchedule(expected_wait)
+        self.progress = None
+        if status_file:
+            self.progress = QueryProgress(status_file, self.get_progress_query())
+            if self.progress.state['timeout_left'] is not None:
+                self.TIMEOUT_LIMIT = self.progress.state['timeout_left']
 
     def get_test_tier_status_metadata(self):
         """
@@ -37,56 +59,413 @@ class ResultsDBApi(MetamorphPlugin):
 
         :returns -- dictionary where keys are job names and their values are list of queried data
         """
+        if self.result_store is not None:
+            return self.get_test_tier_status_metadata_from_store()
         if self.job_names:
+            pending_jobs = []
             for job_name in self.job_names:
-                self.job_names_result[job_name] = self.get_resultsdb_data(job_name)
-            self.erase_duplicity_results()
-            return self.job_names_result
+                queried_data = self.query_job_results(job_name, wait=False)
+                if queried_data is None:
+                    pending_jobs.append(job_name)
+                else:
+                    self.job_names_result[job_name] = queried_data
+                if self.gate.is_decided():
+                    break
+            if pending_jobs and not self.gate.is_decided():
+                self.wait_for_jobs(pending_jobs)
+            if self.gate.is_decided():
+                logging.info("Tier verdict is final, remaining jobs are not queried.")
+            for job_name in pending_jobs:
+                self.job_names_result.setdefault(job_name, [])
+            self.job_names_result = {job_name: self.job_names_result[job_name]
+                                     for job_name in self.job_names
+                                     if job_name in self.job_names_result}
         else:
-            queried_data = self.get_resultsdb_data(limit=self.RESULTSDB_LIMITER)
-            self.job_names_result = self.setup_output_data(queried_data)
-            self.erase_duplicity_results()
-            return self.job_names_result
-
-    def erase_duplicity_results(self):
-        """Method for erasing duplicity results in queried data"""
-        for job_name in self.job_names_result:
-            job_name_data = []
-            ref_urls = set()
-            for single_result in self.job_names_result[job_name]:
-                if single_result['ref_url'] not in ref_urls:
-                    job_name_data.append(single_result)
-                    ref_urls.add(single_result['ref_url'])
-            self.job_names_result[job_name] = job_name_data
-
-    def get_resultsdb_data(self, job_name="", limit=10):
+            queried_data = self.query_job_results(limit=self.RESULTSDB_RECORD_LIMIT)
+            self.job_names_result = self.ingest_job_names_data(self.setup_output_data(queried_data))
+        if self.progress is not None:
+            self.progress.finish()
+        return self.job_names_result
+
+    def get_progress_query(self):
+        """
+        Method for getting parameters which identify query in status file, see QueryProgress
+
+        :returns -- dictionary of nvr, tier and job names
+        """
+        return dict(self.url_options, job_names=self.job_names or [])
+
+    def load_progress(self, state):
+        """
+        Method for loading data queried so far from stored query progress, see QueryProgress
+        Query itself may be still running in other process.
+
+        :param state -- query progress state read from status file
+        :returns -- dictionary where keys are job names and their values are list of queried data
+        """
+        jobs = state['jobs']
+        if self.job_names:
+            self.job_names_result = self.ingest_job_names_data(
+                {job_name: jobs[job_name]['results'] for job_name in self.job_names
+                 if job_name in jobs})
+        else:
+            self.job_names_result = self.ingest_job_names_data(
+                self.setup_output_data(jobs.get("", {}).get('results', [])))
+        return self.job_names_result
+
+    def query_job_results(self, job_name="", limit=RESULTSDB_RECORD_LIMIT, wait=True):
+        """
+        Method for querying results of single job (all jobs when job name is empty)
+        Only latest results are queried when they are wanted and resultsDB offers them.
+        Otherwise result history is paged and outcomes are evaluated by tier gate.
+
+        :param job_name -- job name which will be searched in resultsDB
+        :param limit -- Limit for amount of queried records from resultsDB
+        :param wait -- wait until results are published, see get_resultsdb_data
+        :returns -- List of ResultRecords of job (raw queried data of all jobs when job name
+                    is empty), None when nothing is published and waiting is not wanted
+        """
+        if self.latest_only:
+            queried_data = self.get_latest_resultsdb_data(job_name)
+            if queried_data:
+                self.gate.observe(job_name, queried_data)
+                return list(ingest_results(queried_data[:limit]).values())
+        return self.get_resultsdb_data(job_name, limit, page_handler=lambda results:
+                                       self.gate.observe(job_name, results), wait=wait,
+                                       ingest=bool(job_name))
+
+    def get_latest_resultsdb_data(self, job_name=""):
+        """
+        Method for getting latest result of every testcase from resultsDB latest results endpoint
+        Single request replaces paging through whole result history. Latest results are
+        distinct by testcase, so results of job are filtered by its testcase and job name.
+        Otherwise jobs sharing testcase would collapse and other testcases would be pulled in.
+        Results of all jobs (empty job name) can not be filtered so, they are not queried.
+
+        :param job_name -- job name which will be searched in resultsDB
+        :returns -- List of queried data, None when resultsDB does not offer latest results
+                    or job name is empty
+        """
+        if self.latest_supported is False or not job_name:
+            return None
+        testcase = self.get_job_testcase(job_name)
+        if testcase is None:
+            return []  # Job has not published results yet
+        url_options = {option: value for option, value in self.url_options.items()
+                       if option not in ('limit', 'page', 'since')}
+        url_options['testcases'] = testcase
+        url_options['job_name'] = job_name
+        # Missing endpoint is not retried, page scan is used instead
+        response_data = self.query_api("{}/latest".format(self.resultsdb_api_url.rstrip('/')),
+                                       url_options, attempt=3)
+        self.latest_supported = isinstance(response_data, dict) and 'data' in response_data
+        if not self.latest_supported:
+            logging.info("ResultsDB does not offer latest results, falling back to page scan.")
+            return None
+        return [single_result for single_result in response_data['data']
+                if single_result['data'].get('job_name', [None])[0] == job_name]
+
+    def get_job_testcase(self, job_name):
+        """
+        Method for getting testcase name of job from its newest result
+
+        :param job_name -- job name which will be searched in resultsDB
+        :returns -- Testcase name, None when job has not published results yet
+        """
+        if job_name not in self.job_testcases:
+            url_options = dict(self.url_options, limit=1, page=0)
+            url_options['job_name'] = job_name
+            url_options.pop('since', None)
+            response_data = self.query_api(self.resultsdb_api_url, url_options)
+            if not response_data or not response_data.get('data'):
+                return None
+            self.job_testcases[job_name] = response_data['data'][0]['testcase']['name']
+        return self.job_testcases[job_name]
+
+    @classmethod
+    def query_batch(cls, job_names, component_nvrs, test_tiers, resultsdb_api_url, ca_bundle,
+                    batch_size=NVR_BATCH_SIZE, expected_wait=0):
+        """
+        Method for querying many nvrs and tiers at once
+        Nvrs and tiers are joined by comma into item and CI_tier filters, so every batch
+        of nvrs is paged only once (per job name) for all tiers. Busy pairs may fill whole
+        limit of batch, pairs left short of their own limit are queried one by one then.
+
+        :param job_names -- job names which will be searched in resultsDB
+        :param component_nvrs -- list of tested components in nvr format
+        :param test_tiers -- list of tested tiers
+        :param resultsdb_api_url -- resultsDB api url
+        :param ca_bundle -- certificate bundle which verifies resultsDB api url
+        :param batch_size -- maximal amount of nvrs queried by single request
+        :param expected_wait -- seconds after which results are expected to be published
+
+        :returns -- dictionary where keys are (nvr, tier) tuples and values are ResultsDBApi
+                    objects with queried data, see format_result
+        """
+        test_tiers = [str(test_tier) for test_tier in test_tiers]
+        clients = {(component_nvr, test_tier): cls(job_names, component_nvr, test_tier,
+                                                   resultsdb_api_url, ca_bundle)
+                   for component_nvr in component_nvrs for test_tier in test_tiers}
+        queried_data = {key: {} for key in clients}
+        for start in range(0, len(component_nvrs), batch_size):
+            batch = component_nvrs[start:start + batch_size]
+            batch_client = cls(job_names, ','.join(batch), ','.join(test_tiers),
+                               resultsdb_api_url, ca_bundle, expected_wait=expected_wait)
+            limit = cls.RESULTSDB_RECORD_LIMIT * len(batch) * len(test_tiers)
+            batch_keys = [(component_nvr, test_tier) for component_nvr in batch
+                          for test_tier in test_tiers]
+            for job_name in job_names or [""]:
+                batch_data = batch_client.get_resultsdb_data(job_name, limit=limit)
+                for single_result in batch_data:
+                    key = (single_result['data'].get('item', [''])[0],
+                           str(single_result['data'].get('CI_tier', [''])[0]))
+                    if key in queried_data:
+                        queried_data[key].setdefault(job_name, []).append(single_result)
+                for key in batch_keys:
+                    key_data = queried_data[key].get(job_name, [])
+                    if len(batch_data) < limit or len(key_data) >= cls.RESULTSDB_RECORD_LIMIT:
+                        queried_data[key][job_name] = key_data[:cls.RESULTSDB_RECORD_LIMIT]
+                    else:
+                        queried_data[key][job_name] = clients[key].get_resultsdb_data(
+                            job_name, wait=False) or []
+        for key, client in clients.items():
+            if job_names:
+                client.job_names_result = client.ingest_job_names_data(
+                    {job_name: queried_data[key].get(job_name, []) for job_name in job_names})
+            else:
+                client.job_names_result = client.ingest_job_names_data(
+                    client.setup_output_data(queried_data[key].get("", [])))
+        return clients
+
+    def get_test_tier_status_metadata_from_store(self):
+        """
+        Method for getting data through local result store
+        Store is refreshed by results submitted since its previous refresh and data are read
+        from it afterwards.
+
+        :returns -- dictionary where keys are job names and their values are list of queried data
+        """
+        item, tier = self.url_options['item'], self.url_options['CI_tier']
+        if self.job_names:
+            for job_name in self.job_names:
+                self.refresh_result_store(job_name)
+                stored_results = self.result_store.get_results(item, tier, job_name,
+                                                               self.RESULTSDB_RECORD_LIMIT)
+                self.job_names_result[job_name] = list(ingest_results(stored_results).values())
+                self.gate.observe(job_name, stored_results)
+                if self.gate.is_decided():
+                    logging.info("Tier verdict is final, remaining jobs are not queried.")
+                    break
+        else:
+            self.refresh_result_store()
+            self.job_names_result = self.ingest_job_names_data(self.setup_output_data(
+                self.result_store.get_results(item, tier, limit=self.RESULTSDB_RECORD_LIMIT)))
+        return self.job_names_result
+
+    def refresh_result_store(self, job_name=""):
+        """
+        Method for storing results submitted since previous refresh into local result store
+
+        :param job_name -- job name which will be searched in resultsDB, all jobs when empty
+        """
+        item, tier = self.url_options['item'], self.url_options['CI_tier']
+        since = self.result_store.get_refresh_time(item, tier, job_name)
+        # Whole window is queried, refresh time would skip results over any limit forever
+        queried_data = self.get_resultsdb_data(job_name, limit=None, since=since)
+        if job_name:
+            job_names_data = {job_name: queried_data}
+        else:
+            job_names_data = self.setup_output_data(queried_data)
+        for single_job in job_names_data:
+            self.result_store.store_results(item, tier, single_job, job_names_data[single_job])
+        submit_times = [result['submit_time'] for result in queried_data
+                        if result.get('submit_time')]
+        if submit_times:
+            self.result_store.set_refresh_time(item, tier, job_name, max(submit_times))
+        logging.debug("Result store refreshed by {0} results submitted since {1}".format(
+            len(queried_data), since))
+
+    @staticmethod
+    def ingest_job_names_data(job_names_data):
+        """
+        Method for ingesting raw results of every job into compact records
+        Duplicity results (of the same ref_url) are dropped while they are ingested.
+
+        :param job_names_data -- dictionary where keys are job names and values are lists
+                                 of raw results
+        :returns -- dictionary where keys are job names and values are lists of ResultRecord
+        """
+        return {job_name: list(ingest_results(job_names_data[job_name]).values())
+                for job_name in job_names_data}
+
+    def get_resultsdb_data(self, job_name="", limit=RESULTSDB_RECORD_LIMIT, since=None,
+                           page_handler=None, wait=True, ingest=False):
         """
         Method for getting data from resultsDB
+        Size of requested pages is tuned by response latency
 
         :param self.url_options -- class dictionary of url options
         :param job_name -- job name which will be searched in resultsDB
-        :param limit -- Limit for amount of queried pages from resultsDB
-        :returns -- List of queried data
+        :param limit -- Limit for amount of queried records from resultsDB, None for no limit
+        :param since -- query only results submitted since given time (ISO format).
+                        Nothing is awaited then, no data means no new results.
+        :param page_handler -- function called with every queried page. Querying stops
+                               when it returns True.
+        :param wait -- wait until results are published when there are none yet
+        :param ingest -- ingest every page into ResultRecords right when it is queried,
+                         raw pages are not kept then
+        :returns -- List of queried data (ResultRecords when ingested), None when nothing
+                    is published and waiting is not wanted
         """
-        i = 0
         next_page = ""
+        queried_count = 0
         queried_data = []
+        records = {} if ingest else None
+
+        def keep_results(results, offset):
+            # Results over limit are dropped, raw results are dropped once they are ingested
+            if limit is not None:
+                results = results[:max(limit - offset, 0)]
+            if records is not None:
+                ingest_results(results, records)
+            else:
+                queried_data.extend(results)
+
         if job_name:
             self.url_options['job_name'] = job_name
-        while next_page is not None and self.TIMEOUT_LIMIT and limit > i:
-            self.url_options['page'] = i
+        if since:
+            self.url_options['since'] = since
+        else:
+            self.url_options.pop('since', None)
+        page_size = self.page_size.next_size(0, self.page_size.size)
+        job_progress = None
+        if self.progress is not None and not since:
+            # Results queried before interruption are not queried again
+            job_progress = self.progress.get_job(job_name)
+            if job_progress['results']:
+                keep_results(job_progress['results'], 0)
+                queried_count = len(job_progress['results'])
+                page_size = job_progress['page_size'] or page_size
+                if page_handler is not None and page_handler(job_progress['results']):
+                    job_progress['done'] = True
+            if job_progress['done']:
+                return list(records.values()) if records is not None else queried_data
+        while next_page is not None and (limit is None or limit > queried_count):
+            self.url_options['limit'] = page_size
+            self.url_options['page'] = get_page_number(queried_count, page_size)
+            # Page may start before queried offset when page size changed, such results are
+            # already queried
+            skipped = queried_count % page_size
+            start = time.monotonic()
             response_data = self.query_api(self.resultsdb_api_url, self.url_options)
-            if not response_data['data']:
-                logging.info("job name has not published results to resultsDB yet, sleeping...")
-                time.sleep(60)  # Sleeping for 1 minute
-                self.TIMEOUT_LIMIT -= 60  # Timeout limit minus one minute
+            if not response_data['data'] and (since or queried_count):
+                break
+            elif not response_data['data']:
+                if not wait:
+                    return None
+                if not self.wait_for_results():
+                    raise ResultsDBApiException("Timeout limit reached and no data were queried.")
+            elif response_data['next'] and len(response_data['data']) < page_size and \
+                    self.url_options['page'] > 0:
+                # Server caps page size, so returned page does not start at queried offset.
+                # Page is queried again with capped size.
+                self.page_size.observe(time.monotonic() - start, len(response_data['data']),
+                                       page_size, has_next=True)
+                page_size = len(response_data['data'])
             else:
-                i += 1
+                self.page_size.observe(time.monotonic() - start, len(response_data['data']),
+                                       page_size, bool(response_data['next']))
+                if response_data['next'] and len(response_data['data']) < page_size:
+                    page_size = len(response_data['data'])  # Server caps page size
                 next_page = response_data['next']
-                queried_data += response_data['data']
-        if self.TIMEOUT_LIMIT == 0:
-            raise ResultsDBApiException("Timeout limit reached and no data were queried.")
-        return queried_data
+                page_results = response_data['data'][skipped:]
+                keep_results(page_results, queried_count)
+                queried_count += len(page_results)
+                page_size = self.page_size.next_size(queried_count, page_size)
+                stop = page_handler is not None and page_handler(page_results)
+                if job_progress is not None:
+                    self.progress.add_results(
+                        job_name, self.compact_results(page_results), page_size)
+                if stop:
+                    break
+        if job_progress is not None:
+            self.progress.add_results(job_name, [], page_size, done=True)
+        return list(records.values()) if records is not None else queried_data
+
+    @staticmethod
+    def compact_results(results):
+        """
+        Method for keeping only result fields needed for tier status, e.g. in status file
+
+        :param results -- list of ResultsDB results
+        :returns -- list of compact results
+        """
+        return [dict(ref_url=single_result['ref_url'], outcome=single_result['outcome'],
+                     submit_time=single_result.get('submit_time'),
+                     data=dict(job_name=single_result['data'].get('job_name', ['UNKNOWN'])))
+                for single_result in results]
+
+    def wait_for_results(self):
+        """
+        Method for waiting until results are published to resultsDB
+        Every poll asks for single result and it is conditional, so unchanged response is not
+        downloaded at all. Intervals between polls are given by poll schedule.
+
+        :returns -- Boolean, False when timeout limit was reached
+        """
+        poll_options = dict(self.url_options, limit=1, page=0)
+        etag = last_modified = None
+        while self.sleep_before_poll():
+            response_data, etag, last_modified = self.query_api_conditional(
+                self.resultsdb_api_url, poll_options, etag, last_modified)
+            if response_data is not None and response_data.get('data'):
+                return True
+        return False
+
+    def wait_for_jobs(self, job_names):
+        """
+        Method for waiting until results of given jobs are published to resultsDB
+        All jobs are polled in single loop and results of every job are queried as soon as
+        they are published. Waiting is finished right when tier verdict is final, e.g. when
+        failure of one job is published while other jobs are still pending.
+
+        :param job_names -- job names which have not published results yet
+        """
+        pending_jobs = {job_name: (None, None) for job_name in job_names}
+        while pending_jobs and not self.gate.is_decided():
+            if not self.sleep_before_poll():
+                raise ResultsDBApiException("Timeout limit reached and no data were queried.")
+            for job_name in list(pending_jobs):
+                poll_options = dict(self.url_options, limit=1, page=0)
+                poll_options['job_name'] = job_name
+                poll_options.pop('since', None)
+                etag, last_modified = pending_jobs[job_name]
+                response_data, etag, last_modified = self.query_api_conditional(
+                    self.resultsdb_api_url, poll_options, etag, last_modified)
+                if response_data is None or not response_data.get('data'):
+                    pending_jobs[job_name] = (etag, last_modified)
+                    continue
+                del pending_jobs[job_name]
+                self.job_names_result[job_name] = self.query_job_results(job_name)
+                if self.gate.is_decided():
+                    break
+
+    def sleep_before_poll(self):
+        """
+        Method for sleeping until next poll, intervals are given by poll schedule
+
+        :returns -- Boolean, False when timeout limit was reached
+        """
+        if self.TIMEOUT_LIMIT <= 0:
+            return False
+        interval = min(self.poll_schedule.next_interval(), self.TIMEOUT_LIMIT)
+        logging.info("job name has not published results to resultsDB yet, "
+                     "sleeping {} seconds...".format(interval))
+        time.sleep(interval)
+        self.TIMEOUT_LIMIT -= interval
+        if self.progress is not None:
+            self.progress.set_timeout_left(self.TIMEOUT_LIMIT)
+        return True
 
     @staticmethod
     def setup_output_data(resultsdb_data):
@@ -110,7 +489,10 @@ class ResultsDBApi(MetamorphPlugin):
         """
         Method which format's queried dictionary from upper methods
         Need's to have it in predefined output format.
-        See: tests/sources/resultdsdb_output_result.json
+        See: tests/sources/resultsdb_output_result.json
+        Tier tag is None when tier did not fail and results of some job are missing. When job
+        names are given, jobs without results are listed in missing_jobs.
+        See: tests/sources/resultsdb_output_missing_result.json
 
         :returns -- Formatted dictionary
         """
@@ -122,6 +504,14 @@ class ResultsDBApi(MetamorphPlugin):
             ci_tier['job_name'].append({single_job: self.format_job_name_result(
                 self.job_names_result[single_job])})
         ci_tier['tier_tag'] = self.tier_tag
+        if self.job_names:
+            ci_tier['missing_jobs'] = [job_name for job_name in self.job_names
+                                       if not self.job_names_result.get(job_name)]
+            missing = bool(ci_tier['missing_jobs'])
+        else:
+            missing = not any(self.job_names_result.values())
+        if self.tier_tag and missing:
+            ci_tier['tier_tag'] = None
         result = {"tier": ci_tier}
         return dict(results=result)
 
@@ -129,35 +519,22 @@ class ResultsDBApi(MetamorphPlugin):
         """
         Formats single job name data into dictionary
 
-        :param job_name_result -- list of single jenkins job queried data
+        :param job_name_result -- list of single jenkins job ResultRecord objects or raw
+                                  queried data
         :returns -- Formatted single job data
         """
         formatted_data = []
         for single_job_result in job_name_result:
-            formatted_data.append(dict(build_url=single_job_result['ref_url'].split('/console')[0],
-                                       build_number=self.get_build_number_from_url(
-                                           single_job_result['ref_url']),
-                                       build_status=single_job_result['outcome']))
-            if single_job_result['outcome'] == 'FAILED':
+            if not isinstance(single_job_result, ResultRecord):
+                single_job_result = ResultRecord.from_result(single_job_result)
+            formatted_data.append(dict(build_url=single_job_result.build_url,
+                                       build_number=single_job_result.build_number,
+                                       build_status=single_job_result.outcome))
+            if single_job_result.outcome == 'FAILED':
                 self.tier_tag = False
 
         return formatted_data
 
-    @staticmethod
-    def get_build_number_from_url(job_build_url):
-        """
-        Method for parsing job build id from job build url
-
-        :param job_build_url -- job build url containing job build id
-        :returns -- job build id
-        """
-        splitted = job_build_url.split('/')
-        if splitted[-1].isnumeric():
-            return splitted[-1]
-        elif splitted[-2].isnumeric():
-            return splitted[-2]
-        return "unknown"
-
 
 def parse_args():
     """Parse command line arguments."""
@@ -177,7 +554,10 @@ def parse_args():
     nvr = parser.add_mutually_exclusive_group(required=True)
     nvr.add_argument("--nvr",
                      type=str,
-                     help="NVR of tested component")
+                     help="NVR of tested component. Many comma separated nvrs are queried "
+                          "at once and every (nvr, tier) pair gets its own output. "
+                          "--result-store, --fail-fast, --pass-fast and --latest-only are "
+                          "not allowed then.")
     nvr.add_argument("--ci-message",
                      type=str,
                      help="Path to ci-message json file which contains nvr information")
@@ -187,13 +567,42 @@ def parse_args():
     parser.add_argument("--test-tier",
                         type=str,
                         required=True,
-                        help="Tier of tested Jenkins job.")
+                        help="Tier of tested Jenkins job. Many tiers may be separated by comma, "
+                             "see --nvr.")
+    parser.add_argument('--result-store',
+                        metavar='<store-database>',
+                        help="Path to SQLite database of local result store. Only results "
+                             "submitted since previous run are queried from resultsDB then.")
+    parser.add_argument('--fail-fast',
+                        action='store_true',
+                        help="Stop querying as soon as any FAILED outcome is observed. "
+                             "Tier can not pass then.")
+    parser.add_argument('--pass-fast',
+                        action='store_true',
+                        help="Stop querying job once it has passed and stop whole query once "
+                             "all given job names passed. Older results are not checked then.")
+    parser.add_argument('--latest-only',
+                        action='store_true',
+                        help="Query only latest result of every job by resultsDB latest results "
+                             "endpoint. Result history is paged when it is not offered.")
+    parser.add_argument('--expected-wait',
+                        metavar='<seconds>',
+                        type=int,
+                        default=0,
+                        help="Seconds after which results are expected to be published. "
+                             "ResultsDB is polled rarely before and often right after it.")
     parser.add_argument('--output',
                         metavar='<output-metadata-file>',
                         default='metamorph.json',
                         help='Output metadata file name where CI Message data will be stored',
                         nargs='?')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if ',' in (args.nvr or '') or ',' in args.test_tier:
+        for option in ('result_store', 'fail_fast', 'pass_fast', 'latest_only'):
+            if getattr(args, option):
+                parser.error("argument --{}: not allowed with many comma separated nvrs "
+                             "or tiers".format(option.replace('_', '-')))
+    return args
 
 
 def get_nvr_information(args):
@@ -206,8 +615,8 @@ def get_nvr_information(args):
     if args.ci_message:
         with open(args.ci_message) as ci_message:
             message_data = json.load(ci_message)
-        args.nvr = "{0}-{1}-{2}".format(message_data['package'], message_data['version'],
-                                        message_data['release'])
+        args.nvr = str(NVR(message_data['package'], message_data['version'],
+                           message_data['release']))
     elif args.env_variable:
         args.nvr = os.getenv(args.env_variable, "UNKNOWN")
 
@@ -218,8 +627,18 @@ def main():
     logging.captureWarnings(True)
     args = parse_args()
     get_nvr_information(args)
+    component_nvrs = args.nvr.split(',')
+    test_tiers = args.test_tier.split(',')
+    if len(component_nvrs) > 1 or len(test_tiers) > 1:
+        clients = ResultsDBApi.query_batch(args.job_names, component_nvrs, test_tiers,
+                                           args.resultsdb_api_url, args.ca_bundle,
+                                           expected_wait=args.expected_wait)
+        result = [client.format_result() for client in clients.values()]
+        MetamorphPlugin.write_json_file(dict(resultsDB=result), args.output)
+        return
     resultsdb = ResultsDBApi(args.job_names, args.nvr, args.test_tier, args.resultsdb_api_url,
-                             args.ca_bundle)
+                             args.ca_bundle, args.result_store, args.fail_fast,
+                             args.pass_fast, args.latest_only, args.expected_wait)
     resultsdb.get_test_tier_status_metadata()
     result = resultsdb.format_result()
     resultsdb.write_json_file(dict(resultsDB=result), args.output)
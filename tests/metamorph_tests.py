@@ -1,20 +1,175 @@
+import argparse
 import unittest
+import unittest.mock
 import json
 import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import yaml
+import stomp
+
+from concurrent.futures import ThreadPoolExecutor
 
 from metamorph.library.message_data_extractor import MessageDataExtractor as MessageDataExtractorAnsible
-from metamorph.plugins.morph_messagehub import env_run
-from metamorph.plugins.morph_resultsdb import ResultsDBApi
-from metamorph.plugins.morph_pdc import PDCApi
+from metamorph.plugins.morph_messagehub import env_run, file_run, get_host_and_ports, MessageBusMultiplexer
+from metamorph.lib.git_mirror import GitMirrorCache, GitMirrorException, read_remote_files
+from metamorph.lib.json_stream import load_chunks, iter_text_chunks
+from metamorph.lib.metadata_location import MetadataLocations
+from metamorph.lib.message_archive import MessageArchive
+from metamorph.lib.pagination import AdaptivePageSize, iter_pages, query_pages
+from metamorph.plugins.morph_resultsdb import ResultsDBApi, ResultsDBApiException
+from metamorph.plugins.morph_pdc import PDCApi, PDCApiException, fields_mapping
+from metamorph.plugins.morph_pdc_mirror import PDCMirrorExporter
+from metamorph.lib.nvr import NVR, NEVRA, NVRException, parse_compose_ids, parse_nevra, parse_nvrs
+from metamorph.lib.pdc_mirror import PDCMirror, PDCMirrorException
+from metamorph.lib.polling import PollSchedule
+from metamorph.lib.progress import QueryProgress, QueryProgressException
+from metamorph.lib.result_record import ResultRecord, ingest_results
+from metamorph.lib.result_store import ResultStore
+from metamorph.lib.rpm_mapping import RpmMappingScheduler
 from metamorph.library.pdc import PDCApi as PDCApiAnsible
-from metamorph.plugins.morph_message_data_extractor import MessageDataExtractor
+from metamorph.plugins.morph_message_data_extractor import MessageDataExtractor, bulk_extract
 from metamorph.library.resultsdb import ResultsDBApi as ResultsDBApiAnsible
 from metamorph.plugins.morph_provision import Provision, ProvisionException
+from git import Actor, Repo
+from git.exc import GitCommandError
 
 
 class SimpleClass(object):
-    def __init__(self, env_variable):
+    def __init__(self, env_variable, ci_message_file=None):
         self.env_variable = env_variable
+        self.ci_message_file = ci_message_file
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.subscribed = {}
+        self.unsubscribed = []
+        self.disconnected = False
+
+    def set_listener(self, name, listener):
+        pass
+
+    def start(self):
+        pass
+
+    def connect(self, login, passcode, wait):
+        pass
+
+    def disconnect(self):
+        self.disconnected = True
+
+    def subscribe(self, destination, id, ack, headers):
+        self.subscribed[id] = headers
+
+    def unsubscribe(self, id):
+        self.unsubscribed.append(id)
+
+
+class RefusingConnection(FakeConnection):
+    def connect(self, login, passcode, wait):
+        raise stomp.exception.ConnectFailedException()
+
+
+class PagedPDCApi(PDCApi):
+    """PDCApi which queries fake paginated pdc list endpoint"""
+    RECORDS = 450
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.queried_pages = []
+
+    def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+        page, page_size = url_options['page'], url_options['page_size']
+        self.queried_pages.append((page, page_size))
+        start = (page - 1) * page_size
+        results = [{'id': record_id} for record_id in range(start, min(start + page_size, self.RECORDS))]
+        return {'count': self.RECORDS, 'results': results,
+                'next': 'next' if start + page_size < self.RECORDS else None}
+
+
+class FakePDCApi(PDCApi):
+    """PDCApi which queries fake pdc built from tests/sources/test_rpm_mappings.json"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__("https://pdc", "", *args, **kwargs)
+        with open("./tests/sources/test_rpm_mappings.json") as rpm_mapping_input:
+            self.pdc_data = json.load(rpm_mapping_input)
+        for records in self.pdc_data.values():
+            for record_id, record in enumerate(records):
+                record['id'] = record_id
+        self.changesets = []
+        self.queried_urls = []
+
+    def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+        self.queried_urls.append(url)
+        endpoint = url[len(self.pdc_api_url):].strip('/?').split('/')
+        if endpoint[0] == 'releases':
+            return {'release_id': endpoint[1], 'component': endpoint[3]}
+        elif endpoint[0] == 'changesets':
+            return {'count': len(self.changesets), 'next': None, 'results': self.changesets}
+        elif len(endpoint) == 2:
+            records = [record for record in self.pdc_data[endpoint[0]]
+                       if record['id'] == int(endpoint[1])]
+            return records[0] if records else None
+        name = url_options.get('name', '').strip('^$')
+        results = [record for record in self.pdc_data.get(endpoint[0], [])
+                   if not name or record['name'] == name]
+        return {'count': len(results), 'next': None, 'results': results}
+
+
+class FakeResultsDBApi(ResultsDBApi):
+    """
+    ResultsDBApi which queries fake resultsdb, results are filtered by since option
+    Latest results are distinct by testcase and filtered only by testcases option.
+    """
+
+    def __init__(self, results, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.results = results
+        self.latest_results = None
+        self.queried_options = []
+        self.queried_urls = []
+        self.max_page_size = None
+
+    def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+        self.queried_urls.append(url)
+        if url.endswith('/latest'):
+            if self.latest_results is None:
+                return None
+            latest_results = dict()
+            for result in self.latest_results:
+                if result['testcase']['name'] in url_options.get('testcases', result['testcase']['name']):
+                    latest_results.setdefault(result['testcase']['name'], result)
+            return {'data': list(latest_results.values())}
+        self.queried_options.append(dict(url_options))
+        results = [result for result in self.results
+                   if result['submit_time'] >= url_options.get('since', '') and
+                   all(str(result['data'][option][0]) in str(url_options[option]).split(',')
+                       for option in ('job_name', 'item', 'CI_tier')
+                       if url_options.get(option) and option in result['data'])]
+        page_size = min(url_options['limit'], self.max_page_size or url_options['limit'])
+        start = url_options['page'] * page_size
+        page_end = start + page_size
+        return {'data': results[start:page_end], 'next': 'next' if page_end < len(results) else None}
+
+
+def create_git_repository(path, files):
+    """Creates git repository with single commit of given files which allows partial clone"""
+    repo = Repo.init(path)
+    for file_path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(path, file_path)), exist_ok=True)
+        with open(os.path.join(path, file_path), 'w') as repo_file:
+            repo_file.write(content)
+    repo.index.add(list(files))
+    repo.index.commit("Initial commit", author=Actor("test", "test@example.com"),
+                      committer=Actor("test", "test@example.com"))
+    repo.git.config('uploadpack.allowFilter', 'true')
+    return repo
 
 
 class MyTestCase(unittest.TestCase):
@@ -41,9 +196,292 @@ class MyTestCase(unittest.TestCase):
         extractor.ci_message = message
         self.assertEqual(extractor.check_valid_ci_message(), True)
         self.assertEqual(extractor.get_build_data(), output)
+
+    def test_data_extractor_bulk(self):
+        header = {"owner": "jkulda", "method": "build", "target": "rhel-7.1-candidate", "new": "CLOSED",
+                  "package": "setup", "version": "2.8.71", "release": "5.el7_1"}
+        running = dict(header, new="RUNNING")
+        with tempfile.TemporaryDirectory() as work_dir:
+            messages_path = os.path.join(work_dir, 'messages.jsonl')
+            with open(messages_path, 'w') as messages:
+                for message_header in (header, running, header):
+                    messages.write(json.dumps({'header': message_header}) + '\n')
+                messages.write('{"header": \n')
+            output = os.path.join(work_dir, 'output.jsonl')
+            rejected_output = os.path.join(work_dir, 'rejected.jsonl')
+            self.assertTupleEqual(bulk_extract(messages_path, output, rejected_output, processes=2), (2, 2))
+            with open(output) as output_file:
+                results = [json.loads(line) for line in output_file]
+            with open(rejected_output) as rejected_file:
+                rejected = [json.loads(line)['source'] for line in rejected_file]
+        self.assertListEqual([result['source'] for result in results],
+                             [messages_path + ':1', messages_path + ':3'])
+        self.assertEqual(results[0]['ci_message_data']['scratch'], 'false')
+        self.assertListEqual(rejected, [messages_path + ':2', messages_path + ':4'])
     # End of message data extractor tests
 
     # Messagehub testing section
+    @staticmethod
+    def get_fake_result(job_name, build, outcome='PASSED', item=None, tier=None, testcase=None):
+        result = {'ref_url': 'http://jenkins/job/{0}/{1}/console'.format(job_name, build), 'outcome': outcome,
+                  'submit_time': '2017-03-26T10:00:{:02d}'.format(build), 'data': {'job_name': [job_name]},
+                  'testcase': {'name': testcase or job_name}}
+        if item:
+            result['data'].update(item=[item], CI_tier=[tier])
+        return result
+
+    def test_resultsdb_latest_results(self):
+        results = [self.get_fake_result(job_name, build) for job_name in ('first', 'second') for build in range(50)]
+        resultsdb = FakeResultsDBApi(results, ["first", "second"], "setup-2.8.71-5.el7_1", "1", "https://resultsdb/", "",
+                                     latest_only=True)
+        resultsdb.latest_results = [results[0], results[50]]
+        job_names_result = resultsdb.get_test_tier_status_metadata()
+        self.assertListEqual(resultsdb.queried_urls, ["https://resultsdb/", "https://resultsdb/latest"] * 2)
+        self.assertListEqual(job_names_result['second'], [ResultRecord.from_result(results[50])])
+        resultsdb = FakeResultsDBApi(results, ["first", "second"], "setup-2.8.71-5.el7_1", "1", "https://resultsdb/", "",
+                                     latest_only=True)
+        job_names_result = resultsdb.get_test_tier_status_metadata()
+        self.assertListEqual(resultsdb.queried_urls, ["https://resultsdb/", "https://resultsdb/latest",
+                                                      "https://resultsdb/", "https://resultsdb/"])
+        self.assertEqual(len(job_names_result['second']), 50)
+
+    def test_resultsdb_latest_results_by_testcase(self):
+        results = [self.get_fake_result('first', 2, 'FAILED', testcase='dist.depcheck'),
+                   self.get_fake_result('second', 1, testcase='dist.depcheck'),
+                   self.get_fake_result('first', 1, testcase='dist.rpmlint')]
+        resultsdb = FakeResultsDBApi(results, ["first", "second"], "setup-2.8.71-5.el7_1", "1", "https://resultsdb/", "",
+                                     latest_only=True)
+        resultsdb.latest_results = results
+        job_names_result = resultsdb.get_test_tier_status_metadata()
+        self.assertDictEqual(resultsdb.job_testcases, {'first': 'dist.depcheck', 'second': 'dist.depcheck'})
+        self.assertListEqual(job_names_result['first'], [ResultRecord.from_result(results[0])])
+        self.assertListEqual(job_names_result['second'], [ResultRecord.from_result(results[1])])
+        # Latest results of all jobs would collapse jobs sharing testcase, history is paged
+        resultsdb = FakeResultsDBApi(results, [], "setup-2.8.71-5.el7_1", "1", "https://resultsdb/", "",
+                                     latest_only=True)
+        resultsdb.latest_results = results
+        job_names_result = resultsdb.get_test_tier_status_metadata()
+        self.assertListEqual(resultsdb.queried_urls, ["https://resultsdb/"])
+        self.assertEqual(len(job_names_result['first']), 2)
+
+    def test_poll_schedule(self):
+        schedule = PollSchedule(expected_wait=600, short_interval=15, long_interval=300, growth=2)
+        self.assertListEqual([schedule.next_interval() for _ in range(8)], [300, 300, 15, 30, 60, 120, 240, 300])
+
+    def test_resultsdb_conditional_wait(self):
+        results = [self.get_fake_result('runtest', build) for build in range(3)]
+        resultsdb = FakeResultsDBApi([], ["runtest"], "setup-2.8.71-5.el7_1", "1", "https://resultsdb/", "")
+        polls = []
+
+        def query_api_conditional(url, url_options, etag=None, last_modified=None):
+            polls.append((dict(url_options), etag))
+            if len(polls) == 3:
+                resultsdb.results = results
+                return {'data': results[:1]}, 'changed', None
+            return (None if etag else {'data': []}), 'unchanged', None
+
+        resultsdb.query_api_conditional = query_api_conditional
+        with unittest.mock.patch('time.sleep') as sleep:
+            self.assertEqual(len(resultsdb.get_resultsdb_data("runtest")), 3)
+        self.assertListEqual([options['limit'] for options, _ in polls], [1, 1, 1])
+        self.assertListEqual([etag for _, etag in polls], [None, 'unchanged', 'unchanged'])
+        self.assertListEqual([call[0][0] for call in sleep.call_args_list], [15, 22.5, 33.75])
+        self.assertEqual(len(resultsdb.queried_options), 2)
+        resultsdb = FakeResultsDBApi([], ["runtest"], "setup-2.8.71-5.el7_1", "1", "https://resultsdb/", "")
+        resultsdb.query_api_conditional = lambda *args: (None, None, None)
+        with unittest.mock.patch('time.sleep'):
+            self.assertRaises(ResultsDBApiException, resultsdb.get_resultsdb_data, "runtest")
+        self.assertEqual(resultsdb.TIMEOUT_LIMIT, 0)
+
+    def test_resultsdb_status_file_resume(self):
+        results = [self.get_fake_result(job_name, build) for job_name in ('first', 'second') for build in range(250)]
+
+        class InterruptedResultsDBApi(FakeResultsDBApi):
+            def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+                if len(self.queried_options) == 3:
+                    raise KeyboardInterrupt
+                return super().query_api(url, url_options, attempt, ca_cert)
+
+        with tempfile.TemporaryDirectory() as status_dir:
+            status_file = os.path.join(status_dir, 'status.json')
+            job_names = ["first", "second"]
+            resultsdb = InterruptedResultsDBApi(results, job_names, "setup-2.8.71-5.el7_1", "1", "", "",
+                                                status_file=status_file)
+            resultsdb.page_size = AdaptivePageSize(initial=100, maximum=100)
+            self.assertRaises(KeyboardInterrupt, resultsdb.get_test_tier_status_metadata)
+            partial = ResultsDBApi(job_names, "setup-2.8.71-5.el7_1", "1", "", "")
+            state = QueryProgress.read(status_file)
+            partial_result = partial.load_progress(state)
+            self.assertFalse(state['finished'])
+            self.assertEqual(len(partial_result['first']), 200)
+            self.assertEqual(len(partial_result['second']), 100)
+            resultsdb = FakeResultsDBApi(results, job_names, "setup-2.8.71-5.el7_1", "1", "", "",
+                                         status_file=status_file)
+            job_names_result = resultsdb.get_test_tier_status_metadata()
+            self.assertTrue(QueryProgress.read(status_file)['finished'])
+        self.assertListEqual([(options['job_name'], options['page']) for options in resultsdb.queried_options],
+                             [('second', 1)])
+        self.assertEqual(len(job_names_result['second']), 200)
+        self.assertListEqual(job_names_result['first'], partial_result['first'])
+
+    def test_query_progress(self):
+        results = [{'ref_url': 'http://jenkins/job/first/{}/console'.format(build)} for build in range(4)]
+        with tempfile.TemporaryDirectory() as status_dir:
+            status_file = os.path.join(status_dir, 'status.json')
+            progress = QueryProgress(status_file, {'item': 'setup-2.8.71-5.el7_1'})
+            progress.add_results('first', results[:2], 2)
+            progress.add_results('first', results[2:], 2)
+            # Only counters are kept in status file, every page is appended once
+            with open(status_file) as status:
+                self.assertDictEqual(json.load(status)['jobs'],
+                                     {'first': {'count': 4, 'page_size': 2, 'done': False}})
+            with open(status_file + QueryProgress.RESULTS_SUFFIX) as results_file:
+                self.assertEqual(len(results_file.readlines()), 2)
+            # Page appended without counter update (interrupted query) is dropped on resume
+            with open(status_file + QueryProgress.RESULTS_SUFFIX, 'a') as results_file:
+                results_file.write(json.dumps({'job_name': 'first', 'results': results[:1]}) + '\n')
+            resumed = QueryProgress(status_file, {'item': 'setup-2.8.71-5.el7_1'})
+            self.assertListEqual(resumed.get_job('first')['results'], results)
+            self.assertListEqual(QueryProgress.read(status_file)['jobs']['first']['results'], results)
+            self.assertRaises(QueryProgressException, QueryProgress, status_file, {'item': 'other-1-1'})
+            self.assertRaises(QueryProgressException, QueryProgress.read, status_file, {'item': 'other-1-1'})
+            resumed.finish()
+            self.assertFalse(QueryProgress(status_file, {'item': 'other-1-1'}).resumed)
+
+    def test_resultsdb_batch_query(self):
+        nvrs = ["setup-2.8.71-{}.el7".format(release) for release in range(5)]
+        results = [self.get_fake_result('runtest', build, 'FAILED' if (build, tier) == (2, '3') else 'PASSED',
+                                        nvrs[build], tier)
+                   for build in range(5) for tier in ('1', '2', '3')]
+        queried_options = []
+
+        class BatchResultsDBApi(FakeResultsDBApi):
+            def __init__(self, *args, **kwargs):
+                super().__init__(results, *args, **kwargs)
+                self.queried_options = queried_options
+
+        clients = BatchResultsDBApi.query_batch(["runtest"], nvrs[:4], [1, 2, 3], "", "", batch_size=2)
+        self.assertEqual(len(queried_options), 2)
+        self.assertEqual(queried_options[0]['item'], ','.join(nvrs[:2]))
+        self.assertEqual(queried_options[0]['CI_tier'], '1,2,3')
+        self.assertEqual(len(clients), 12)
+        formatted_result = clients[(nvrs[2], '3')].format_result()['results']['tier']
+        self.assertFalse(formatted_result['tier_tag'])
+        self.assertEqual(formatted_result['nvr'], nvrs[2])
+        self.assertTrue(clients[(nvrs[2], '1')].format_result()['results']['tier']['tier_tag'])
+        self.assertListEqual(clients[(nvrs[0], '2')].job_names_result['runtest'],
+                             [ResultRecord.from_result(results[1])])
+
+    def test_resultsdb_batch_query_busy_nvr(self):
+        results = [self.get_fake_result('runtest', 59, 'PASSED', 'a-1-1', '1') for _ in range(500)]
+        results.append(self.get_fake_result('runtest', 1, 'FAILED', 'b-1-1', '1'))
+
+        class BusyResultsDBApi(FakeResultsDBApi):
+            def __init__(self, *args, **kwargs):
+                super().__init__(results, *args, **kwargs)
+
+        clients = BusyResultsDBApi.query_batch(["runtest"], ['a-1-1', 'b-1-1'], [1], "", "")
+        self.assertEqual(len(clients[('a-1-1', '1')].job_names_result['runtest']), 1)
+        busy_result = clients[('a-1-1', '1')].format_result()['results']['tier']
+        self.assertTrue(busy_result['tier_tag'])
+        failed_result = clients[('b-1-1', '1')].format_result()['results']['tier']
+        self.assertEqual(len(failed_result['job_name'][0]['runtest']), 1)
+        self.assertFalse(failed_result['tier_tag'])
+
+    def test_resultsdb_batch_query_missing_pair(self):
+        results = [self.get_fake_result('runtest', 1, 'PASSED', 'a-1-1', '1')]
+
+        class MissingResultsDBApi(FakeResultsDBApi):
+            def __init__(self, *args, **kwargs):
+                super().__init__(results, *args, **kwargs)
+
+        clients = MissingResultsDBApi.query_batch(["runtest"], ['a-1-1', 'b-1-1'], [1], "", "")
+        self.assertTrue(clients[('a-1-1', '1')].format_result()['results']['tier']['tier_tag'])
+        missing_result = clients[('b-1-1', '1')].format_result()['results']['tier']
+        self.assertIsNone(missing_result['tier_tag'])
+        self.assertListEqual(missing_result['missing_jobs'], ['runtest'])
+
+    def test_result_records_ingestion(self):
+        with open("./tests/sources/resultsdb_output.json") as resultsdb_output:
+            results = json.load(resultsdb_output)['data']
+        records = list(ingest_results(results).values())
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].build_url, results[0]['ref_url'].split('/console')[0])
+        self.assertEqual(records[0].build_number, '864')
+        self.assertFalse(hasattr(records[0], '__dict__'))
+        resultsdb = ResultsDBApi("", "", "", "", "")
+        self.assertListEqual(resultsdb.format_job_name_result(records), resultsdb.format_job_name_result(results[:1]))
+
+    def test_resultsdb_ingest_pages(self):
+        results = [self.get_fake_result('runtest', build // 2) for build in range(300)]
+        resultsdb = FakeResultsDBApi(results, ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "")
+        resultsdb.page_size = AdaptivePageSize(initial=100, maximum=100)
+        ingested_pages = []
+
+        def ingest_page(page, records):
+            ingested_pages.append(len(page))
+            return ingest_results(page, records)
+
+        with unittest.mock.patch('metamorph.plugins.morph_resultsdb.ingest_results', side_effect=ingest_page):
+            records = resultsdb.get_resultsdb_data("runtest", limit=250, ingest=True)
+        # Every page is ingested right when it is queried, duplicities are dropped
+        self.assertListEqual(ingested_pages, [100, 100, 50])
+        self.assertEqual(len(records), 125)
+        self.assertIsInstance(records[0], ResultRecord)
+
+    def test_resultsdb_fail_fast(self):
+        results = [self.get_fake_result('first', build, 'FAILED' if build == 150 else 'PASSED')
+                   for build in range(300)] + [self.get_fake_result('second', 1)]
+        resultsdb = FakeResultsDBApi(results, ["first", "second"], "setup-2.8.71-5.el7_1", "1", "", "",
+                                     fail_fast=True)
+        resultsdb.page_size = AdaptivePageSize(initial=100, maximum=100)
+        resultsdb.get_test_tier_status_metadata()
+        self.assertListEqual([options['job_name'] for options in resultsdb.queried_options], ['first', 'first'])
+        self.assertFalse(resultsdb.format_result()['results']['tier']['tier_tag'])
+
+    def test_resultsdb_fail_fast_while_waiting(self):
+        resultsdb = FakeResultsDBApi([self.get_fake_result('second', 1, 'FAILED')], ["first", "second"],
+                                     "setup-2.8.71-5.el7_1", "1", "", "", fail_fast=True, expected_wait=3600)
+        with unittest.mock.patch('time.sleep') as sleep:
+            job_names_result = resultsdb.get_test_tier_status_metadata()
+        sleep.assert_not_called()
+        self.assertListEqual(list(job_names_result), ['first', 'second'])
+        self.assertListEqual(job_names_result['first'], [])
+        self.assertFalse(resultsdb.format_result()['results']['tier']['tier_tag'])
+
+        resultsdb = FakeResultsDBApi([], ["first", "second"], "setup-2.8.71-5.el7_1", "1", "", "",
+                                     fail_fast=True, expected_wait=3600)
+        polls = []
+
+        def query_api_conditional(url, url_options, etag=None, last_modified=None):
+            polls.append(url_options['job_name'])
+            return resultsdb.query_api(url, url_options), None, None
+
+        def publish(interval):
+            resultsdb.results.append(self.get_fake_result('second', 1, 'FAILED'))
+
+        resultsdb.query_api_conditional = query_api_conditional
+        with unittest.mock.patch('time.sleep', side_effect=publish) as sleep:
+            job_names_result = resultsdb.get_test_tier_status_metadata()
+        self.assertEqual(sleep.call_count, 1)
+        self.assertListEqual(polls, ['first', 'second'])
+        self.assertListEqual(job_names_result['first'], [])
+        self.assertEqual(len(job_names_result['second']), 1)
+        self.assertFalse(resultsdb.format_result()['results']['tier']['tier_tag'])
+
+    def test_resultsdb_pass_fast(self):
+        results = [self.get_fake_result(job_name, build) for job_name in ('first', 'second') for build in range(300)]
+        resultsdb = FakeResultsDBApi(results, ["first", "second"], "setup-2.8.71-5.el7_1", "1", "", "",
+                                     pass_fast=True)
+        resultsdb.page_size = AdaptivePageSize(initial=100, maximum=100)
+        job_names_result = resultsdb.get_test_tier_status_metadata()
+        self.assertEqual(len(resultsdb.queried_options), 2)
+        self.assertTrue(resultsdb.gate.is_decided())
+        self.assertEqual(len(job_names_result['second']), 100)
+        resultsdb = FakeResultsDBApi(results, ["first", "second"], "setup-2.8.71-5.el7_1", "1", "", "")
+        resultsdb.page_size = AdaptivePageSize(initial=100, maximum=100)
+        self.assertEqual(len(resultsdb.get_test_tier_status_metadata()['second']), 200)
+
     def test_env_message_part(self):
         data = {"old": "OPEN", "new": "FAILED", "attribute": "state"}
         os.environ['TEST'] = json.dumps(data)
@@ -63,6 +501,151 @@ class MyTestCase(unittest.TestCase):
         os.environ['TEST'] = data
         output = env_run(SimpleClass('TEST'))
         self.assertDictEqual(output, data_without_newlines)
+
+    def test_env_message_part_with_escaped_newlines(self):
+        os.environ['TEST'] = '{"old": "OP\\nEN", "new": ["FAI\\nLED", {"attri\\nbute": "state"}]}'
+        output = env_run(SimpleClass('TEST'))
+        self.assertDictEqual(output, {"old": "OPEN", "new": ["FAILED", {"attribute": "state"}]})
+
+    def test_env_message_with_escaped_newlines_between_tokens(self):
+        os.environ['TEST'] = '{\\n "a": 1,\\n "b": "x\\ny"\\n}'
+        self.assertDictEqual(env_run(SimpleClass('TEST')), {"a": 1, "b": "xy"})
+        for chunk_size in (1, 2, 3):
+            self.assertDictEqual(load_chunks(iter_text_chunks(os.environ['TEST'], chunk_size),
+                                             erase_newlines=True), {"a": 1, "b": "xy"})
+
+    def test_streaming_json_chunk_boundaries(self):
+        data = {"header": {"package": "setup", "weight": -0.25e-2, "count": 12345, "parent": None},
+                "message": [True, False, [], {}, "x" * 100, "\u017e\"quoted\""]}
+        text = json.dumps(data, indent=1)
+        for chunk_size in (1, 2, 7, 64):
+            self.assertDictEqual(load_chunks(iter_text_chunks(text, chunk_size)), data)
+        self.assertRaises(ValueError, load_chunks, iter_text_chunks('{"a": [1 2]}', 3))
+        self.assertRaises(ValueError, load_chunks, iter_text_chunks('{"a": 1} extra', 3))
+
+    def test_file_message_part(self):
+        data = {"old": "OPEN", "new": "FAILED", "attribute": "state"}
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as ci_message_file:
+            json.dump(data, ci_message_file)
+            ci_message_file.flush()
+            output = file_run(SimpleClass(None, ci_message_file.name))
+        self.assertDictEqual(output, data)
+
+    def test_message_archive_lookup(self):
+        messages = [{'header': {'message-id': 'id-{}'.format(i), 'package': 'setup', 'version': '2.8.71',
+                                'release': '{}.el7'.format(i % 2)},
+                     'message': '{"index": %d}' % i} for i in range(4)]
+        with tempfile.TemporaryDirectory() as archive_dir:
+            writer = MessageArchive(archive_dir)
+            with MessageArchive(archive_dir) as archive:
+                self.assertListEqual(archive.find_by_nvr('setup-2.8.71-1.el7'), [])
+                for message in messages:
+                    writer.append(message)
+                self.assertListEqual(archive.find_by_nvr('setup-2.8.71-1.el7'), [messages[1], messages[3]])
+                self.assertDictEqual(archive.find_by_message_id('id-2'), messages[2])
+                self.assertIsNone(archive.find_by_message_id('id-5'))
+                writer.append({'header': {'message-id': 'id-5'}, 'message': ''})
+                self.assertEqual(archive.find_by_message_id('id-5')['header']['message-id'], 'id-5')
+
+    def test_multiplexer_routes_messages_by_subscription(self):
+        multiplexer = MessageBusMultiplexer([('host', 61613)], 'user', 'password')
+        multiplexer.conn = FakeConnection()
+        first = multiplexer.subscribe('/topic/CI', "package = 'setup'", 1)
+        second = multiplexer.subscribe('/topic/CI', None, 2)
+        self.assertDictEqual(multiplexer.conn.subscribed,
+                             {first.subscription_id: {'selector': "package = 'setup'"},
+                              second.subscription_id: {}})
+        multiplexer.on_message({'subscription': second.subscription_id}, 'second-1')
+        multiplexer.on_message({'subscription': first.subscription_id}, 'first-1')
+        multiplexer.on_message({'subscription': first.subscription_id}, 'first-2')
+        self.assertEqual(first.wait(0), ({}, [{'header': {'subscription': first.subscription_id},
+                                               'message': 'first-1'}]))
+        self.assertFalse(second.finished.is_set())
+        self.assertListEqual(multiplexer.conn.unsubscribed, [first.subscription_id])
+
+    def test_multiplexer_error_fails_all_subscriptions(self):
+        multiplexer = MessageBusMultiplexer([('host', 61613)], 'user', 'password')
+        multiplexer.conn = FakeConnection()
+        subscriptions = [multiplexer.subscribe('/topic/CI', None, 1) for _ in range(3)]
+        multiplexer.on_error({'message': 'broken'}, 'Error description')
+        for subscription in subscriptions:
+            error_message, data = subscription.wait(0)
+            self.assertEqual(error_message['message'], 'Error description')
+            self.assertListEqual(data, [])
+
+    def test_multiplexer_fails_subscriptions_when_reconnect_fails(self):
+        class UnreachableMultiplexer(MessageBusMultiplexer):
+            def open_connection(self):
+                raise OSError("Connection refused")
+        multiplexer = UnreachableMultiplexer([('host', 61613)], 'user', 'password',
+                                             reconnect_attempts=2, reconnect_delay=0)
+        multiplexer.conn = FakeConnection()
+        subscription = multiplexer.subscribe('/topic/CI', None, 1)
+        multiplexer.reconnect()
+        error_message, data = subscription.wait(0)
+        self.assertTrue(subscription.finished.is_set())
+        self.assertIn('could not be re-established', error_message['message'])
+
+    def test_multiplexer_reconnect_replaces_connection(self):
+        new_connection = FakeConnection()
+        multiplexer = MessageBusMultiplexer([('host', 61613)], 'user', 'password',
+                                            reconnect_attempts=2, reconnect_delay=0)
+        old_connection = multiplexer.conn = FakeConnection()
+        subscription = multiplexer.subscribe('/topic/CI', "package = 'setup'", 1)
+        with unittest.mock.patch('stomp.Connection', return_value=new_connection) as connection, \
+                unittest.mock.patch('threading.Thread') as thread:
+            multiplexer.on_disconnected()
+            multiplexer.on_disconnected()  # Second notification while reconnecting is ignored
+            self.assertEqual(thread.call_count, 1)
+            multiplexer.reconnect()
+        self.assertEqual(connection.call_args[1]['reconnect_attempts_max'], 1)
+        self.assertTrue(old_connection.disconnected)
+        self.assertIs(multiplexer.conn, new_connection)
+        self.assertDictEqual(new_connection.subscribed,
+                             {subscription.subscription_id: {'selector': "package = 'setup'"}})
+        self.assertFalse(multiplexer.reconnecting)
+        multiplexer.disconnect()
+        self.assertTrue(new_connection.disconnected)
+        self.assertIsNone(multiplexer.conn)
+
+    def test_multiplexer_closes_connection_when_connect_fails(self):
+        connections = [RefusingConnection(), RefusingConnection()]
+        multiplexer = MessageBusMultiplexer([('host', 61613)], 'user', 'password',
+                                            reconnect_attempts=2, reconnect_delay=0)
+        with unittest.mock.patch('stomp.Connection', side_effect=connections):
+            with self.assertRaises(stomp.exception.ConnectFailedException):
+                multiplexer.connect()
+        self.assertTrue(all(connection.disconnected for connection in connections))
+        self.assertIsNone(multiplexer.conn)
+
+    def test_subscription_wait_timeout(self):
+        multiplexer = MessageBusMultiplexer([('host', 61613)], 'user', 'password')
+        multiplexer.conn = FakeConnection()
+        subscription = multiplexer.subscribe('/topic/CI', None, 2)
+        multiplexer.on_message({'subscription': subscription.subscription_id}, 'first')
+        error_message, data = subscription.wait(0.01)
+        self.assertEqual(error_message['message'], "Only 1 of 2 CI messages arrived in 0.01 seconds")
+        self.assertEqual(len(data), 1)
+
+    def test_hosts_ordered_by_latency(self):
+        listening = socket.socket()
+        listening.bind(('127.0.0.1', 0))
+        listening.listen(1)
+        listening_address = listening.getsockname()
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        closed_address = closed.getsockname()
+        closed.close()
+        try:
+            ordered = MessageBusMultiplexer.order_hosts_by_latency([closed_address,
+                                                                    listening_address])
+        finally:
+            listening.close()
+        self.assertListEqual(ordered, [listening_address, closed_address])
+
+    def test_host_and_ports_parsing(self):
+        self.assertListEqual(get_host_and_ports('first, second:61614', 61613),
+                             [('first', 61613), ('second', 61614)])
     # End of Messagehub testing section 
 
     def test_data_extractor_check_fail_ansible(self):
@@ -107,12 +690,74 @@ class MyTestCase(unittest.TestCase):
         with open("./tests/sources/resultsdb_output_result.json") as resultsdb_output_result:
             self.assertDictEqual(method_result, json.load(resultsdb_output_result))
 
+    def test_resultdb_output_missing_job(self):
+        resultsdb = ResultsDBApi(["ci-setup-brew-rhel-7.1-z-candidate-2-runtest",
+                                  "ci-setup-brew-rhel-7.1-z-candidate-2-rpmdiff"],
+                                 "setup-2.8.71-5.el7_1", "1", "", "")
+        with open("./tests/sources/resultsdb_output.json") as resultsdb_output:
+            resultsdb.job_names_result = {
+                "ci-setup-brew-rhel-7.1-z-candidate-2-runtest": json.load(resultsdb_output)['data'],
+                "ci-setup-brew-rhel-7.1-z-candidate-2-rpmdiff": []}
+        method_result = resultsdb.format_result()
+        with open("./tests/sources/resultsdb_output_missing_result.json") as resultsdb_output_result:
+            self.assertDictEqual(method_result, json.load(resultsdb_output_result))
+
     def test_resultdb_output1(self):
         resultsdb = ResultsDBApi("", "", "", "", "")
         with open("./tests/sources/resultsdb_output1.json") as resultsdb_output:
             data = {'setup-2.8.71-5.el7_1': json.load(resultsdb_output)['data']}
         resultsdb.job_names_result = data
         self.assertRaises(KeyError, resultsdb.setup_output_data, [data])
+
+    def test_resultsdb_result_store(self):
+        def result(build, submit_time, outcome='PASSED'):
+            return {'ref_url': 'http://jenkins/job/runtest/{}/console'.format(build), 'outcome': outcome,
+                    'submit_time': submit_time, 'data': {'job_name': ['runtest']}}
+
+        results = [result(1, '2017-03-26T10:00:00'), result(2, '2017-03-26T11:00:00')]
+        with tempfile.TemporaryDirectory() as store_dir:
+            store_path = os.path.join(store_dir, 'results.sqlite')
+            resultsdb = FakeResultsDBApi(results, "", "setup-2.8.71-5.el7_1", "1", "", "", store_path)
+            self.assertEqual(len(resultsdb.get_test_tier_status_metadata()['runtest']), 2)
+            self.assertNotIn('since', resultsdb.queried_options[0])
+            newer_results = [result(3, '2017-03-26T12:00:00', 'FAILED'), result(2, '2017-03-26T12:30:00')]
+            resultsdb = FakeResultsDBApi(results + newer_results, ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "",
+                                         store_path)
+            job_results = resultsdb.get_test_tier_status_metadata()['runtest']
+            resultsdb.result_store.close()
+            resultsdb = FakeResultsDBApi([], ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "", store_path)
+            self.assertEqual(len(resultsdb.get_test_tier_status_metadata()['runtest']), 3)
+            store = ResultStore(store_path)
+            self.assertEqual(store.get_refresh_time("setup-2.8.71-5.el7_1", 1), '2017-03-26T11:00:00')
+            store.close()
+        self.assertEqual(resultsdb.queried_options[0]['since'], '2017-03-26T12:30:00')
+        self.assertListEqual([single_result.submit_time for single_result in job_results],
+                             ['2017-03-26T12:30:00', '2017-03-26T12:00:00', '2017-03-26T10:00:00'])
+
+    def test_resultsdb_result_store_refresh_over_limit(self):
+        def result(build):
+            return {'ref_url': 'http://jenkins/job/runtest/{}/console'.format(build), 'outcome': 'PASSED',
+                    'submit_time': '2017-03-26T{0:02d}:{1:02d}:00'.format(build // 60, build % 60),
+                    'data': {'job_name': ['runtest']}}
+
+        new_results = ResultsDBApi.RESULTSDB_RECORD_LIMIT + 50
+        results = [result(build) for build in range(1, new_results + 2)]
+        with tempfile.TemporaryDirectory() as store_dir:
+            store_path = os.path.join(store_dir, 'results.sqlite')
+            resultsdb = FakeResultsDBApi(results[:1], ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "", store_path)
+            resultsdb.get_test_tier_status_metadata()
+            resultsdb.result_store.close()
+            resultsdb = FakeResultsDBApi(list(reversed(results)), ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "",
+                                         store_path)
+            resultsdb.page_size = AdaptivePageSize(initial=100, maximum=100)
+            resultsdb.get_test_tier_status_metadata()
+            resultsdb.result_store.close()
+            store = ResultStore(store_path)
+            stored_results = store.get_results("setup-2.8.71-5.el7_1", 1, "runtest")
+            refresh_time = store.get_refresh_time("setup-2.8.71-5.el7_1", 1, "runtest")
+            store.close()
+        self.assertEqual(len(stored_results), len(results))
+        self.assertEqual(refresh_time, results[-1]['submit_time'])
     # End of resultsDB tests
 
     # PDC tests
@@ -127,8 +772,278 @@ class MyTestCase(unittest.TestCase):
             "rpms": {"name": '^component$', "version": 'version', "release": 'release'},
             "global-component-contacts": {"component": '^component$'}
         }
-        client.setup_pdc_metadata_params("component", "version", "release")
-        self.assertDictEqual(client.pdc_name_mapping, output)
+        self.assertDictEqual(client.setup_pdc_metadata_params("component", "version", "release"), output)
+        second = client.setup_pdc_metadata_params("other", "1.0", "2.el7")
+        self.assertDictEqual(second['rpms'], {"name": '^other$', "version": '1.0', "release": '2.el7'})
+        self.assertEqual(client.pdc_name_mapping['rpms']['name'], '^{}$')
+
+    def test_pdc_concurrent_nvrs(self):
+        class RecordingPDCApi(PDCApi):
+            def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+                if 'rpm-mapping' in url:
+                    return {}
+                results = [{'name': url_options.get('name', url_options.get('component')),
+                            'release': {'release_id': 'rhel-7.1'}, 'linked_composes': ['RHEL-7.1-1']}]
+                return {'next': None, 'results': results}
+        client = RecordingPDCApi("", "", "default-version-release")
+        nvrs = ['component{}-1.0-1.el7'.format(i) for i in range(8)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda nvr: client.get_pdc_metadata_by_component_name(component_nvr=nvr),
+                                        nvrs))
+        for nvr, pdc_metadata in zip(nvrs, results):
+            name = nvr.split('-')[0]
+            self.assertEqual(pdc_metadata['rpms'][0]['name'], '^{}$'.format(name))
+            self.assertEqual(pdc_metadata['bugzilla-components'][0]['name'], name)
+            self.assertDictEqual(pdc_metadata['rpm-mapping'], {'rhel-7.1': {}})
+
+    def test_pdc_fields_projection(self):
+        class RecordingPDCApi(PDCApi):
+            queried_options = {}
+
+            def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+                if 'rpm-mapping' in url:
+                    return {}
+                self.queried_options[url.split('/')[1]] = url_options
+                return {'next': None, 'results': [{'id': 1, 'name': 'bash', 'linked_composes': ['RHEL-7.1-1'],
+                                                   'release': {'release_id': 'rhel-7.1', 'active': True}}]}
+        client = RecordingPDCApi("", "", "bash-4.2.46-19.el7",
+                                 {'release-components': ['release.release_id'], 'rpms': 'name',
+                                  'bugzilla-components': ['id']})
+        pdc_metadata = client.get_pdc_metadata_by_component_name()
+        self.assertListEqual(client.queried_options['rpms']['fields'], ['linked_composes', 'name'])
+        self.assertListEqual(client.queried_options['release-components']['fields'], ['release'])
+        self.assertNotIn('fields', client.queried_options['global-components'])
+        # Endpoint without 'fields' query parameter is projected locally
+        self.assertNotIn('fields', client.queried_options['bugzilla-components'])
+        self.assertListEqual(pdc_metadata['bugzilla-components'], [{'id': 1}])
+        self.assertListEqual(pdc_metadata['release-components'], [{'release': {'release_id': 'rhel-7.1'}}])
+        self.assertDictEqual(pdc_metadata['rpm-mapping'], {'rhel-7.1': {}})
+        self.assertRaises(PDCApiException, PDCApi, "", "", "bash-4.2.46-19.el7", {'unknown': ['name']})
+        self.assertListEqual(fields_mapping('rpms=linked_composes,name'), ['rpms', 'linked_composes,name'])
+        for value in ('rpms', 'rpms=', '=name'):
+            self.assertRaises(argparse.ArgumentTypeError, fields_mapping, value)
+
+    def test_adaptive_page_size(self):
+        page_size = AdaptivePageSize(initial=100, minimum=20, maximum=400, target_latency=1.0)
+        page_size.observe(0.1, 100, 100)
+        self.assertEqual(page_size.next_size(100, 100), 100)
+        self.assertEqual(page_size.next_size(200, 100), 200)
+        page_size.observe(0.1, 50, 200)
+        self.assertEqual(page_size.size, 200)
+        page_size.observe(0.1, 400, 400)
+        page_size.observe(0.1, 400, 400)
+        self.assertEqual(page_size.size, 400)
+        page_size.observe(5, 400, 400)
+        self.assertEqual(page_size.next_size(1200, 400), 200)
+        page_size.observe(5, 20, 20)
+        self.assertEqual(page_size.size, 20)
+
+    def test_adaptive_page_size_server_maximum(self):
+        page_size = AdaptivePageSize(initial=100, minimum=20, maximum=1000, target_latency=1.0)
+        page_size.observe(0.1, 60, 100, has_next=False)  # Short last page
+        self.assertEqual(page_size.size, 100)
+        page_size.observe(0.1, 60, 100, has_next=True)
+        self.assertEqual(page_size.size, 60)
+        page_size.observe(0.1, 60, 60, has_next=True)
+        self.assertEqual(page_size.size, 60)
+        self.assertEqual(page_size.next_size(120, 60), 60)
+
+    def test_pdc_pagination_with_server_maximum(self):
+        class CappedPDCApi(PagedPDCApi):
+            def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+                return super().query_api(url, dict(url_options, page_size=min(url_options['page_size'], 60)))
+
+        client = CappedPDCApi("", "", "bash-4.2.46-19.el7")
+        records = client.query_all_pages('/rpms/?', {}, 1000)
+        self.assertListEqual([record['id'] for record in records], list(range(450)))
+        self.assertEqual(client.page_size.size, 60)
+
+    def test_resultsdb_pagination_with_server_maximum(self):
+        results = [self.get_fake_result('runtest', build) for build in range(500)]
+        resultsdb = FakeResultsDBApi(results, ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "")
+        resultsdb.max_page_size = 150
+        resultsdb.page_size = AdaptivePageSize(initial=100, maximum=400, target_latency=100)
+        queried_data = resultsdb.get_resultsdb_data("runtest", 1000)
+        self.assertListEqual(queried_data, results)
+        self.assertLessEqual(resultsdb.page_size.size, 150)
+        # Offset 200 is not multiple of capped size, page is queried again from offset 199
+        resultsdb = FakeResultsDBApi(results, ["runtest"], "setup-2.8.71-5.el7_1", "1", "", "")
+        resultsdb.max_page_size = 199
+        resultsdb.page_size = AdaptivePageSize(initial=100, maximum=400, target_latency=100)
+        queried_data = resultsdb.get_resultsdb_data("runtest", 1000)
+        self.assertListEqual(queried_data, results)
+        self.assertLessEqual(len(resultsdb.queried_urls), 6)
+
+    def test_pdc_concurrent_pagination(self):
+        client = PagedPDCApi("", "", "bash-4.2.46-19.el7")
+        records = client.query_all_pages('/rpms/?', {}, 1000)
+        self.assertListEqual([record['id'] for record in records], list(range(450)))
+        self.assertListEqual(sorted(client.queried_pages), [(page, 100) for page in range(1, 6)])
+        client = PagedPDCApi("", "", "bash-4.2.46-19.el7")
+        self.assertListEqual([record['id'] for record in client.query_all_pages('/rpms/?', {}, 130)],
+                             list(range(130)))
+        self.assertListEqual(sorted(client.queried_pages), [(1, 100), (2, 100)])
+
+    def test_pdc_requests_share_bounded_executor(self):
+        class ConcurrencyPDCApi(PagedPDCApi):
+            def __init__(self, *args):
+                super().__init__(*args)
+                self.lock = threading.Lock()
+                self.running = 0
+                self.max_running = 0
+
+            def query_api(self, url, url_options=dict, attempt=0, ca_cert=''):
+                with self.lock:
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+                time.sleep(0.01)
+                with self.lock:
+                    self.running -= 1
+                if 'rpm-mapping' in url:
+                    return {}
+                queried_data = super().query_api(url, url_options)
+                for record in queried_data['results']:
+                    record.update(release={'release_id': 'rhel-7.1'}, linked_composes=['RHEL-7.1-1'])
+                return queried_data
+        client = ConcurrencyPDCApi("", "", "bash-4.2.46-19.el7", None, 3)
+        pdc_metadata = client.get_pdc_metadata_by_component_name(limit=1000)
+        self.assertEqual(len(pdc_metadata['rpms']), 450)
+        self.assertDictEqual(pdc_metadata['rpm-mapping'], {'rhel-7.1': {}})
+        self.assertLessEqual(client.max_running, 3)
+
+    def test_pagination_submits_pages_gradually(self):
+        submitted = []
+
+        def query_page(page, page_size):
+            submitted.append(page)
+            return list(range(page_size)), 1000, True
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pages = iter_pages(query_page, 10, 1000, max_workers=2, executor=executor)
+            self.assertListEqual(next(pages), list(range(10)))
+            self.assertListEqual(next(pages), list(range(10)))
+            self.assertLessEqual(len(submitted), 4)
+            pages.close()
+
+    def test_sequential_pagination_without_count(self):
+        pages = {0: ([1, 2], True), 1: ([3, 4], True), 2: ([5], False)}
+        self.assertListEqual(query_pages(lambda page, page_size: pages[page][:1] + (None,) + pages[page][1:],
+                                         2, 100), [1, 2, 3, 4, 5])
+
+    def test_pdc_mirror_backend(self):
+        with tempfile.TemporaryDirectory() as mirror_dir:
+            mirror_path = os.path.join(mirror_dir, 'pdc.sqlite')
+            exporting_client = FakePDCApi("")
+            exporting_client.changesets = [{'id': 1, 'committed_on': '2017-03-26T10:00:00', 'changes': []}]
+            mirror = PDCMirror(mirror_path)
+            PDCMirrorExporter(exporting_client, mirror).export()
+            # Newest change on server is synchronization watermark, not local time
+            self.assertEqual(mirror.get_state('last_sync'), '2017-03-26T10:00:00')
+            mirror.close()
+            client = FakePDCApi("bash-completion-2.1-6.el7", mirror_path=mirror_path)
+            pdc_metadata = client.get_pdc_metadata_by_component_name()
+            client.mirror.close()
+        self.assertListEqual(client.queried_urls, [])
+        self.assertListEqual(pdc_metadata['rpms'], client.pdc_data['rpms'])
+        self.assertListEqual(pdc_metadata['release-components'], client.pdc_data['release-components'])
+        self.assertDictEqual(pdc_metadata['rpm-mapping'],
+                             {release_id: {'release_id': release_id, 'component': 'bash-completion'}
+                              for release_id in ('rhel-7.0', 'rhel-7.1')})
+
+    def test_pdc_mirror_export_transaction(self):
+        with tempfile.TemporaryDirectory() as mirror_dir:
+            mirror_path = os.path.join(mirror_dir, 'pdc.sqlite')
+            # Mistyped mirror is not created by lookups
+            self.assertRaises(PDCMirrorException, FakePDCApi, "", mirror_path=mirror_path)
+            self.assertFalse(os.path.exists(mirror_path))
+            client = FakePDCApi("")
+            client.changesets = [{'id': 1, 'committed_on': '2017-03-26T10:00:00', 'changes': []}]
+            mirror = PDCMirror(mirror_path)
+            exporter = PDCMirrorExporter(client, mirror)
+            exporter.export()
+            deleted_rpm = client.pdc_data['rpms'].pop()
+            client.changesets[0]['committed_on'] = '2017-03-26T10:00:01'
+            with unittest.mock.patch.object(PDCMirrorExporter, 'export_rpm_mappings',
+                                            side_effect=PDCApiException("Unable to query")):
+                self.assertRaises(PDCApiException, exporter.export)
+            # Failed export leaves previous mirror and its last_sync
+            self.assertEqual(mirror.get_state('last_sync'), '2017-03-26T10:00:00')
+            self.assertIn(deleted_rpm, mirror.get_rpms(deleted_rpm['name'], deleted_rpm['version'],
+                                                       deleted_rpm['release']))
+            exporter.export()
+            # Records deleted in pdc are removed by full export
+            self.assertNotIn(deleted_rpm, mirror.get_rpms(deleted_rpm['name'], deleted_rpm['version'],
+                                                          deleted_rpm['release']))
+            self.assertEqual(mirror.get_state('last_sync'), '2017-03-26T10:00:01')
+            mirror.close()
+
+    def test_pdc_mirror_sync(self):
+        with tempfile.TemporaryDirectory() as mirror_dir:
+            client = FakePDCApi("")
+            mirror = PDCMirror(os.path.join(mirror_dir, 'pdc.sqlite'))
+            exporter = PDCMirrorExporter(client, mirror)
+            exporter.export(['bash-completion'])
+            last_sync = mirror.get_state('last_sync')
+            changed_rpm = client.pdc_data['rpms'][0]
+            changed_rpm['arch'] = 'changed'
+            deleted_rpm = client.pdc_data['rpms'].pop()
+            # Changesets are listed from the newest one, record was created and then deleted
+            client.changesets = [
+                {'id': 12, 'committed_on': '2017-03-26T10:00:02', 'changes': [
+                    {'resource': 'rpm', 'resource_id': deleted_rpm['id'], 'new_value': None}]},
+                {'id': 11, 'committed_on': '2017-03-26T10:00:01', 'changes': [
+                    {'resource': 'rpm', 'resource_id': changed_rpm['id'], 'new_value': '{}'},
+                    {'resource': 'rpm', 'resource_id': deleted_rpm['id'], 'new_value': '{}'},
+                    {'resource': 'release', 'resource_id': 1, 'new_value': '{}'}]}]
+            client.queried_urls = []
+            exporter.sync()
+            rpms = mirror.get_rpms(changed_rpm['name'], changed_rpm['version'], changed_rpm['release'])
+            self.assertEqual(last_sync, '')
+            self.assertEqual(mirror.get_state('last_sync'), '2017-03-26T10:00:02')
+            mirror.close()
+        self.assertIn(changed_rpm, rpms)
+        self.assertNotIn(deleted_rpm['id'], [rpm['id'] for rpm in rpms])
+        self.assertIn("https://pdc/rpms/{}/".format(changed_rpm['id']), client.queried_urls)
+        self.assertNotIn("https://pdc/rpms/?", client.queried_urls)
+
+    def test_rpm_mapping_scheduler(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            scheduler = RpmMappingScheduler(executor, lambda release_id: release_id.upper(),
+                                            PDCApi.get_release_id_from_compose)
+            scheduler.add_rpms([{"linked_composes": ["COMPONENT-9.0-xxx", "COMPONENT-9.2-xxx"]}])
+            self.assertDictEqual(scheduler.rpm_mappings, {})
+            scheduler.add_release_components([{"release": {"release_id": "component-9.0"}},
+                                              {"release": {"release_id": "component-9.1"}}])
+            self.assertSetEqual(set(scheduler.rpm_mappings), {'component-9.0'})
+            scheduler.add_rpms([{"linked_composes": ["COMPONENT-9.1-xxx", "COMPONENT-9.0-yyy"]}])
+            self.assertDictEqual(scheduler.get_rpm_mappings(),
+                                 {'component-9.0': 'COMPONENT-9.0', 'component-9.1': 'COMPONENT-9.1'})
+
+    def test_pdc_streamed_rpm_mappings(self):
+        client = FakePDCApi("bash-completion-2.1-6.el7")
+        pdc_metadata = client.get_pdc_metadata_by_component_name()
+        self.assertListEqual(pdc_metadata['rpms'], client.pdc_data['rpms'])
+        self.assertDictEqual(pdc_metadata['rpm-mapping'],
+                             {release_id: {'release_id': release_id, 'component': 'bash-completion'}
+                              for release_id in ('rhel-7.0', 'rhel-7.1')})
+
+    def test_nvr_parsing(self):
+        nvrs = parse_nvrs(["bash-completion-2.1-6.el7", "bash-completion-1:2.1-7.el7"])
+        self.assertListEqual(nvrs, [('bash-completion', '2.1', '6.el7'), ('bash-completion', '2.1', '7.el7')])
+        self.assertIs(nvrs[0].name, nvrs[1].name)
+        self.assertEqual(str(NVR('setup', '2.8.71', '5.el7_1')), 'setup-2.8.71-5.el7_1')
+        self.assertRaises(NVRException, parse_nvrs, ["setup-2.8.71"])
+
+    def test_nevra_parsing(self):
+        self.assertTupleEqual(parse_nevra("bash-completion-1:2.1-6.el7.noarch.rpm"),
+                              NEVRA('bash-completion', '1', '2.1', '6.el7', 'noarch'))
+        self.assertTupleEqual(parse_nevra("1:bash-2.1-6.el7.x86_64"), NEVRA('bash', '1', '2.1', '6.el7', 'x86_64'))
+        self.assertEqual(str(parse_nevra("bash-2.1-6.el7.x86_64")), "bash-2.1-6.el7.x86_64")
+        self.assertRaises(NVRException, parse_nevra, "bash-2.1")
+
+    def test_compose_id_parsing(self):
+        composes = parse_compose_ids(["RHEL-7.1-20150219.1", "Supp-7.1-RHEL-7-20150101.0"])
+        self.assertListEqual([compose.release_id for compose in composes], ['rhel-7.1', 'supp-7.1'])
+        self.assertEqual(composes[1].suffix, 'RHEL-7-20150101.0')
 
     def test_pdc_rpm_mappings(self):
         client = PDCApi("", "", "bash-completion-version-release")
@@ -171,8 +1086,10 @@ class MyTestCase(unittest.TestCase):
             "rpms": {"name": '^component$', "version": 'version', "release": 'release'},
             "global-component-contacts": {"component": '^component$'}
         }
-        client.setup_pdc_metadata_params("component", "version", "release")
-        self.assertDictEqual(client.pdc_name_mapping, output)
+        self.assertDictEqual(client.setup_pdc_metadata_params("component", "version", "release"), output)
+        second = client.setup_pdc_metadata_params("other", "1.0", "2.el7")
+        self.assertDictEqual(second['rpms'], {"name": '^other$', "version": '1.0', "release": '2.el7'})
+        self.assertEqual(client.pdc_name_mapping['rpms']['name'], '^{}$')
 
     def test_pdc_rpm_mappings_ansible(self):
         client = PDCApiAnsible("", "", "bash-completion-version-release")
@@ -269,6 +1186,191 @@ class MyTestCase(unittest.TestCase):
     # End of ResultsDB testing
 
     # Provision testing
+    def test_sparse_clone_repo(self):
+        files = {'osp/osp_config.json': '{}', 'metadata.yaml': 'a: 1', 'big/data.bin': 'data'}
+        work_dir = os.getcwd()
+        with tempfile.TemporaryDirectory() as repo_dir:
+            create_git_repository(os.path.join(repo_dir, 'source'), files)
+            provision = Provision('', '', '', '', '')
+            try:
+                os.makedirs(os.path.join(repo_dir, 'sparse'))
+                os.chdir(os.path.join(repo_dir, 'sparse'))
+                provision.clone_git_repository('file://{}/source'.format(repo_dir),
+                                               ['source/osp/osp_config.json', 'metadata.yaml'])
+                sparse_files = sorted(os.path.join(os.path.relpath(root, 'source'), name)
+                                      for root, _, names in os.walk('source') if '.git' not in root
+                                      for name in names)
+                os.makedirs(os.path.join(repo_dir, 'fallback'))
+                os.chdir(os.path.join(repo_dir, 'fallback'))
+                with unittest.mock.patch.object(Provision, 'sparse_clone_git_repository',
+                                                side_effect=GitCommandError('clone', 128)):
+                    provision.clone_git_repository(os.path.join(repo_dir, 'source'), ['metadata.yaml'])
+                self.assertTrue(os.path.isfile('source/big/data.bin'))
+                # Existing directory is never removed by fallback
+                os.makedirs(os.path.join(repo_dir, 'existing', 'source', 'keep'))
+                os.chdir(os.path.join(repo_dir, 'existing'))
+                with open('source/keep/precious', 'w') as precious:
+                    precious.write('data')
+                with self.assertRaises(ProvisionException):
+                    provision.clone_git_repository('file://{}/source'.format(repo_dir), ['metadata.yaml'])
+                self.assertTrue(os.path.isfile('source/keep/precious'))
+            finally:
+                os.chdir(work_dir)
+        self.assertListEqual(sparse_files, ['./metadata.yaml', 'osp/osp_config.json'])
+
+    def test_mirror_cache_checkout(self):
+        work_dir = os.getcwd()
+        with tempfile.TemporaryDirectory() as repo_dir:
+            source = create_git_repository(os.path.join(repo_dir, 'source'), {'osp.json': '{}'})
+            provision = Provision('', '', '', '', '', mirror_cache=os.path.join(repo_dir, 'cache'))
+            try:
+                os.makedirs(os.path.join(repo_dir, 'run'))
+                os.chdir(os.path.join(repo_dir, 'run'))
+                provision.clone_git_repository('file://{}/source'.format(repo_dir))
+                self.assertTrue(os.path.isfile('source/osp.json'))
+                with open(os.path.join(repo_dir, 'source', 'metadata.yaml'), 'w') as metadata:
+                    metadata.write('a: 1')
+                source.index.add(['metadata.yaml'])
+                source.index.commit("Metadata", author=Actor("test", "test@example.com"),
+                                    committer=Actor("test", "test@example.com"))
+                # Existing checkout of previous run is replaced by worktree of fetched mirror
+                provision.clone_git_repository('file://{}/source'.format(repo_dir))
+                self.assertTrue(os.path.isfile('source/metadata.yaml'))
+                os.makedirs('other')
+                with self.assertRaises(GitMirrorException):
+                    GitMirrorCache(os.path.join(repo_dir, 'cache')).checkout(
+                        'file://{}/source'.format(repo_dir), 'other')
+            finally:
+                os.chdir(work_dir)
+            self.assertEqual(len([name for name in os.listdir(os.path.join(repo_dir, 'cache'))
+                                  if name.endswith('.git')]), 1)
+
+    def test_mirror_cache_eviction(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            cache = GitMirrorCache(os.path.join(repo_dir, 'cache'))
+            for index, name in enumerate(['first', 'second', 'third']):
+                create_git_repository(os.path.join(repo_dir, name), {'file': name})
+                mirror_path = cache.update(os.path.join(repo_dir, name))
+                os.utime(mirror_path + cache.LOCK_SUFFIX, (index, index))
+            cache.max_mirrors = 1
+            # Least recently used mirror is kept while it is locked by other job
+            with cache.lock(cache.get_mirror_path(os.path.join(repo_dir, 'first'))):
+                cache.evict()
+            mirrors = sorted(name.split('-')[0] for name in os.listdir(cache.cache_dir)
+                             if name.endswith('.git'))
+        self.assertListEqual(mirrors, ['first', 'third'])
+
+    def test_mirror_cache_eviction_of_checked_out_mirror(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            cache = GitMirrorCache(os.path.join(repo_dir, 'cache'), max_mirrors=0)
+            create_git_repository(os.path.join(repo_dir, 'source'), {'file': 'source'})
+            mirror_path = cache.checkout(os.path.join(repo_dir, 'source'), os.path.join(repo_dir, 'run'))
+            # Worktree of running job keeps mirror
+            self.assertTrue(os.path.isdir(mirror_path))
+            shutil.rmtree(os.path.join(repo_dir, 'run'))
+            cache.evict()
+            self.assertFalse(os.path.exists(mirror_path))
+            # Lock file is kept, so jobs waiting for it keep locking the same file
+            self.assertTrue(os.path.isfile(mirror_path + cache.LOCK_SUFFIX))
+            cache.max_mirrors = 1
+            self.assertEqual(cache.update(os.path.join(repo_dir, 'source')), mirror_path)
+            self.assertTrue(os.path.isdir(mirror_path))
+
+    def test_mirror_cache_interrupted_clone(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            cache = GitMirrorCache(os.path.join(repo_dir, 'cache'))
+            source = os.path.join(repo_dir, 'source')
+            mirror_path = cache.get_mirror_path(source)
+            self.assertRaises(GitMirrorException, cache.update, source)
+            self.assertFalse(os.path.exists(mirror_path))
+            create_git_repository(source, {'file': 'source'})
+            # Partial mirror of interrupted clone is cloned again
+            os.makedirs(os.path.join(mirror_path, 'objects'))
+            os.makedirs(mirror_path + cache.CLONE_SUFFIX)
+            cache.update(source)
+            self.assertDictEqual(cache.read_files(source, ['file']), {'file': 'source'})
+            self.assertFalse(os.path.exists(mirror_path + cache.CLONE_SUFFIX))
+
+    def test_read_remote_files(self):
+        with tempfile.TemporaryDirectory() as repo_dir:
+            create_git_repository(os.path.join(repo_dir, 'source'), {'first': '1\n', 'second': '2'})
+            fetch_dir = os.path.join(repo_dir, 'fetch')
+            os.makedirs(fetch_dir)
+            with unittest.mock.patch('tempfile.TemporaryDirectory') as temporary_directory:
+                temporary_directory.return_value.__enter__.return_value = fetch_dir
+                contents = read_remote_files('file://{}/source'.format(repo_dir), ['first'])
+            self.assertDictEqual(contents, {'first': '1\n'})
+            # Single commit is fetched without blobs which are not read
+            fetched = Repo(fetch_dir)
+            self.assertTrue(os.path.isfile(os.path.join(fetch_dir, 'shallow')))
+            self.assertEqual(fetched.git.config('remote.origin.partialclonefilter'), 'blob:none')
+            self.assertRaises(GitMirrorException, read_remote_files,
+                              'file://{}/source'.format(repo_dir), ['missing'])
+
+    def test_read_git_objects(self):
+        with open('./tests/sources/osp_config.json') as osp_config:
+            files = {'osp/osp_config.json': osp_config.read(), 'metadata.yaml': 'name: old'}
+        work_dir = os.getcwd()
+        with tempfile.TemporaryDirectory() as repo_dir:
+            source = create_git_repository(os.path.join(repo_dir, 'source'), files)
+            source.git.tag('v1')
+            with open(os.path.join(repo_dir, 'source', 'metadata.yaml'), 'w') as metadata:
+                metadata.write('name: new')
+            source.index.add(['metadata.yaml'])
+            source.index.commit("Metadata", author=Actor("test", "test@example.com"),
+                                committer=Actor("test", "test@example.com"))
+            try:
+                os.chdir(repo_dir)
+                provision = Provision('file://{}/source'.format(repo_dir), 'source/metadata.yaml', {},
+                                      'source/osp/osp_config.json', '', git_ref='v1')
+                osp_data, metadata = provision.read_git_objects()
+                provision.git_ref = 'HEAD'
+                self.assertDictEqual(provision.read_git_objects()[1], {'name': 'new'})
+                provision.metadata_file = 'missing.yaml'
+                self.assertRaises(ProvisionException, provision.read_git_objects)
+                checkouts = os.listdir(repo_dir)
+            finally:
+                os.chdir(work_dir)
+        self.assertEqual(osp_data['sites'][0]['keypair'], 'team-jenkins')
+        self.assertDictEqual(metadata, {'name': 'old'})
+        self.assertListEqual(checkouts, ['source'])
+
+    def test_topology_matrix(self):
+        with open('./tests/sources/osp_config.json') as osp_config, \
+                open('./tests/sources/metadata.yaml') as metadata:
+            osp_data = json.load(osp_config)
+            metadata_content = metadata.read()
+        osp_data['sites'].append(dict(osp_data['sites'][0], site='other-osp', project='other-project',
+                                      networks=['other']))
+        files = {'osp_config.json': json.dumps(osp_data),
+                 'metadata.yaml': metadata_content}
+        with tempfile.TemporaryDirectory() as repo_dir:
+            create_git_repository(os.path.join(repo_dir, 'source'), files)
+            provision = Provision(os.path.join(repo_dir, 'source'), 'metadata.yaml',
+                                  {'count': ['project', 'info', 'something', 'source_count']},
+                                  'osp_config.json', 'unknown_credentials.yaml', git_ref='HEAD')
+            topologies, credentials = provision.get_provision_matrix_metadata(
+                ['fedora', 'rhel'], ['m1.small', 'm1.large'], ['ci-osp', 'other-osp'])
+            provision.write_yaml_documents(topologies, os.path.join(repo_dir, 'topology.yaml'))
+            with open(os.path.join(repo_dir, 'topology.yaml')) as topology_file:
+                written = list(yaml.safe_load_all(topology_file))
+            self.assertRaises(ProvisionException, provision.get_provision_matrix_metadata,
+                              sites=['missing'])
+        self.assertEqual(len(topologies), 8)
+        self.assertListEqual(written, topologies)
+        res_defs = [topology['resource_groups']['res_defs'] for topology in topologies]
+        self.assertListEqual([(topology['site'], res['image'], res['flavor'])
+                              for topology, res in zip(topologies, res_defs)][:3],
+                             [('ci-osp', 'fedora', 'm1.small'), ('ci-osp', 'fedora', 'm1.large'),
+                              ('ci-osp', 'rhel', 'm1.small')])
+        self.assertEqual(res_defs[-1]['networks'], ['other'])
+        self.assertTrue(all(res['count'] == '3' for res in res_defs))
+        self.assertListEqual(sorted(credentials), ['my_project_openstack.yaml',
+                                                   'other_project_openstack.yaml'])
+        self.assertEqual(topologies[-1]['resource_groups']['credentials']['auth_type'],
+                         'file:other_project_openstack.yaml')
+        self.assertEqual(Provision.res_defs['image'], '')
+
     def test_metadata_path_getter(self):
         provision = Provision('', '', '', '', '')
         path = provision.get_git_repo_name('https://github.com/Jurisak/metamorph.git')
@@ -355,6 +1457,36 @@ class MyTestCase(unittest.TestCase):
         }
         self.assertDictEqual(provision.res_defs, res_defs)
 
+    def test_compiled_metadata_locations(self):
+        provision = Provision('', '', '', '', '')
+        metadata = provision.read_yaml_file('./tests/sources/metadata.yaml')
+        metadata[0]['project']['info'].append({'other': {'keypair': 'other', 'nested': {}},
+                                               'empty': {}})
+        metadata_location = {'count': ['project', 'info', 'something', 'source_count'],
+                             'keypair': ['project', 'info', 'something', 'keypair'],
+                             'other': ['project', 'info', 'other', 'keypair'],
+                             'name': ['project', 'info', 'name'],
+                             'dictionary': ['project', 'info', 'other', 'nested'],
+                             'empty': ['project', 'info', 'empty', 'value'],
+                             'missing_key': ['project', 'missing', 'value'],
+                             'missing_tree': ['project', 'info', 'missing', 'value']}
+        # List items which are not dictionaries are errors only of keys not found before them
+        list_metadata = [{'c': [], 'd': {'e': 1}}, {}, [], {'f': 2}]
+        list_location = {'c': ['c'], 'd': ['d', 'e'], 'f': ['f'], 'g': ['g']}
+        for document, locations in ((metadata, metadata_location), (list_metadata, list_location)):
+            extracted = MetadataLocations(locations).extract(document)
+            self.assertListEqual([name for name, _, _ in extracted], list(locations))
+            for metadata_name, value, detail in extracted:
+                location = locations[metadata_name]
+                try:
+                    expected = provision.get_metadata_from_location(document, location, location[-1])
+                except (KeyError, AttributeError, ProvisionException) as expected_detail:
+                    self.assertEqual(str(detail), str(expected_detail))
+                else:
+                    self.assertIsNone(detail)
+                    self.assertEqual(value, expected)
+        self.assertListEqual([value for _, value, _ in extracted], [[], 1, None, None])
+
     def test_metadata_extraction_failure(self):
         provision = Provision('', '', '', '', '')
         metadata_location = {'count': ['project', 'info', 'something'],